@@ -5,7 +5,7 @@ from sqlalchemy import engine_from_config, pool
 
 from app.core.config import get_settings
 from app.core.database import Base
-from app.models import Entry, Insight, Tag, User  # noqa: F401
+from app.models import CacheEntry, Entry, Insight, PeriodRollup, Tag, TranscriptionJob, User  # noqa: F401
 
 config = context.config
 fileConfig(config.config_file_name)
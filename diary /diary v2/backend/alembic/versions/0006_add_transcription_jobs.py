@@ -0,0 +1,41 @@
+"""Add transcription_jobs table for asynchronous transcription
+
+Revision ID: 0006_add_transcription_jobs
+Revises: 0005_make_audio_fields_nullable
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0006_add_transcription_jobs"
+down_revision = "0005_make_audio_fields_nullable"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "transcription_jobs",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("file_ext", sa.String(length=16), nullable=False),
+        sa.Column("spool_path", sa.String(length=512), nullable=True),
+        sa.Column("text", sa.Text(), nullable=True),
+        sa.Column("language", sa.String(length=8), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_transcription_jobs_status"), "transcription_jobs", ["status"], unique=False)
+    op.create_index(op.f("ix_transcription_jobs_created_at"), "transcription_jobs", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_transcription_jobs_created_at"), table_name="transcription_jobs")
+    op.drop_index(op.f("ix_transcription_jobs_status"), table_name="transcription_jobs")
+    op.drop_table("transcription_jobs")
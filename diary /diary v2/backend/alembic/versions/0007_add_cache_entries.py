@@ -0,0 +1,33 @@
+"""Add cache_entries table for the persistent result cache
+
+Revision ID: 0007_add_cache_entries
+Revises: 0006_add_transcription_jobs
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_add_cache_entries"
+down_revision = "0006_add_transcription_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cache_entries",
+        sa.Column("namespace", sa.String(length=32), nullable=False),
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("value", sa.Text(), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_accessed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("namespace", "key"),
+    )
+    op.create_index(op.f("ix_cache_entries_last_accessed_at"), "cache_entries", ["last_accessed_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_cache_entries_last_accessed_at"), table_name="cache_entries")
+    op.drop_table("cache_entries")
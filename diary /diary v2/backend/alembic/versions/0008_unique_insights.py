@@ -0,0 +1,59 @@
+"""Enforce one insight per entry and per period
+
+Revision ID: 0008_unique_insights
+Revises: 0007_add_cache_entries
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_unique_insights"
+down_revision = "0007_add_cache_entries"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keep only the newest row of every duplicate group before adding the constraints.
+    op.execute(
+        """
+        DELETE FROM insights a
+        USING insights b
+        WHERE a.scope = 'entry' AND b.scope = 'entry'
+          AND a.user_id = b.user_id
+          AND a.source_entry_id = b.source_entry_id
+          AND (a.created_at, a.id::text) < (b.created_at, b.id::text)
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM insights a
+        USING insights b
+        WHERE a.scope = 'period' AND b.scope = 'period'
+          AND a.user_id = b.user_id
+          AND a.timeframe = b.timeframe
+          AND a.period_from = b.period_from
+          AND a.period_to = b.period_to
+          AND (a.created_at, a.id::text) < (b.created_at, b.id::text)
+        """
+    )
+    op.create_index(
+        "uq_insights_entry",
+        "insights",
+        ["user_id", "source_entry_id"],
+        unique=True,
+        postgresql_where=sa.text("scope = 'entry'"),
+    )
+    op.create_index(
+        "uq_insights_period",
+        "insights",
+        ["user_id", "timeframe", "period_from", "period_to"],
+        unique=True,
+        postgresql_where=sa.text("scope = 'period'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_insights_period", table_name="insights")
+    op.drop_index("uq_insights_entry", table_name="insights")
@@ -0,0 +1,24 @@
+"""Add expires_at to cache_entries for TTL-bound caches
+
+Revision ID: 0009_add_cache_expiry
+Revises: 0008_unique_insights
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_add_cache_expiry"
+down_revision = "0008_unique_insights"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("cache_entries", sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f("ix_cache_entries_expires_at"), "cache_entries", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_cache_entries_expires_at"), table_name="cache_entries")
+    op.drop_column("cache_entries", "expires_at")
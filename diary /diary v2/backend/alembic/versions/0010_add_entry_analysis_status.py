@@ -0,0 +1,34 @@
+"""Add analysis status columns to entries for the background analysis pipeline
+
+Revision ID: 0010_add_entry_analysis_status
+Revises: 0009_add_cache_expiry
+Create Date: 2026-10-17
+
+Existing entries are marked ``skipped`` so deploying the pipeline does not send
+the whole backlog of old entries to the LLM at once.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010_add_entry_analysis_status"
+down_revision = "0009_add_cache_expiry"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "entries",
+        sa.Column("analysis_status", sa.String(length=16), nullable=False, server_default="skipped"),
+    )
+    op.add_column("entries", sa.Column("analysis_attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("entries", sa.Column("analysis_error", sa.Text(), nullable=True))
+    op.create_index(op.f("ix_entries_analysis_status"), "entries", ["analysis_status"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_entries_analysis_status"), table_name="entries")
+    op.drop_column("entries", "analysis_error")
+    op.drop_column("entries", "analysis_attempts")
+    op.drop_column("entries", "analysis_status")
@@ -0,0 +1,43 @@
+"""Add period_rollups table for hierarchical period insights
+
+Revision ID: 0011_add_period_rollups
+Revises: 0010_add_entry_analysis_status
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0011_add_period_rollups"
+down_revision = "0010_add_entry_analysis_status"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "period_rollups",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("unit", sa.String(length=8), nullable=False),
+        sa.Column("period_from", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("period_to", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("input_digest", sa.String(length=64), nullable=False),
+        sa.Column("entry_count", sa.Integer(), nullable=False),
+        sa.Column("stats", sa.JSON(), nullable=False),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("key_insights", sa.JSON(), nullable=False),
+        sa.Column("emotional_trend", sa.String(length=16), nullable=True),
+        sa.Column("language", sa.String(length=8), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "unit", "period_from", "period_to", name="uq_period_rollups_period"),
+    )
+    op.create_index(op.f("ix_period_rollups_user_id"), "period_rollups", ["user_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_period_rollups_user_id"), table_name="period_rollups")
+    op.drop_table("period_rollups")
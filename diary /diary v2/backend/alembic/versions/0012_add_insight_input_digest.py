@@ -0,0 +1,22 @@
+"""Add input_digest to insights for staleness checks
+
+Revision ID: 0012_add_insight_input_digest
+Revises: 0011_add_period_rollups
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012_add_insight_input_digest"
+down_revision = "0011_add_period_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("insights", sa.Column("input_digest", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("insights", "input_digest")
@@ -0,0 +1,24 @@
+"""Add lease columns to transcription_jobs
+
+Revision ID: 0013_add_transcription_job_leases
+Revises: 0012_add_insight_input_digest
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013_add_transcription_job_leases"
+down_revision = "0012_add_insight_input_digest"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("transcription_jobs", sa.Column("lease_owner", sa.String(length=64), nullable=True))
+    op.add_column("transcription_jobs", sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("transcription_jobs", "lease_expires_at")
+    op.drop_column("transcription_jobs", "lease_owner")
@@ -14,6 +14,7 @@ from ..core.database import get_db
 from ..core.security import get_current_user
 from ..models import Entry, Tag
 from ..schemas.entry import EntryCreateRequest, EntryCreateResponse, EntryDetailResponse, EntryListResponse
+from ..services.analysis import get_analysis_queue, store_supplied_analysis
 from ..services.tags import calendar_view, tag_cloud
 
 settings = get_settings()
@@ -30,6 +31,7 @@ def serialize_entry(entry: Entry, *, include_transcript: bool = False) -> dict:
         "mood_label": entry.mood_label,
         "tags": tags,
         "created_at": entry.created_at,
+        "analysis_status": entry.analysis_status,
     }
     if include_transcript:
         payload.update({
@@ -48,9 +50,11 @@ def create_entry(
     current_user=Depends(get_current_user),
 ):
     """Create a new entry from already-transcribed text.
-    
-    This endpoint accepts only the transcript. No audio processing or analysis is performed.
-    Analysis will be handled by a separate endpoint/function with special LLM instructions.
+
+    No LLM call happens on this path. Title, mood, insights and tags are filled in
+    by the background analysis workers (``analysis_status`` tracks progress), or
+    straight from ``payload.analysis`` when the client already has one from fused
+    ``/transcribe``.
     """
     try:
         transcript = payload.transcript.strip()
@@ -66,23 +70,30 @@ def create_entry(
         word_count = len(transcript.split())
         
         # Create entry with minimal required fields
-        # Title, mood_label, insights, and tags will be set later via analysis endpoint
+        # Title, mood_label, insights, and tags are set by the analysis pipeline
         entry = Entry(
             user_id=current_user.id,
             audio_key=None,  # No audio stored
             audio_url=None,  # No audio stored
             transcript=transcript,
-            title="",  # Will be set by analysis endpoint
+            title="",  # Will be set by analysis
             mood_label="neutral",  # Default, will be updated by analysis
-            insights=[],  # Will be populated by analysis endpoint
+            insights=[],  # Will be populated by analysis
             word_count=word_count,
-            tags=[],  # Will be populated by analysis endpoint
+            tags=[],  # Will be populated by analysis
+            analysis_status="pending" if settings.entry_analysis_enabled else "skipped",
         )
         
         db.add(entry)
         db.commit()
         db.refresh(entry)
 
+        if payload.analysis is not None:
+            store_supplied_analysis(db, entry, payload.analysis.model_dump())
+            db.refresh(entry)
+        elif settings.entry_analysis_enabled:
+            get_analysis_queue().enqueue(entry.id)
+
         return serialize_entry(entry, include_transcript=True)
     except HTTPException:
         db.rollback()
@@ -1,18 +1,37 @@
 """Insights API router."""
 
+import logging
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Literal, Optional
+from typing import AsyncIterator, Callable, Literal, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from ..core.config import get_settings
 from ..core.database import get_db
+from ..core.metrics import metrics
 from ..core.security import get_current_user
 from ..models import Entry, Insight, User
 from ..schemas.insight import InsightListItem, InsightRead
-from ..services.insights import generate_entry_insight, generate_period_insight
+from ..services.insights import (
+    entry_input_digest,
+    generate_entry_insight,
+    generate_period_insight,
+    period_input_digest,
+    schedule_entry_refresh,
+    schedule_period_refresh,
+    stream_entry_insight,
+    stream_period_insight,
+)
+from ..services.streaming import SSE_HEADERS, SSE_MEDIA_TYPE, sse_event
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(prefix="/insights", tags=["insights"])
 
@@ -49,28 +68,152 @@ def _normalize_period(
     return period_from, period_to
 
 
+def _load_entry_and_insight(db: Session, entry_id: UUID, user_id: int) -> tuple[Optional[Entry], Optional[Insight]]:
+    """Return the user's entry (``None`` if missing or foreign) and its cached insight."""
+    entry = db.get(Entry, entry_id)
+    if not entry or entry.user_id != user_id:
+        return None, None
+
+    existing = db.execute(
+        select(Insight).where(Insight.scope == "entry", Insight.source_entry_id == entry_id, Insight.user_id == user_id)
+    ).scalar_one_or_none()
+    return entry, existing
+
+
+def _find_period_insight(
+    db: Session, user_id: int, timeframe: str, period_from: datetime, period_to: datetime
+) -> Optional[Insight]:
+    return db.execute(
+        select(Insight).where(
+            Insight.scope == "period",
+            Insight.user_id == user_id,
+            Insight.timeframe == timeframe,
+            Insight.period_from == period_from,
+            Insight.period_to == period_to,
+        )
+    ).scalar_one_or_none()
+
+
+def _load_period_insight(
+    db: Session, user_id: int, timeframe: str, period_from: datetime, period_to: datetime
+) -> tuple[Optional[Insight], Optional[str]]:
+    """Return the stored period insight and, if there is one, the period's current input digest."""
+    existing = _find_period_insight(db, user_id, timeframe, period_from, period_to)
+    if existing is None:
+        return None, None
+    return existing, period_input_digest(db, user_id, period_from, period_to)
+
+
+def _serve_cached(existing: Insight, current_digest: str, refresh: Callable[[], None]) -> Optional[InsightRead]:
+    """Return the stored insight if it can be served, scheduling *refresh* when it is stale.
+
+    ``None`` means the caller has to regenerate before answering.
+    """
+    if existing.input_digest == current_digest:
+        metrics.increment("insights.cache.fresh")
+        return InsightRead.model_validate(existing)
+    if not settings.insight_stale_while_revalidate:
+        metrics.increment("insights.cache.regenerated")
+        return None
+    metrics.increment("insights.cache.stale")
+    refresh()
+    return InsightRead.model_validate(existing).model_copy(update={"stale": True})
+
+
 @router.get("/entry/{entry_id}", response_model=InsightRead)
 async def get_entry_insight(
     entry_id: UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get or generate insight for a specific entry."""
-    entry = db.get(Entry, entry_id)
-    if not entry or entry.user_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entry not found")
+    """Get or generate insight for a specific entry.
 
-    existing = db.execute(
-        select(Insight).where(Insight.scope == "entry", Insight.source_entry_id == entry_id, Insight.user_id == current_user.id)
-    ).scalar_one_or_none()
+    A stored insight is returned while the entry is unchanged; once its analysis
+    has moved on, the stale insight is returned (``stale=true``) and refreshed in
+    the background, or regenerated inline if stale-while-revalidate is disabled.
+    """
+    entry, existing = await run_in_threadpool(_load_entry_and_insight, db, entry_id, current_user.id)
+    if not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entry not found")
 
     if existing:
-        return existing
+        cached = _serve_cached(
+            existing, entry_input_digest(entry), lambda: schedule_entry_refresh(entry.id, current_user.id)
+        )
+        if cached is not None:
+            return cached
 
-    insight = await generate_entry_insight(entry, db)
+    insight = await generate_entry_insight(entry)
     return insight
 
 
+async def _stored_insight_events(insight: Insight) -> AsyncIterator[dict]:
+    yield {"type": "insight", "insight": insight}
+
+
+async def _insight_sse(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """Encode insight stream events as SSE; a failure ends the stream with an ``error`` event."""
+    started = time.perf_counter()
+    first = True
+    try:
+        async for event in events:
+            if first:
+                metrics.observe("insights.stream.first_event_seconds", time.perf_counter() - started)
+                first = False
+            if event["type"] == "insight":
+                yield sse_event("insight", InsightRead.model_validate(event["insight"]).model_dump(mode="json"))
+            else:
+                yield sse_event("delta", {"text": event["text"]})
+    except Exception as exc:
+        logger.exception("Insight stream failed")
+        yield sse_event("error", {"detail": str(exc)})
+
+
+@router.get("/entry/{entry_id}/stream")
+async def stream_entry_insight_events(
+    entry_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Stream the entry insight as Server-Sent Events.
+
+    Sends a ``delta`` event (``{"text": chunk}``) for each chunk of the LLM reply,
+    then an ``insight`` event with the stored insight. A fresh stored insight is
+    sent as a single ``insight`` event; failures end the stream with ``error``.
+    """
+    entry, existing = await run_in_threadpool(_load_entry_and_insight, db, entry_id, current_user.id)
+    if not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entry not found")
+
+    if existing and existing.input_digest == entry_input_digest(entry):
+        events = _stored_insight_events(existing)
+    else:
+        events = stream_entry_insight(entry.id, current_user.id)
+    return StreamingResponse(_insight_sse(events), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+
+@router.get("/period/stream")
+async def stream_period_insight_events(
+    timeframe: Literal["week", "month", "year", "custom"] = Query(...),
+    anchor_date: Optional[datetime] = Query(None),
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Stream the period insight as Server-Sent Events (same events as the entry stream)."""
+    period_from, period_to = _normalize_period(timeframe, anchor_date, from_date, to_date)
+
+    existing, current_digest = await run_in_threadpool(
+        _load_period_insight, db, current_user.id, timeframe, period_from, period_to
+    )
+    if existing and existing.input_digest == current_digest:
+        events = _stored_insight_events(existing)
+    else:
+        events = stream_period_insight(current_user.id, period_from, period_to, timeframe)
+    return StreamingResponse(_insight_sse(events), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+
 @router.get("/period", response_model=InsightRead)
 async def get_period_insight(
     timeframe: Literal["week", "month", "year", "custom"] = Query(...),
@@ -80,23 +223,27 @@ async def get_period_insight(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get or generate insight for a time period."""
+    """Get or generate insight for a time period.
+
+    The stored insight is served while the period's entries match its digest
+    (ids, count, newest entry); otherwise it is refreshed as for entry insights.
+    """
     period_from, period_to = _normalize_period(timeframe, anchor_date, from_date, to_date)
 
-    existing = db.execute(
-        select(Insight).where(
-            Insight.scope == "period",
-            Insight.user_id == current_user.id,
-            Insight.timeframe == timeframe,
-            Insight.period_from == period_from,
-            Insight.period_to == period_to,
-        )
-    ).scalar_one_or_none()
+    existing, current_digest = await run_in_threadpool(
+        _load_period_insight, db, current_user.id, timeframe, period_from, period_to
+    )
 
     if existing:
-        return existing
+        cached = _serve_cached(
+            existing,
+            current_digest,
+            lambda: schedule_period_refresh(current_user.id, period_from, period_to, timeframe),
+        )
+        if cached is not None:
+            return cached
 
-    insight = await generate_period_insight(current_user.id, period_from, period_to, timeframe, db)
+    insight = await generate_period_insight(current_user.id, period_from, period_to, timeframe)
     return insight
 
 
@@ -109,29 +256,19 @@ async def regenerate_period_insight(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Force regeneration of period insight."""
-    period_from, period_to = _normalize_period(timeframe, anchor_date, from_date, to_date)
-
-    existing = db.execute(
-        select(Insight).where(
-            Insight.scope == "period",
-            Insight.user_id == current_user.id,
-            Insight.timeframe == timeframe,
-            Insight.period_from == period_from,
-            Insight.period_to == period_to,
-        )
-    ).scalar_one_or_none()
+    """Force regeneration of period insight.
 
-    if existing:
-        db.delete(existing)
-        db.commit()
+    The new insight overwrites the stored row; sub-period rollups whose entries
+    are unchanged are reused.
+    """
+    period_from, period_to = _normalize_period(timeframe, anchor_date, from_date, to_date)
 
-    insight = await generate_period_insight(current_user.id, period_from, period_to, timeframe, db)
+    insight = await generate_period_insight(current_user.id, period_from, period_to, timeframe)
     return insight
 
 
 @router.get("", response_model=list[InsightListItem])
-async def list_insights(
+def list_insights(
     scope: Optional[Literal["entry", "period"]] = Query(None),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
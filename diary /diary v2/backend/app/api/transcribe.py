@@ -2,20 +2,32 @@
 
 from __future__ import annotations
 
+import json
 import logging
-import os
-import shutil
+import time
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Iterator
+from uuid import UUID
 
-import ffmpeg
-from fastapi import APIRouter, File, HTTPException, UploadFile, status
-from openai import OpenAIError
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 
 from ..core.config import get_settings
-from ..schemas.transcribe import TranscribeResponse
-from ..services.llm import format_transcript
-from ..services.providers import build_stt_provider
+from ..core.metrics import metrics
+from ..schemas.transcribe import TranscribeResponse, TranscriptionJobRead
+from ..services.jobs import QueueFullError, get_job_queue
+from ..services.live import LiveTranscriptionSession
+from ..services.llm import stream_format_transcript
+from ..services.streaming import SSE_HEADERS, SSE_MEDIA_TYPE, sse_event
+from ..services.transcription import (
+    AudioConversionError,
+    EmptyAudioError,
+    ProviderThrottledError,
+    TranscoderBusyError,
+    TranscriptionError,
+    TranscriptionResult,
+    transcribe_upload,
+)
 
 logger = logging.getLogger(__name__)
 __all__ = ["router"]
@@ -26,155 +38,210 @@ settings = get_settings()
 # Maximum file size: 50MB (reasonable for audio files)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB in bytes
 
+# Upper bound for a single long-poll request on a job
+MAX_JOB_WAIT_SECONDS = 30
 
-@router.post("/transcribe", response_model=TranscribeResponse)
-def transcribe_audio(
-    file: UploadFile = File(...),
-):
-    """Transcribe audio with optimal quality for Whisper.
-    
-    Accepts: WebM, M4A, MP3, WAV
-    Converts to: 16kHz mono WAV for optimal Whisper quality
-    Returns: JSON with formatted transcript and language
-    
-    Note: This endpoint only performs transcription and formatting. 
-    Audio is temporary input only - not stored or persisted.
-    Analysis is handled separately.
-    """
+
+def _validate_upload(file: UploadFile) -> str:
+    """Validate filename, extension and size; return the lower-cased extension."""
     # Validate file extension
     if not file.filename:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing filename")
-    
+
     file_ext = Path(file.filename).suffix.lower()
     allowed_extensions = {".webm", ".m4a", ".mp3", ".wav", ".mp4", ".mpeg", ".mpga"}
-    
+
     if file_ext not in allowed_extensions:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid audio format. Allowed: {', '.join(allowed_extensions)}",
         )
-    
+
     # Validate file size
     if file.size and file.size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File too large. Maximum size is {MAX_FILE_SIZE / (1024 * 1024):.0f}MB",
         )
+    return file_ext
 
-    input_path: str | None = None
-    output_path: str | None = None
-    
+
+def _transcribe_or_raise(upload: BinaryIO, file_ext: str, *, formatted: bool = True) -> TranscriptionResult:
+    """Run the pipeline, mapping its errors to HTTP responses."""
     try:
-        # Save uploaded file to temporary location
-        suffix = file_ext or ".webm"
-        tmp_file = NamedTemporaryFile(delete=False, suffix=suffix)
-        input_path = tmp_file.name
-        
-        logger.info(f"Received audio file: {file.filename}, size: {file.size}, saving to {input_path}")
-        
-        with tmp_file:
-            shutil.copyfileobj(file.file, tmp_file)
-        
-        # Verify file exists and has content
-        if not os.path.exists(input_path) or os.path.getsize(input_path) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Uploaded file is empty or invalid",
-            )
-        
-        # Convert to 16kHz mono WAV for optimal Whisper quality
-        output_path = input_path.rsplit(".", 1)[0] + ".wav"
-        
-        logger.info(f"Converting {input_path} to {output_path} (16kHz mono WAV)")
-        
-        try:
-            (
-                ffmpeg
-                .input(input_path)
-                .output(
-                    output_path,
-                    acodec="pcm_s16le",  # 16-bit PCM
-                    ac=1,  # Mono channel
-                    ar=16000,  # 16kHz sample rate
-                    format="wav",
-                )
-                .overwrite_output()
-                .run(quiet=True, capture_stderr=True)
-            )
-        except ffmpeg.Error as e:
-            error_msg = e.stderr.decode() if e.stderr else str(e)
-            logger.error(f"FFmpeg conversion failed: {error_msg}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Audio conversion failed: {error_msg}",
-            ) from e
-        
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Audio conversion produced empty file",
-            )
-        
-        # Transcribe using Whisper
-        logger.info(f"Transcribing {output_path} with Whisper")
-        
-        try:
-            stt_provider = build_stt_provider()
-            raw_transcript = stt_provider.transcribe(output_path)
-            logger.info(f"Raw transcription successful: {len(raw_transcript)} characters")
-            
-            # DEBUG: Log raw transcript to verify both languages are present
-            logger.info(f"RAW_TRANSCRIPT: {raw_transcript}")
-            
-            # Validate transcript is not empty
-            if not raw_transcript or not raw_transcript.strip():
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Transcription produced empty result. Please check your audio file.",
-                )
-            
-            # Post-process transcript with LLM formatting
-            logger.info("Formatting transcript with LLM post-processing")
-            formatted_transcript = format_transcript(raw_transcript, language=None)
-            logger.info(f"Transcript formatting complete: {len(formatted_transcript)} characters")
-            
-            # DEBUG: Log formatted transcript to verify both languages are preserved
-            logger.info(f"FORMATTED_TRANSCRIPT: {formatted_transcript}")
-            
-            # Validate formatted transcript is not empty
-            if not formatted_transcript or not formatted_transcript.strip():
-                logger.warning("Formatted transcript is empty, using raw transcript")
-                formatted_transcript = raw_transcript.strip()
-            
-            return TranscribeResponse(
-                text=formatted_transcript,
-                transcript=formatted_transcript,  # Alias for backward compatibility
-                language="auto",  # Whisper detects language automatically
-            )
-        except Exception as e:
-            logger.exception("Whisper transcription failed")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Transcription failed: {str(e)}",
-            ) from e
-    
-    except HTTPException:
-        # Re-raise HTTP exceptions
-        raise
+        return transcribe_upload(upload, file_ext, formatted=formatted)
+    except EmptyAudioError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    except TranscoderBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Audio transcoder is busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+    except ProviderThrottledError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Transcription provider is busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+    except AudioConversionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Audio conversion failed: {e}",
+        ) from e
+    except TranscriptionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Transcription failed: {e}",
+        ) from e
     except Exception as e:
         logger.exception("Unexpected error in transcribe endpoint")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing audio: {str(e)}",
         ) from e
-    
-    finally:
-        # Cleanup temporary files
-        for path in [input_path, output_path]:
-            if path and os.path.exists(path):
+
+
+@router.post("/transcribe", response_model=TranscribeResponse)
+def transcribe_audio(
+    file: UploadFile = File(...),
+):
+    """Transcribe audio with optimal quality for Whisper.
+
+    Accepts: WebM, M4A, MP3, WAV
+    Converts to: 16kHz mono WAV for optimal Whisper quality
+    Returns: JSON with formatted transcript and language
+
+    Note: This endpoint only performs transcription and formatting.
+    Audio is temporary input only - not stored or persisted.
+    Analysis is handled separately, unless LLM_FUSED_MODE is enabled, in which case
+    the same LLM call also returns ``analysis`` (title, mood, tags, insights, insight).
+    """
+    file_ext = _validate_upload(file)
+    logger.info(f"Received audio file: {file.filename}, size: {file.size}")
+    result = _transcribe_or_raise(file.file, file_ext)
+
+    return TranscribeResponse(
+        text=result.text,
+        transcript=result.text,  # Alias for backward compatibility
+        language=result.language,
+        trimmed_ratio=result.trimmed_ratio,
+        analysis=result.analysis,
+    )
+
+
+@router.post("/transcribe/sse")
+def transcribe_audio_sse(file: UploadFile = File(...)):
+    """Transcribe audio and stream the formatted transcript as Server-Sent Events.
+
+    Speech-to-text runs before the stream opens, so upload and STT errors still
+    map to HTTP status codes. Events:
+
+    - ``transcript``: ``{"text": raw, "language", "trimmed_ratio"}`` once STT finishes
+    - ``delta``: ``{"text": chunk}`` for each chunk of the formatted transcript
+    - ``done``: ``{"text": formatted}`` with the complete formatted transcript
+    - ``error``: ``{"detail", "text": raw}`` if formatting breaks mid-stream
+
+    Fused analysis is not available on this endpoint.
+    """
+    file_ext = _validate_upload(file)
+    logger.info(f"Received audio file for streaming: {file.filename}, size: {file.size}")
+    result = _transcribe_or_raise(file.file, file_ext, formatted=False)
+    return StreamingResponse(_format_events(result), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+
+def _format_events(result: TranscriptionResult) -> Iterator[str]:
+    yield sse_event(
+        "transcript", {"text": result.text, "language": result.language, "trimmed_ratio": result.trimmed_ratio}
+    )
+    started = time.perf_counter()
+    parts: list[str] = []
+    try:
+        for delta in stream_format_transcript(result.text):
+            if not parts:
+                metrics.observe("transcribe.sse.first_delta_seconds", time.perf_counter() - started)
+            parts.append(delta)
+            yield sse_event("delta", {"text": delta})
+    except Exception as exc:
+        logger.exception("Streaming transcript formatting failed")
+        yield sse_event("error", {"detail": str(exc), "text": result.text})
+        return
+    yield sse_event("done", {"text": "".join(parts).strip() or result.text})
+
+
+@router.post("/transcribe/jobs", response_model=TranscriptionJobRead, status_code=status.HTTP_202_ACCEPTED)
+def create_transcription_job(
+    file: UploadFile = File(...),
+):
+    """Queue audio for background transcription and return the job immediately.
+
+    Poll ``GET /transcribe/jobs/{id}`` (optionally with ``wait``) for the result.
+    Returns 503 with ``Retry-After`` when the job queue is full.
+    """
+    file_ext = _validate_upload(file)
+
+    try:
+        job = get_job_queue().enqueue(file.file, file_ext)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Transcription queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+
+    logger.info(f"Queued transcription job {job.id} for {file.filename}")
+    return job
+
+
+@router.get("/transcribe/jobs/{job_id}", response_model=TranscriptionJobRead)
+async def get_transcription_job(
+    job_id: UUID,
+    wait: float = Query(
+        0,
+        ge=0,
+        le=MAX_JOB_WAIT_SECONDS,
+        description="Seconds to long-poll for the job to finish before returning its current state",
+    ),
+):
+    """Return the state of a transcription job, optionally long-polling for completion."""
+    job = await get_job_queue().wait(job_id, timeout=wait)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transcription job not found")
+    return job
+
+
+@router.websocket("/transcribe/stream")
+async def stream_transcription(websocket: WebSocket):
+    """Transcribe audio live while the user is still recording.
+
+    Protocol:
+    - client sends binary frames of raw 16kHz mono pcm_s16le audio
+    - client sends the text frame ``{"type": "stop"}`` when recording ends
+    - server pushes ``partial``/``formatted`` messages per segment as they finish,
+      then a single ``final`` message with the full formatted text, and closes
+    """
+    await websocket.accept()
+    session = LiveTranscriptionSession(send=websocket.send_json)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await session.cancel()
+                return
+            if message.get("bytes"):
+                await session.feed(message["bytes"])
+            elif message.get("text"):
                 try:
-                    os.remove(path)
-                    logger.debug(f"Cleaned up temp file: {path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove temp file {path}: {e}")
+                    command = json.loads(message["text"])
+                except json.JSONDecodeError:
+                    command = {}
+                if isinstance(command, dict) and command.get("type") == "stop":
+                    break
+                await websocket.send_json({"type": "error", "detail": "Unsupported message"})
 
+        await websocket.send_json(await session.finish())
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Live transcription client disconnected")
+        await session.cancel()
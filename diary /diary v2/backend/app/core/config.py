@@ -2,9 +2,9 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 BASE_DIR = Path(__file__).resolve().parents[3]
@@ -13,6 +13,13 @@ def _parse_allowed_origins(value: str) -> List[str]:
     return [origin.strip() for origin in value.split(",") if origin.strip()]
 
 
+class RouteOverride(BaseModel):
+    """Pinned model and/or output budget for one LLM task (see ``LLM_ROUTE_OVERRIDES``)."""
+
+    model: Optional[str] = None
+    max_tokens: Optional[int] = Field(default=None, ge=1)
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=BASE_DIR / ".env", env_file_encoding="utf-8")
 
@@ -23,9 +30,66 @@ class Settings(BaseSettings):
         description="Comma-separated list of origins",
     )
     openai_api_key: Optional[str] = Field(default=None, alias="OPENAI_API_KEY")
+    openai_pool_size: int = Field(default=20, ge=1, alias="OPENAI_POOL_SIZE")
+    openai_timeout_seconds: float = Field(default=60.0, gt=0, alias="OPENAI_TIMEOUT_SECONDS")
+    openai_connect_timeout_seconds: float = Field(default=5.0, gt=0, alias="OPENAI_CONNECT_TIMEOUT_SECONDS")
+    openai_keepalive_expiry_seconds: float = Field(default=30.0, ge=0, alias="OPENAI_KEEPALIVE_EXPIRY_SECONDS")
+    openai_max_retries: int = Field(
+        default=0,
+        ge=0,
+        alias="OPENAI_MAX_RETRIES",
+        description="SDK-level retries; the outbound governor retries with backoff on top of these",
+    )
+    outbound_initial_concurrency: int = Field(default=8, ge=1, alias="OUTBOUND_INITIAL_CONCURRENCY")
+    outbound_min_concurrency: int = Field(default=1, ge=1, alias="OUTBOUND_MIN_CONCURRENCY")
+    outbound_max_concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        alias="OUTBOUND_MAX_CONCURRENCY",
+        description="Upper bound for the adaptive provider limit; defaults to OPENAI_POOL_SIZE",
+    )
+    outbound_latency_target_seconds: float = Field(default=30.0, gt=0, alias="OUTBOUND_LATENCY_TARGET_SECONDS")
+    outbound_max_retries: int = Field(default=3, ge=0, alias="OUTBOUND_MAX_RETRIES")
+    outbound_backoff_base_seconds: float = Field(default=0.5, gt=0, alias="OUTBOUND_BACKOFF_BASE_SECONDS")
+    outbound_backoff_max_seconds: float = Field(default=20.0, gt=0, alias="OUTBOUND_BACKOFF_MAX_SECONDS")
+    outbound_hedge_enabled: bool = Field(
+        default=False,
+        alias="OUTBOUND_HEDGE_ENABLED",
+        description="Send a second copy of slow chat completions and keep whichever answers first",
+    )
+    outbound_hedge_min_delay_seconds: float = Field(default=2.0, gt=0, alias="OUTBOUND_HEDGE_MIN_DELAY_SECONDS")
+    openai_cassette_mode: Literal["off", "record", "replay"] = Field(
+        default="off",
+        alias="OPENAI_CASSETTE_MODE",
+        description="Record OpenAI traffic to a cassette, or replay it offline with the recorded latency",
+    )
+    openai_cassette_path: str = Field(default="cassettes/openai.jsonl", alias="OPENAI_CASSETTE_PATH")
+    openai_cassette_latency_scale: float = Field(
+        default=1.0,
+        ge=0,
+        alias="OPENAI_CASSETTE_LATENCY_SCALE",
+        description="Multiplier for replayed latency; 0 replays instantly",
+    )
+    openai_cassette_seed: Optional[int] = Field(default=None, alias="OPENAI_CASSETTE_SEED")
     stt_api_key: Optional[str] = Field(default=None, alias="STT_API_KEY")
     openai_llm_model: str = Field(default="gpt-4o-mini", alias="OPENAI_LLM_MODEL")
     openai_stt_model: str = Field(default="gpt-4o-mini-transcribe", alias="OPENAI_STT_MODEL")
+    llm_small_model: Optional[str] = Field(
+        default=None,
+        alias="LLM_SMALL_MODEL",
+        description="Fast model for formatting, analysis and entry insights; defaults to OPENAI_LLM_MODEL",
+    )
+    llm_large_model: Optional[str] = Field(
+        default=None,
+        alias="LLM_LARGE_MODEL",
+        description="Model for period insights and long inputs; defaults to OPENAI_LLM_MODEL",
+    )
+    llm_route_long_input_chars: int = Field(default=12000, ge=1, alias="LLM_ROUTE_LONG_INPUT_CHARS")
+    llm_route_overrides: Dict[str, RouteOverride] = Field(
+        default_factory=dict,
+        alias="LLM_ROUTE_OVERRIDES",
+        description='JSON per task, e.g. {"period_insight": {"model": "gpt-4o", "max_tokens": 2000}}',
+    )
     secret_key: str = Field(alias="SECRET_KEY")
     access_token_expire_minutes: int = Field(default=60, alias="ACCESS_TOKEN_EXPIRE_MINUTES")
     use_mock_ai: bool = Field(default=True, alias="USE_MOCK_AI")
@@ -36,12 +100,109 @@ class Settings(BaseSettings):
     media_base_url: str = Field(default="/media", alias="MEDIA_BASE_URL")
     storage_bucket: Optional[str] = Field(default=None, alias="STORAGE_BUCKET")
     transcript_formatting_enabled: bool = Field(default=True, alias="TRANSCRIPT_FORMATTING_ENABLED")
+    llm_fused_mode: bool = Field(
+        default=False,
+        alias="LLM_FUSED_MODE",
+        description="Format, analyze and draft the entry insight in one LLM call during /transcribe",
+    )
+    audio_conversion_mode: Literal["file", "pipe"] = Field(
+        default="pipe",
+        alias="AUDIO_CONVERSION_MODE",
+        description="'pipe' streams uploads through ffmpeg stdin/stdout; 'file' uses temp files",
+    )
+    audio_fast_path_enabled: bool = Field(
+        default=True,
+        alias="AUDIO_FAST_PATH_ENABLED",
+        description=(
+            "Decode and upload PCM WAV without ffmpeg; compressed uploads are sent to the STT provider as-is "
+            "only when VAD_ENABLED and STT_CHUNKING_ENABLED are both off"
+        ),
+    )
+    transcoder_max_concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        alias="TRANSCODER_MAX_CONCURRENCY",
+        description="Concurrent ffmpeg processes; defaults to the number of CPU cores",
+    )
+    transcoder_queue_size: int = Field(default=16, ge=0, alias="TRANSCODER_QUEUE_SIZE")
+    transcoder_queue_timeout_seconds: float = Field(default=30.0, gt=0, alias="TRANSCODER_QUEUE_TIMEOUT_SECONDS")
+    transcribe_job_workers: int = Field(default=2, ge=1, alias="TRANSCRIBE_JOB_WORKERS")
+    transcribe_job_queue_size: int = Field(default=32, ge=1, alias="TRANSCRIBE_JOB_QUEUE_SIZE")
+    job_spool_dir: Path = Field(
+        default=BASE_DIR / "backend" / "spool" / "jobs",
+        alias="JOB_SPOOL_DIR",
+        description="Private directory for uploads waiting in the job queue; must not be under MEDIA_ROOT",
+    )
+    transcribe_job_lease_seconds: float = Field(
+        default=60.0,
+        gt=0,
+        alias="TRANSCRIBE_JOB_LEASE_SECONDS",
+        description="How long a worker's claim on a job lasts without a heartbeat before others may take it over",
+    )
+    entry_analysis_enabled: bool = Field(
+        default=True,
+        alias="ENTRY_ANALYSIS_ENABLED",
+        description="Analyze new entries (title, mood, tags, insights) in background workers",
+    )
+    entry_analysis_workers: int = Field(default=2, ge=1, alias="ENTRY_ANALYSIS_WORKERS")
+    entry_analysis_queue_size: int = Field(default=256, ge=1, alias="ENTRY_ANALYSIS_QUEUE_SIZE")
+    entry_analysis_precompute_insight: bool = Field(default=True, alias="ENTRY_ANALYSIS_PRECOMPUTE_INSIGHT")
+    local_analyzer_enabled: bool = Field(
+        default=False,
+        alias="LOCAL_ANALYZER_ENABLED",
+        description="Estimate tags, mood and language offline and only call the LLM when unsure (no insights)",
+    )
+    local_analyzer_min_confidence: float = Field(default=0.6, ge=0, le=1, alias="LOCAL_ANALYZER_MIN_CONFIDENCE")
+    insight_stale_while_revalidate: bool = Field(
+        default=True,
+        alias="INSIGHT_STALE_WHILE_REVALIDATE",
+        description="Serve a stale insight immediately and regenerate it in the background",
+    )
+    transcript_cache_enabled: bool = Field(default=True, alias="TRANSCRIPT_CACHE_ENABLED")
+    transcript_cache_memory_max_bytes: int = Field(
+        default=16 * 1024 * 1024, alias="TRANSCRIPT_CACHE_MEMORY_MAX_BYTES"
+    )
+    transcript_cache_persistent_max_bytes: int = Field(
+        default=256 * 1024 * 1024, alias="TRANSCRIPT_CACHE_PERSISTENT_MAX_BYTES"
+    )
+    llm_cache_enabled: bool = Field(default=True, alias="LLM_CACHE_ENABLED")
+    llm_cache_ttl_seconds: float = Field(default=7 * 24 * 3600, gt=0, alias="LLM_CACHE_TTL_SECONDS")
+    llm_cache_memory_max_bytes: int = Field(default=8 * 1024 * 1024, alias="LLM_CACHE_MEMORY_MAX_BYTES")
+    llm_cache_persistent_max_bytes: int = Field(default=128 * 1024 * 1024, alias="LLM_CACHE_PERSISTENT_MAX_BYTES")
+    format_chunking_enabled: bool = Field(
+        default=True,
+        alias="FORMAT_CHUNKING_ENABLED",
+        description="Format long transcripts as sentence-aligned chunks in parallel",
+    )
+    format_chunk_max_chars: int = Field(default=4000, ge=200, alias="FORMAT_CHUNK_MAX_CHARS")
+    format_chunk_overlap_chars: int = Field(default=300, ge=0, alias="FORMAT_CHUNK_OVERLAP_CHARS")
+    format_max_concurrency: int = Field(default=4, ge=1, alias="FORMAT_MAX_CONCURRENCY")
+    llm_batching_enabled: bool = Field(
+        default=False,
+        alias="LLM_BATCHING_ENABLED",
+        description="Group concurrent formatting and analysis calls into multi-item prompts",
+    )
+    llm_batch_max_size: int = Field(default=8, ge=1, alias="LLM_BATCH_MAX_SIZE")
+    llm_batch_window_ms: float = Field(default=10.0, ge=0, alias="LLM_BATCH_WINDOW_MS")
+    stt_chunking_enabled: bool = Field(default=True, alias="STT_CHUNKING_ENABLED")
+    stt_segment_max_seconds: float = Field(default=60.0, gt=0, alias="STT_SEGMENT_MAX_SECONDS")
+    stt_segment_overlap_seconds: float = Field(default=0.5, ge=0, alias="STT_SEGMENT_OVERLAP_SECONDS")
+    stt_max_concurrency: int = Field(default=4, ge=1, alias="STT_MAX_CONCURRENCY")
+    vad_enabled: bool = Field(default=True, alias="VAD_ENABLED")
+    vad_max_pause_ms: int = Field(default=600, ge=0, alias="VAD_MAX_PAUSE_MS")
+    live_segment_min_seconds: float = Field(default=4.0, gt=0, alias="LIVE_SEGMENT_MIN_SECONDS")
+    live_segment_pause_ms: int = Field(default=500, ge=30, alias="LIVE_SEGMENT_PAUSE_MS")
+    stt_upload_codec: Literal["wav", "flac", "opus"] = Field(default="flac", alias="STT_UPLOAD_CODEC")
+    stt_opus_bitrate: str = Field(default="24k", alias="STT_OPUS_BITRATE")
 
     @classmethod
     def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):  # type: ignore[override]
         return (init_settings, env_settings, dotenv_settings, file_secret_settings)
 
     def model_post_init(self, __context):  # type: ignore[override]
+        if self.openai_cassette_mode == "replay" and not self.openai_api_key:
+            # Replay never reaches the network; the clients only need some key.
+            object.__setattr__(self, "openai_api_key", "cassette-replay")
         if not self.use_mock_ai:
             if self.llm_provider == "mock":
                 object.__setattr__(self, "llm_provider", "openai")
@@ -0,0 +1,100 @@
+"""Tiny in-process metrics registry exposed via ``GET /metrics``.
+
+Counters and gauges are plain floats; timings keep a bounded window of recent
+observations so percentiles can be reported without an external collector.
+"""
+
+from __future__ import annotations
+
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Union
+
+TIMING_WINDOW = 1024
+
+GaugeValue = Union[float, Callable[[], float]]
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, GaugeValue] = {}
+        self._timings: Dict[str, Deque[float]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """Register a gauge whose value is computed lazily at snapshot time."""
+        with self._lock:
+            self._gauges[name] = callback
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            window = self._timings.get(name)
+            if window is None:
+                window = self._timings[name] = deque(maxlen=TIMING_WINDOW)
+            window.append(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def mean(self, name: str, default: float = 0.0) -> float:
+        """Mean of the recent observations for *name*, or *default* when there are none."""
+        with self._lock:
+            window = self._timings.get(name)
+            return statistics.fmean(window) if window else default
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {name: sorted(window) for name, window in self._timings.items()}
+
+        return {
+            "counters": counters,
+            "gauges": {name: value() if callable(value) else value for name, value in gauges.items()},
+            "timings": {
+                name: {
+                    "count": len(ordered),
+                    "mean": statistics.fmean(ordered),
+                    "p50": _percentile(ordered, 50),
+                    "p95": _percentile(ordered, 95),
+                    "max": ordered[-1],
+                }
+                for name, ordered in timings.items()
+                if ordered
+            },
+        }
+
+    def reset(self) -> None:
+        """Clear counters and timings; registered gauges stay attached."""
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = MetricsRegistry()
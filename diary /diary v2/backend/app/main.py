@@ -1,5 +1,7 @@
+import asyncio
 import os
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,11 +12,39 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from .api import auth, entries, insights, transcribe
 from .core.config import get_settings
+from .core.metrics import metrics
+from .services.analysis import get_analysis_queue
+from .services.clients import close_clients
+from .services.governor import ProviderThrottledError
+from .services.jobs import get_job_queue
 
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
-app = FastAPI(title="Voice Journal API", version="0.1.0")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers on startup; stop them and close pooled clients on shutdown."""
+    job_queue = get_job_queue()
+    try:
+        job_queue.recover()
+    except Exception:
+        logger.exception("Failed to recover pending transcription jobs")
+    analysis_queue = get_analysis_queue()
+    analysis_queue.attach_loop(asyncio.get_running_loop())
+    if settings.entry_analysis_enabled:
+        try:
+            analysis_queue.recover()
+        except Exception:
+            logger.exception("Failed to recover pending entry analysis")
+    yield
+    job_queue.shutdown(wait=False)
+    analysis_queue.shutdown(wait=False)
+    await close_clients()
+
+
+app = FastAPI(title="Voice Journal API", version="0.1.0", lifespan=lifespan)
 
 # CORS middleware must be added before exception handlers
 app.add_middleware(
@@ -37,6 +67,21 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
         status_code=exc.status_code,
         content={"detail": exc.detail},
         headers={
+            **(exc.headers or {}),  # e.g. Retry-After on 503
+            "Access-Control-Allow-Origin": request.headers.get("origin", "http://localhost:5173"),
+            "Access-Control-Allow-Credentials": "true",
+        },
+    )
+
+
+@app.exception_handler(ProviderThrottledError)
+async def provider_throttled_handler(request: Request, exc: ProviderThrottledError):
+    """Answer 503 with Retry-After when the AI provider keeps rate limiting us."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "AI provider is busy, please retry later"},
+        headers={
+            "Retry-After": str(exc.retry_after),
             "Access-Control-Allow-Origin": request.headers.get("origin", "http://localhost:5173"),
             "Access-Control-Allow-Credentials": "true",
         },
@@ -82,3 +127,9 @@ app.include_router(transcribe.router)
 @app.get("/healthz")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """In-process counters, gauges and latency percentiles."""
+    return metrics.snapshot()
@@ -1,6 +1,9 @@
+from .cache_entry import CacheEntry
 from .entry import Entry
 from .insight import Insight
+from .period_rollup import PeriodRollup
 from .tag import Tag, entry_tags
+from .transcription_job import TranscriptionJob
 from .user import User
 
-__all__ = ["Entry", "Insight", "Tag", "User", "entry_tags"]
+__all__ = ["CacheEntry", "Entry", "Insight", "PeriodRollup", "Tag", "TranscriptionJob", "User", "entry_tags"]
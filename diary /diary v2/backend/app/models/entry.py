@@ -22,6 +22,10 @@ class Entry(Base):
     mood_label: Mapped[str] = mapped_column(String(32), nullable=False)
     insights: Mapped[list[str]] = mapped_column(JSON, nullable=False)
     word_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # "pending" | "running" | "done" | "failed" | "skipped"
+    analysis_status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending", index=True)
+    analysis_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    analysis_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now, index=True)
 
     user: Mapped["User"] = relationship("User", back_populates="entries")
@@ -2,15 +2,41 @@ from datetime import datetime
 from typing import Optional
 from uuid import UUID as UUIDType, uuid4
 
-from sqlalchemy import DateTime, ForeignKey, Integer, JSON, String, Text
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, JSON, String, Text, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..core.database import Base, utc_now
 
 
+# Partial-index predicates, shared with the ON CONFLICT targets in services/insights.py.
+ENTRY_SCOPE_PREDICATE = text("scope = 'entry'")
+PERIOD_SCOPE_PREDICATE = text("scope = 'period'")
+
+
 class Insight(Base):
     __tablename__ = "insights"
+    __table_args__ = (
+        # At most one insight per entry and per period, so concurrent generators upsert instead of duplicating.
+        Index(
+            "uq_insights_entry",
+            "user_id",
+            "source_entry_id",
+            unique=True,
+            postgresql_where=ENTRY_SCOPE_PREDICATE,
+            sqlite_where=ENTRY_SCOPE_PREDICATE,
+        ),
+        Index(
+            "uq_insights_period",
+            "user_id",
+            "timeframe",
+            "period_from",
+            "period_to",
+            unique=True,
+            postgresql_where=PERIOD_SCOPE_PREDICATE,
+            sqlite_where=PERIOD_SCOPE_PREDICATE,
+        ),
+    )
 
     id: Mapped[UUIDType] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid4, index=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -23,6 +49,8 @@ class Insight(Base):
     summary: Mapped[str] = mapped_column(Text, nullable=False)
     details: Mapped[str] = mapped_column(Text, nullable=False)
     meta: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # Fingerprint of the entries the insight was generated from; a mismatch marks it stale.
+    input_digest: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now, index=True)
 
     user: Mapped["User"] = relationship("User", back_populates="insights")
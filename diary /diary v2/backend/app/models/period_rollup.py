@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID as UUIDType, uuid4
+
+from sqlalchemy import DateTime, ForeignKey, Integer, JSON, String, Text, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..core.database import Base, utc_now
+
+
+class PeriodRollup(Base):
+    """Cached stats and summary of one sub-period, the building block of longer period insights."""
+
+    __tablename__ = "period_rollups"
+    __table_args__ = (UniqueConstraint("user_id", "unit", "period_from", "period_to", name="uq_period_rollups_period"),)
+
+    id: Mapped[UUIDType] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    unit: Mapped[str] = mapped_column(String(8), nullable=False)  # "week" | "month"
+    period_from: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    period_to: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    input_digest: Mapped[str] = mapped_column(String(64), nullable=False)
+    entry_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    stats: Mapped[dict] = mapped_column(JSON, nullable=False)  # {"entries", "words", "moods": {}, "tags": {}}
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+    key_insights: Mapped[list[str]] = mapped_column(JSON, nullable=False)
+    emotional_trend: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    language: Mapped[Optional[str]] = mapped_column(String(8), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID as UUIDType, uuid4
+
+from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..core.database import Base, utc_now
+
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+
+    id: Mapped[UUIDType] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, index=True)  # "queued" | "running" | "done" | "failed"
+    file_ext: Mapped[str] = mapped_column(String(16), nullable=False)
+    spool_path: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)
+    text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    language: Mapped[Optional[str]] = mapped_column(String(8), nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Worker process holding the job while it is queued or running; renewed by its heartbeat.
+    lease_owner: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now, index=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -4,10 +4,16 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field
 
+from .transcribe import TranscriptAnalysis
+
 
 class EntryCreateRequest(BaseModel):
     """Request to create a new entry from already-transcribed text."""
     transcript: str = Field(..., min_length=1, description="Transcribed text (from /transcribe endpoint)")
+    analysis: Optional[TranscriptAnalysis] = Field(
+        default=None,
+        description="Analysis returned by /transcribe in fused mode; skips background analysis when present",
+    )
 
 
 class EntryBase(BaseModel):
@@ -16,6 +22,7 @@ class EntryBase(BaseModel):
     mood_label: str
     tags: List[str]
     created_at: datetime
+    analysis_status: str = Field(description="pending | running | done | failed | skipped")
 
 
 class EntrySummary(EntryBase):
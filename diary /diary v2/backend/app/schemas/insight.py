@@ -31,6 +31,9 @@ class InsightRead(BaseModel):
     details: str
     meta: Union[InsightMeta, dict]
     created_at: datetime
+    stale: bool = Field(
+        default=False, description="Entries changed since generation; a refreshed insight is being generated"
+    )
 
     class Config:
         from_attributes = True
@@ -1,12 +1,50 @@
 """Schemas for transcription endpoint."""
 
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+from uuid import UUID
+
 from pydantic import BaseModel, Field
 
 
+class TranscriptAnalysis(BaseModel):
+    """Entry analysis returned alongside the transcript in fused LLM mode."""
+
+    title: str
+    mood_label: str
+    tags: List[str] = Field(default_factory=list)
+    insights: List[str] = Field(default_factory=list)
+    insight: Optional[Dict[str, Any]] = Field(
+        default=None, description="Draft entry insight (summary, bullets, suggestion, ...)"
+    )
+
+
 class TranscribeResponse(BaseModel):
     """Response from /transcribe endpoint."""
     
     text: str = Field(..., description="Formatted transcript text")
     transcript: str = Field(..., description="Alias for text (backward compatibility)")
     language: str = Field(default="auto", description="Detected language code or 'auto'")
+    trimmed_ratio: Optional[float] = Field(
+        default=None, description="Share of the audio dropped as silence before STT (0.0-1.0)"
+    )
+    analysis: Optional[TranscriptAnalysis] = Field(
+        default=None, description="Entry analysis, present when LLM_FUSED_MODE is enabled"
+    )
+
+
+
+class TranscriptionJobRead(BaseModel):
+    """State of an asynchronous transcription job."""
+
+    id: UUID
+    status: Literal["queued", "running", "done", "failed"]
+    text: Optional[str] = Field(default=None, description="Formatted transcript once the job is done")
+    language: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
+    class Config:
+        from_attributes = True
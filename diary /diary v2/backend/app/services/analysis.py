@@ -0,0 +1,248 @@
+"""Background enrichment of new diary entries.
+
+``POST /entries/`` only stores the transcript and marks the entry ``pending``;
+:class:`EntryAnalysisQueue` then runs the configured ``LLMProvider`` on a
+:class:`~.jobs.WorkerPool`, fills in title, mood, insights and tags, and
+optionally precomputes the entry :class:`~..models.Insight`. The entries table is
+the durable queue: anything still ``pending`` or ``running`` when a process stops
+is picked up again by :meth:`EntryAnalysisQueue.recover`.
+
+With ``LOCAL_ANALYZER_ENABLED`` the workers first try the offline
+:mod:`~.local_analyzer` against the user's tag vocabulary and only call the LLM
+when its confidence is below ``LOCAL_ANALYZER_MIN_CONFIDENCE``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..core.config import get_settings
+from ..core.database import SessionLocal
+from ..core.metrics import metrics
+from ..models import Entry
+from .insights import generate_entry_insight, store_entry_insight
+from .jobs import MAX_ATTEMPTS, QueueFullError, WorkerPool
+from .llm import analyze_transcript
+from .local_analyzer import TagVocabulary, analyze_locally, load_tag_vocabulary
+from .tags import get_or_create_tags
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ("pending", "running")
+INSIGHT_TIMEOUT_SECONDS = 120.0
+
+
+def apply_analysis(db: Session, entry: Entry, analysis: dict) -> None:
+    """Copy an ``analyze`` result onto *entry* and mark it analyzed (caller commits).
+
+    Tags are resolved with a single lookup plus one flush for any new names.
+    """
+    entry.title = (analysis.get("title") or entry.title)[:255]
+    entry.mood_label = (analysis.get("mood_label") or entry.mood_label)[:32]
+    entry.insights = list(analysis.get("insights") or [])
+    entry.tags = get_or_create_tags(db, user_id=entry.user_id, tag_names=analysis.get("tags") or [])
+    entry.analysis_status = "done"
+    entry.analysis_error = None
+
+
+def store_supplied_analysis(db: Session, entry: Entry, analysis: dict) -> None:
+    """Apply an analysis the client already has (from fused ``/transcribe``) without an LLM call."""
+    apply_analysis(db, entry, analysis)
+    db.commit()
+    if analysis.get("insight"):
+        store_entry_insight(entry, analysis["insight"], db)
+
+
+class EntryAnalysisQueue:
+    """Runs entry analysis on a :class:`WorkerPool`, with entry rows as the persisted queue."""
+
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        max_queue: int,
+        precompute_insight: bool = True,
+        local_analyzer: bool = False,
+        session_factory: sessionmaker | Callable[[], Session] = SessionLocal,
+    ):
+        self.session_factory = session_factory
+        self.precompute_insight = precompute_insight
+        self.local_analyzer = local_analyzer
+        self.pool = WorkerPool("entry_analysis", max_workers=max_workers, max_queue=max_queue)
+        self._lock = threading.Lock()
+        self._inflight: set[UUID] = set()
+        self._deferred = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Run insight precomputation on *loop*, where the pooled async OpenAI client lives."""
+        self._loop = loop
+
+    def enqueue(self, entry_id: UUID) -> bool:
+        """Hand a ``pending`` entry to the workers.
+
+        Returns ``False`` when the pool is saturated; the entry stays ``pending`` and
+        is swept up as soon as a worker frees a slot.
+        """
+        return self._submit(entry_id)
+
+    def recover(self) -> int:
+        """Requeue entries left ``pending`` or ``running`` by a previous process."""
+        with self.session_factory() as db:
+            stalled = db.execute(select(Entry).where(Entry.analysis_status == "running")).scalars().all()
+            for entry in stalled:
+                entry.analysis_status = "pending"
+            db.commit()
+        recovered = self.sweep(force=True)
+        if recovered:
+            logger.info(f"Recovered {recovered} pending entry analysis job(s)")
+        return recovered
+
+    def sweep(self, force: bool = False) -> int:
+        """Submit ``pending`` entries that are not already queued, oldest first."""
+        with self._lock:
+            self._deferred = False
+            inflight = set(self._inflight)
+        limit = None if force else max(0, self.pool.max_queue - self.pool.queued)
+        if limit == 0:
+            with self._lock:
+                self._deferred = True
+            return 0
+
+        stmt = select(Entry.id).where(Entry.analysis_status == "pending").order_by(Entry.created_at.asc())
+        if inflight:
+            stmt = stmt.where(Entry.id.not_in(inflight))
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        with self.session_factory() as db:
+            pending = db.execute(stmt).scalars().all()
+        return sum(1 for entry_id in pending if self._submit(entry_id, force=force))
+
+    def shutdown(self, wait: bool = False) -> None:
+        self.pool.shutdown(wait=wait)
+
+    def _submit(self, entry_id: UUID, force: bool = False) -> bool:
+        with self._lock:
+            if entry_id in self._inflight:
+                return True
+            self._inflight.add(entry_id)
+        try:
+            self.pool.submit(self._process, entry_id, force=force)
+        except QueueFullError:
+            with self._lock:
+                self._inflight.discard(entry_id)
+                self._deferred = True
+            metrics.increment(f"{self.pool.name}.deferred")
+            return False
+        return True
+
+    def _process(self, entry_id: UUID) -> None:
+        try:
+            self._analyze(entry_id)
+        finally:
+            with self._lock:
+                self._inflight.discard(entry_id)
+                deferred = self._deferred
+            if deferred:
+                self.sweep()
+
+    def _analyze(self, entry_id: UUID) -> None:
+        with self.session_factory() as db:
+            entry = db.get(Entry, entry_id)
+            if entry is None or entry.analysis_status not in OPEN_STATUSES:
+                return
+            entry.analysis_status = "running"
+            entry.analysis_attempts += 1
+            db.commit()
+            transcript, attempts = entry.transcript, entry.analysis_attempts
+            vocabulary = load_tag_vocabulary(db, user_id=entry.user_id) if self.local_analyzer else None
+
+        try:
+            analysis = self._analyze_locally(transcript, vocabulary) if vocabulary is not None else None
+            if analysis is None:
+                with metrics.timer(f"{self.pool.name}.llm_seconds"):
+                    analysis = analyze_transcript(transcript)
+        except Exception as exc:
+            self._fail(entry_id, attempts, str(exc) or exc.__class__.__name__)
+            raise
+
+        with self.session_factory() as db:
+            entry = db.get(Entry, entry_id)
+            if entry is None:
+                return
+            apply_analysis(db, entry, analysis)
+            db.commit()
+            if self.precompute_insight:
+                self._precompute_insight(entry, db)
+
+    def _analyze_locally(self, transcript: str, vocabulary: TagVocabulary) -> Optional[dict]:
+        """The offline analysis of *transcript*, or ``None`` to escalate to the LLM."""
+        with metrics.timer(f"{self.pool.name}.local_seconds"):
+            result = analyze_locally(transcript, vocabulary)
+        if result.confidence < get_settings().local_analyzer_min_confidence:
+            metrics.increment(f"{self.pool.name}.local_escalated")
+            return None
+        metrics.increment(f"{self.pool.name}.local_accepted")
+        return result.as_analysis()
+
+    def _precompute_insight(self, entry: Entry, db: Session) -> None:
+        """Warm the entry insight so opening the entry does not wait on the LLM.
+
+        Failures are logged only; the insight is generated on demand instead.
+        """
+        settings = get_settings()
+        if settings.llm_provider == "mock" or self._loop is None or self._loop.is_closed():
+            return
+        try:
+            future = asyncio.run_coroutine_threadsafe(generate_entry_insight(entry), self._loop)
+            future.result(timeout=INSIGHT_TIMEOUT_SECONDS)
+            metrics.increment(f"{self.pool.name}.insights_precomputed")
+        except Exception:
+            metrics.increment(f"{self.pool.name}.insight_failures")
+            logger.exception(f"Failed to precompute insight for entry {entry.id}")
+
+    def _fail(self, entry_id: UUID, attempts: int, error: str) -> None:
+        retry = attempts < MAX_ATTEMPTS
+        with self.session_factory() as db:
+            entry = db.get(Entry, entry_id)
+            if entry is None:
+                return
+            entry.analysis_status = "pending" if retry else "failed"
+            entry.analysis_error = error
+            db.commit()
+
+        if retry:
+            metrics.increment(f"{self.pool.name}.retried")
+            timer = threading.Timer(2**attempts, self._submit, args=(entry_id,), kwargs={"force": True})
+            timer.daemon = True
+            timer.start()
+
+
+_queue: Optional[EntryAnalysisQueue] = None
+
+
+def get_analysis_queue() -> EntryAnalysisQueue:
+    global _queue
+    if _queue is None:
+        settings = get_settings()
+        _queue = EntryAnalysisQueue(
+            max_workers=settings.entry_analysis_workers,
+            max_queue=settings.entry_analysis_queue_size,
+            precompute_insight=settings.entry_analysis_precompute_insight,
+            local_analyzer=settings.local_analyzer_enabled,
+        )
+    return _queue
+
+
+def reset_analysis_queue() -> None:
+    global _queue
+    if _queue is not None:
+        _queue.shutdown(wait=False)
+    _queue = None
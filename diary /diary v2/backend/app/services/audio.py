@@ -0,0 +1,268 @@
+"""Audio conversion helpers used by the transcription pipeline.
+
+Every upload is normalised to 16 kHz mono 16-bit PCM before it reaches the STT
+provider. Plain PCM WAV uploads are decoded in process (see
+:func:`decode_wav_file`); everything else goes through ffmpeg, gated by the shared
+:class:`~.transcoder.Transcoder`, in one of two modes:
+
+- ``file``: ffmpeg reads a temporary copy of the upload and writes a WAV file.
+- ``pipe``: the upload is fed to ffmpeg's stdin and raw PCM is collected from
+  stdout, so nothing touches the disk.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import wave
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+import ffmpeg
+import numpy as np
+
+from .transcoder import get_transcoder
+
+logger = logging.getLogger(__name__)
+
+TARGET_SAMPLE_RATE = 16000
+TARGET_CHANNELS = 1
+SAMPLE_WIDTH = 2  # bytes per sample for pcm_s16le
+FRAME_MS = 30  # analysis frame used for energy-based segmentation and VAD
+
+# Encoders for the audio uploaded to the STT provider. WAV is wrapped in process;
+# the others are produced by piping PCM through ffmpeg.
+STT_UPLOAD_CODECS = {
+    "flac": {"extension": "flac", "format": "flac", "acodec": "flac"},
+    "opus": {"extension": "ogg", "format": "ogg", "acodec": "libopus", "application": "voip"},
+}
+
+# Length of the windowed-sinc low-pass applied before in-process downsampling.
+RESAMPLE_FILTER_TAPS = 63
+
+# MP4-family containers keep their index (moov atom) at the end of the file, so
+# ffmpeg cannot demux them from a non-seekable stdin.
+PIPE_UNSAFE_EXTENSIONS = {".m4a", ".mp4"}
+
+
+class AudioConversionError(RuntimeError):
+    """Raised when ffmpeg fails to convert the uploaded audio."""
+
+
+@dataclass
+class PcmAudio:
+    """Raw mono pcm_s16le samples held in memory."""
+
+    samples: bytes
+    sample_rate: int = TARGET_SAMPLE_RATE
+
+    @property
+    def duration_seconds(self) -> float:
+        return len(self.samples) / (SAMPLE_WIDTH * self.sample_rate)
+
+    @classmethod
+    def from_wav_file(cls, path: str) -> "PcmAudio":
+        """Load a mono pcm_s16le WAV file as produced by :func:`convert_file_to_wav`."""
+        with wave.open(path, "rb") as wav_file:
+            return cls(samples=wav_file.readframes(wav_file.getnframes()), sample_rate=wav_file.getframerate())
+
+    def to_wav(self) -> bytes:
+        """Wrap the samples in a WAV container without touching the disk."""
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(TARGET_CHANNELS)
+            wav_file.setsampwidth(SAMPLE_WIDTH)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(self.samples)
+        return buffer.getvalue()
+
+
+def frame_samples(pcm: PcmAudio, frame_ms: int = FRAME_MS) -> np.ndarray:
+    """View the samples as a (frame_count, frame_len) int16 array, dropping the ragged tail."""
+    samples = np.frombuffer(pcm.samples, dtype="<i2")
+    frame_len = pcm.sample_rate * frame_ms // 1000
+    frame_count = len(samples) // frame_len
+    return samples[: frame_count * frame_len].reshape(frame_count, frame_len)
+
+
+def frame_rms(pcm: PcmAudio, frame_ms: int = FRAME_MS) -> np.ndarray:
+    """Root-mean-square energy of consecutive non-overlapping frames."""
+    framed = frame_samples(pcm, frame_ms)
+    if not len(framed):
+        return np.zeros(0, dtype=np.float64)
+    # Sum the squares in int64 so no float copy of the whole recording is made.
+    energy = np.einsum("ij,ij->i", framed, framed, dtype=np.int64)
+    return np.sqrt(energy / framed.shape[1])
+
+
+def is_wav_header(header: bytes) -> bool:
+    return len(header) >= 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def sniff_container(header: bytes) -> Optional[str]:
+    """Name the container of an upload from its first bytes: ``wav``, ``webm``, ``mp4`` or ``mpeg``.
+
+    Returns ``None`` for anything else. *header* should hold at least 64 bytes
+    so the WebM doctype is visible.
+    """
+    if is_wav_header(header):
+        return "wav"
+    if header[:4] == b"\x1a\x45\xdf\xa3":  # EBML; Matroska files that are not WebM are left to ffmpeg
+        return "webm" if b"webm" in header[:64] else None
+    if header[4:8] == b"ftyp":
+        return "mp4"
+    if header[:3] == b"ID3" or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mpeg"  # ID3 tag or a bare MPEG audio frame sync
+    return None
+
+
+def decode_wav_bytes(data: bytes) -> Optional[tuple[PcmAudio, str]]:
+    """Decode an in-memory integer PCM WAV file; see :func:`decode_wav_file`."""
+    return decode_wav_file(io.BytesIO(data))
+
+
+def decode_wav_file(stream: BinaryIO) -> Optional[tuple[PcmAudio, str]]:
+    """Decode an integer PCM WAV upload without spawning ffmpeg.
+
+    Only the sample data is read into memory, not the whole file. Returns
+    ``(pcm, path)`` where *path* is ``"passthrough"`` when the file is already
+    16 kHz mono 16-bit (samples are used unchanged) or ``"numpy"`` when it had to
+    be downmixed and/or resampled. Returns ``None`` for anything else (float or
+    compressed WAV, malformed headers) so the caller can use ffmpeg.
+    """
+    try:
+        with wave.open(stream, "rb") as wav_file:
+            channels = wav_file.getnchannels()
+            sample_width = wav_file.getsampwidth()
+            sample_rate = wav_file.getframerate()
+            frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if sample_width not in (1, 2, 3, 4) or channels < 1 or sample_rate <= 0:
+        return None
+
+    if channels == TARGET_CHANNELS and sample_width == SAMPLE_WIDTH and sample_rate == TARGET_SAMPLE_RATE:
+        return PcmAudio(samples=frames), "passthrough"
+
+    samples = _pcm_to_float(frames, sample_width)
+    samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    samples = _resample(samples, sample_rate, TARGET_SAMPLE_RATE)
+    pcm16 = np.clip(np.round(samples * 32768.0), -32768, 32767).astype("<i2")
+    return PcmAudio(samples=pcm16.tobytes()), "numpy"
+
+
+def _pcm_to_float(frames: bytes, sample_width: int) -> np.ndarray:
+    """Convert interleaved integer PCM to float64 samples in [-1, 1)."""
+    if sample_width == 1:  # 8-bit WAV is unsigned
+        return (np.frombuffer(frames, dtype=np.uint8).astype(np.float64) - 128.0) / 128.0
+    if sample_width == 3:
+        raw = np.frombuffer(frames[: len(frames) - len(frames) % 3], dtype=np.uint8).reshape(-1, 3)
+        values = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+        values = np.where(values & 0x800000, values - (1 << 24), values)
+        return values.astype(np.float64) / float(1 << 23)
+    dtype = "<i2" if sample_width == 2 else "<i4"
+    return np.frombuffer(frames, dtype=dtype).astype(np.float64) / float(1 << (8 * sample_width - 1))
+
+
+def _resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Resample by linear interpolation, low-passing first when downsampling."""
+    if source_rate == target_rate or not len(samples):
+        return samples
+    if target_rate < source_rate:
+        cutoff = 0.5 * target_rate / source_rate  # cycles per input sample
+        taps = np.arange(RESAMPLE_FILTER_TAPS) - (RESAMPLE_FILTER_TAPS - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(RESAMPLE_FILTER_TAPS)
+        samples = np.convolve(samples, kernel / kernel.sum(), mode="same")
+    target_len = int(len(samples) * target_rate / source_rate)
+    positions = np.arange(target_len) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples)
+
+
+def _ffmpeg_error_message(exc: ffmpeg.Error) -> str:
+    return exc.stderr.decode(errors="replace") if exc.stderr else str(exc)
+
+
+def convert_file_to_wav(input_path: str, output_path: str) -> None:
+    """Convert *input_path* to a 16kHz mono WAV file at *output_path*."""
+    try:
+        get_transcoder().run(
+            ffmpeg
+            .input(input_path)
+            .output(
+                output_path,
+                acodec="pcm_s16le",  # 16-bit PCM
+                ac=TARGET_CHANNELS,  # Mono channel
+                ar=TARGET_SAMPLE_RATE,  # 16kHz sample rate
+                format="wav",
+            )
+            .overwrite_output(),
+            quiet=True,
+            capture_stderr=True,
+        )
+    except ffmpeg.Error as exc:
+        error_msg = _ffmpeg_error_message(exc)
+        logger.error(f"FFmpeg conversion failed: {error_msg}")
+        raise AudioConversionError(error_msg) from exc
+
+
+def convert_bytes_to_pcm(audio_bytes: bytes, input_path: str | None = None) -> PcmAudio:
+    """Convert encoded audio to in-memory 16kHz mono PCM via ffmpeg pipes.
+
+    The upload is written to ffmpeg's stdin unless *input_path* is given, in which
+    case ffmpeg reads the file directly (needed for containers that require seeking).
+    Raw ``s16le`` samples are read back from stdout; the WAV header is added in
+    process by :meth:`PcmAudio.to_wav` so its size fields are always correct.
+    """
+    source = input_path or "pipe:0"
+    try:
+        stdout, _ = get_transcoder().run(
+            ffmpeg
+            .input(source)
+            .output(
+                "pipe:1",
+                acodec="pcm_s16le",
+                ac=TARGET_CHANNELS,
+                ar=TARGET_SAMPLE_RATE,
+                format="s16le",
+            ),
+            input=None if input_path else audio_bytes,
+            capture_stdout=True,
+            capture_stderr=True,
+            quiet=True,
+        )
+    except ffmpeg.Error as exc:
+        error_msg = _ffmpeg_error_message(exc)
+        logger.error(f"FFmpeg pipe conversion failed: {error_msg}")
+        raise AudioConversionError(error_msg) from exc
+
+    return PcmAudio(samples=stdout)
+
+
+def encode_for_stt(pcm: PcmAudio, codec: str, opus_bitrate: str = "24k") -> tuple[bytes, str]:
+    """Encode *pcm* for upload to the STT provider; return ``(payload, filename)``.
+
+    ``wav`` is lossless but large (~1.9 MB/min); ``flac`` is lossless at roughly half
+    that; ``opus`` at speech bitrates is an order of magnitude smaller.
+    """
+    if codec == "wav":
+        return pcm.to_wav(), "audio.wav"
+
+    options = dict(STT_UPLOAD_CODECS[codec])
+    extension = options.pop("extension")
+    if codec == "opus":
+        options["audio_bitrate"] = opus_bitrate
+    try:
+        stdout, _ = get_transcoder().run(
+            ffmpeg
+            .input("pipe:0", format="s16le", acodec="pcm_s16le", ac=TARGET_CHANNELS, ar=pcm.sample_rate)
+            .output("pipe:1", **options),
+            input=pcm.samples,
+            capture_stdout=True,
+            capture_stderr=True,
+            quiet=True,
+        )
+    except ffmpeg.Error as exc:
+        error_msg = _ffmpeg_error_message(exc)
+        logger.error(f"FFmpeg {codec} encoding failed: {error_msg}")
+        raise AudioConversionError(error_msg) from exc
+    return stdout, f"audio.{extension}"
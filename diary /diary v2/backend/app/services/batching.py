@@ -0,0 +1,183 @@
+"""Micro-batching of small, independent LLM requests.
+
+At peak times many threads ask for the same kind of completion at once and each
+request pays for the long system prompt on its own. :class:`MicroBatcher` holds
+requests for a few milliseconds (or until ``max_size`` are queued) and hands them
+to a handler as one list; :func:`run_batch` sends that list as a single
+multi-item JSON prompt and fans the per-item results back out. Items the model
+leaves out or answers malformed are retried one by one, as is the whole batch if
+the reply does not parse.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar, Union
+
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+BATCH_INSTRUCTIONS = """
+
+BATCH MODE: the user message is a JSON object {"items": [{"id": <number>, "text": <input>}, ...]}.
+Handle every item independently, exactly as if its text had been sent on its own with the instructions above.
+Reply with a JSON object {"items": [{"id": <same id>, "result": <your reply for that item>}, ...]} containing one
+entry per input item. When the instructions above ask for JSON, "result" is that JSON object; otherwise it is a string."""
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collects concurrent :meth:`submit` calls into batches for *handler*.
+
+    There is no background thread: the first caller to find no batch being
+    collected becomes the leader, waits up to ``window_seconds`` for more items,
+    and runs the handler on the caller's own thread while the others wait for
+    their result. The handler returns one result per item, in order; an
+    ``Exception`` in place of a result is raised to that item's caller only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[List[T]], List[Union[R, Exception]]],
+        *,
+        max_size: int,
+        window_seconds: float,
+    ):
+        self.name = name
+        self.handler = handler
+        self.max_size = max(1, max_size)
+        self.window_seconds = window_seconds
+        self._cond = threading.Condition()
+        self._pending: List[tuple[T, Future]] = []
+        self._collecting = False
+
+    def submit(self, item: T) -> R:
+        """Block until *item* has been processed as part of a batch and return its result."""
+        future: Future = Future()
+        with self._cond:
+            self._pending.append((item, future))
+            self._cond.notify_all()  # a leader waiting for a full batch may be done collecting
+
+        while True:
+            with self._cond:
+                # Wait while another caller is collecting or our item is in a running batch.
+                while not future.done() and (self._collecting or future.running()):
+                    self._cond.wait()
+                if future.done():
+                    break
+                batch = self._collect()
+            self._run(batch)
+        return future.result()
+
+    def _collect(self) -> List[tuple[T, Future]]:
+        """Gather up to ``max_size`` pending items (caller holds the condition)."""
+        self._collecting = True
+        deadline = time.monotonic() + self.window_seconds
+        while len(self._pending) < self.max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        batch, self._pending = self._pending[: self.max_size], self._pending[self.max_size :]
+        for _, future in batch:
+            future.set_running_or_notify_cancel()
+        self._collecting = False
+        # Items left over beyond max_size need a new leader.
+        self._cond.notify_all()
+        return batch
+
+    def _run(self, batch: List[tuple[T, Future]]) -> None:
+        metrics.increment(f"llm_batch.{self.name}.batches")
+        metrics.increment(f"llm_batch.{self.name}.items", len(batch))
+        metrics.observe(f"llm_batch.{self.name}.size", len(batch))
+        try:
+            results = self.handler([item for item, _ in batch])
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        with self._cond:
+            self._cond.notify_all()
+
+
+def batch_prompt(system_prompt: str) -> str:
+    """The single-item *system_prompt* extended with the multi-item reply contract."""
+    return system_prompt + BATCH_INSTRUCTIONS
+
+
+def batch_input(items: List[str]) -> str:
+    return json.dumps({"items": [{"id": index, "text": text} for index, text in enumerate(items)]}, ensure_ascii=False)
+
+
+def parse_batch_reply(payload: Dict, count: int) -> List[Optional[Any]]:
+    """Map a batch reply back to input order; items the model left out are ``None``.
+
+    Raises:
+        ValueError: if the reply does not follow the batch contract at all
+    """
+    items = payload.get("items")
+    if not isinstance(items, list):
+        raise ValueError("Batch reply must contain an 'items' list")
+    results: List[Optional[Any]] = [None] * count
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id")
+        if isinstance(index, int) and 0 <= index < count and results[index] is None:
+            results[index] = item.get("result")
+    return results
+
+
+def run_batch(
+    name: str,
+    items: List[str],
+    *,
+    batch_call: Callable[[str], Dict],
+    single_call: Callable[[str], R],
+    parse_item: Callable[[Any], R],
+) -> List[Union[R, Exception]]:
+    """Process *items* with one multi-item completion, falling back to *single_call* per item.
+
+    *batch_call* receives the :func:`batch_input` JSON and returns the decoded
+    reply; *parse_item* validates one ``result`` and raises ``ValueError`` if it
+    is unusable. A lone item goes straight to *single_call*.
+    """
+    if len(items) == 1:
+        return [_settle(single_call, items[0])]
+
+    try:
+        replies = parse_batch_reply(batch_call(batch_input(items)), len(items))
+    except ValueError as exc:
+        logger.warning(f"Batched {name} reply was unusable ({exc}), retrying {len(items)} item(s) one by one")
+        metrics.increment(f"llm_batch.{name}.parse_failures")
+        replies = [None] * len(items)
+
+    results: List[Union[R, Exception]] = []
+    for item, reply in zip(items, replies):
+        if reply is not None:
+            try:
+                results.append(parse_item(reply))
+                continue
+            except ValueError:
+                pass
+        metrics.increment(f"llm_batch.{name}.fallbacks")
+        results.append(_settle(single_call, item))
+    return results
+
+
+def _settle(call: Callable[[str], R], item: str) -> Union[R, Exception]:
+    try:
+        return call(item)
+    except Exception as exc:
+        return exc
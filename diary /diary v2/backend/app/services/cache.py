@@ -0,0 +1,276 @@
+"""Two-tier result cache: an in-process LRU in front of a database table.
+
+Values are strings (callers store JSON). Both tiers are bounded by the total
+size of the cached values and evict least-recently-used entries first; entries
+can also carry a TTL, after which they are treated as misses and dropped. The
+persistent tier is best-effort: database errors are logged and counted but never
+fail the caller.
+
+The persistent tier keeps its own bookkeeping cheap: writes track the
+namespace size in a running counter (re-read from the database every
+``SIZE_RESYNC_SECONDS`` so other processes' writes are counted) and only scan
+for victims once that counter passes the byte budget, and reads refresh
+``last_accessed_at`` at most once per ``ACCESS_TOUCH_INTERVAL`` per entry.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..core.database import SessionLocal, utc_now
+from ..core.metrics import metrics
+from ..models import CacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Persistent hits rewrite ``last_accessed_at`` only when it is older than this, so
+# most reads stay read-only; LRU order in the database is this coarse.
+ACCESS_TOUCH_INTERVAL = timedelta(minutes=5)
+# How often a namespace's running byte count is replaced by a fresh ``SUM``.
+SIZE_RESYNC_SECONDS = 60.0
+
+
+def make_cache_key(*parts: object) -> str:
+    """Hash the given parts into a fixed-length cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU bounded by the total UTF-8 size of its values.
+
+    Entries may carry an absolute ``expires_at`` (epoch seconds); expired entries
+    are dropped on read.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[str, Optional[float]]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._items[key]
+                self._size -= len(value.encode("utf-8"))
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires_at: Optional[float] = None) -> int:
+        """Store *value*; return how many entries were evicted to make room."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return 0
+        evicted = 0
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0].encode("utf-8"))
+            self._items[key] = (value, expires_at)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (dropped, _) = self._items.popitem(last=False)
+                self._size -= len(dropped.encode("utf-8"))
+                evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+class TwoTierCache:
+    """Memory LRU backed by the ``cache_entries`` table, scoped by *namespace*.
+
+    With ``ttl_seconds`` set, entries expire that long after they were written.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        memory_max_bytes: int,
+        persistent_max_bytes: int,
+        ttl_seconds: Optional[float] = None,
+        session_factory: sessionmaker | Callable[[], Session] = SessionLocal,
+    ):
+        self.namespace = namespace
+        self.memory = LRUCache(memory_max_bytes)
+        self.persistent_max_bytes = persistent_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.session_factory = session_factory
+        self._persistent_bytes: Optional[int] = None  # running estimate; None until first synced
+        self._size_synced_at = 0.0
+        self._size_lock = threading.Lock()
+        metrics.register_gauge(f"cache.{namespace}.memory_bytes", lambda: self.memory.size_bytes)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.increment(f"cache.{self.namespace}.hit_memory")
+            return value
+
+        found = self._get_persistent(key)
+        if found is not None:
+            value, expires_at = found
+            metrics.increment(f"cache.{self.namespace}.hit_persistent")
+            self._set_memory(key, value, expires_at)
+            return value
+
+        metrics.increment(f"cache.{self.namespace}.miss")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        now = utc_now()
+        expires_at = now + timedelta(seconds=self.ttl_seconds) if self.ttl_seconds is not None else None
+        self._set_memory(key, value, expires_at)
+        self._set_persistent(key, value, now, expires_at)
+
+    def clear_memory(self) -> None:
+        self.memory.clear()
+
+    def _set_memory(self, key: str, value: str, expires_at: Optional[datetime]) -> None:
+        evicted = self.memory.set(key, value, expires_at.timestamp() if expires_at is not None else None)
+        if evicted:
+            metrics.increment(f"cache.{self.namespace}.evicted_memory", evicted)
+
+    def _get_persistent(self, key: str) -> Optional[tuple[str, Optional[datetime]]]:
+        try:
+            with self.session_factory() as db:
+                entry = db.get(CacheEntry, (self.namespace, key))
+                if entry is None:
+                    return None
+                now = utc_now()
+                expires_at = _as_utc(entry.expires_at)
+                if expires_at is not None and expires_at <= now:
+                    db.delete(entry)
+                    db.commit()
+                    self._adjust_size(-entry.size_bytes)
+                    metrics.increment(f"cache.{self.namespace}.expired")
+                    return None
+                value = entry.value
+                last_accessed_at = _as_utc(entry.last_accessed_at)
+                if last_accessed_at is None or now - last_accessed_at >= ACCESS_TOUCH_INTERVAL:
+                    entry.last_accessed_at = now
+                    db.commit()
+                return value, expires_at
+        except Exception:
+            metrics.increment(f"cache.{self.namespace}.errors")
+            logger.warning("Persistent cache lookup failed for %s", self.namespace, exc_info=True)
+            return None
+
+    def _set_persistent(self, key: str, value: str, now: datetime, expires_at: Optional[datetime]) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.persistent_max_bytes:
+            return
+        try:
+            with self.session_factory() as db:
+                entry = db.get(CacheEntry, (self.namespace, key))
+                previous_size = 0
+                if entry is None:
+                    entry = CacheEntry(namespace=self.namespace, key=key)
+                    db.add(entry)
+                else:
+                    previous_size = entry.size_bytes
+                entry.value = value
+                entry.size_bytes = size
+                entry.created_at = now
+                entry.last_accessed_at = now
+                entry.expires_at = expires_at
+                db.flush()
+                evicted = 0
+                if self._track_size(db, size - previous_size) > self.persistent_max_bytes:
+                    evicted = self._evict(db)
+                db.commit()
+            if evicted:
+                metrics.increment(f"cache.{self.namespace}.evicted_persistent", evicted)
+        except Exception:
+            metrics.increment(f"cache.{self.namespace}.errors")
+            logger.warning("Persistent cache write failed for %s", self.namespace, exc_info=True)
+
+    def _persistent_size(self, db: Session) -> int:
+        return db.execute(
+            select(func.coalesce(func.sum(CacheEntry.size_bytes), 0)).where(CacheEntry.namespace == self.namespace)
+        ).scalar_one()
+
+    def _track_size(self, db: Session, delta: int) -> int:
+        """Apply a write's size *delta* to the running total (resyncing it when stale) and return the total."""
+        with self._size_lock:
+            if self._persistent_bytes is None or time.monotonic() - self._size_synced_at >= SIZE_RESYNC_SECONDS:
+                self._persistent_bytes = self._persistent_size(db)
+                self._size_synced_at = time.monotonic()
+            else:
+                self._persistent_bytes += delta
+            return self._persistent_bytes
+
+    def _adjust_size(self, delta: int) -> None:
+        with self._size_lock:
+            if self._persistent_bytes is not None:
+                self._persistent_bytes += delta
+
+    def _evict(self, db: Session) -> int:
+        """Delete expired rows, then least-recently-used rows until the namespace fits its byte budget.
+
+        Only called once the running total passes the budget; the total is
+        re-read here so eviction never acts on a drifted estimate.
+        """
+        expired = db.execute(
+            delete(CacheEntry).where(CacheEntry.namespace == self.namespace, CacheEntry.expires_at <= utc_now())
+        ).rowcount or 0
+
+        total = self._persistent_size(db)
+        with self._size_lock:
+            self._persistent_bytes = total
+            self._size_synced_at = time.monotonic()
+        overflow = total - self.persistent_max_bytes
+        if overflow <= 0:
+            return expired
+
+        victims: list[str] = []
+        rows = db.execute(
+            select(CacheEntry.key, CacheEntry.size_bytes)
+            .where(CacheEntry.namespace == self.namespace)
+            .order_by(CacheEntry.last_accessed_at.asc())
+        )
+        for key, size in rows:
+            if overflow <= 0:
+                break
+            victims.append(key)
+            overflow -= size
+        self._adjust_size(-(total - self.persistent_max_bytes - overflow))
+
+        db.execute(delete(CacheEntry).where(CacheEntry.namespace == self.namespace, CacheEntry.key.in_(victims)))
+        return expired + len(victims)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """SQLite drops tzinfo on round-trip; stored timestamps are always UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
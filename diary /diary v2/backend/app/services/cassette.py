@@ -0,0 +1,388 @@
+"""Record/replay of OpenAI HTTP traffic for offline benchmarks and load tests.
+
+The mock providers answer instantly with constant strings, which hides how the
+pipeline behaves under real provider latency. With ``OPENAI_CASSETTE_MODE``:
+
+* ``record`` – every request made through the pooled clients in
+  :mod:`.clients` (STT, formatting, analysis, insights, streaming) goes to the
+  network as usual, and its response is appended to the JSON-lines cassette at
+  ``OPENAI_CASSETTE_PATH`` together with its timing: when the headers arrived
+  and how many body bytes had arrived at each later point;
+* ``replay`` – no network access: responses come from the cassette and are
+  delivered on the recorded timeline (scaled by
+  ``OPENAI_CASSETTE_LATENCY_SCALE``), so streams trickle in and slow calls stay
+  slow.
+
+Requests are matched on method, path and a hash of the body (with the random
+multipart boundary normalised). Repeated identical requests replay their
+recordings in order. A request that was never recorded gets a recording of the
+same endpoint, sampled with ``OPENAI_CASSETTE_SEED``: load tests can use new
+inputs and still see the recorded latency distribution, but the content will not
+match the input. An endpoint with no recordings gets a 404.
+
+Recording happens below the SDK, so retries, throttled responses and hedged
+requests are captured as separate interactions. Request headers, including the
+API key, are never written to the cassette.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Response headers worth replaying; the SDK reads retry hints from the last two.
+REPLAYED_HEADERS = ("content-type", "retry-after", "retry-after-ms")
+_BOUNDARY = re.compile(rb"boundary=([^\s;]+)")
+
+
+@dataclass
+class Interaction:
+    """One recorded request/response pair.
+
+    ``timeline`` lists ``(seconds since the request was sent, body bytes received
+    so far)``; its last entry covers the whole body.
+    """
+
+    key: str
+    endpoint: str
+    status: int
+    headers: Dict[str, str]
+    body: str
+    headers_seconds: float
+    timeline: List[Tuple[float, int]] = field(default_factory=list)
+
+
+class Cassette:
+    """Append-only store of :class:`Interaction` records in a JSON-lines file."""
+
+    def __init__(self, path: str | Path, *, seed: Optional[int] = None):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._by_key: Dict[str, List[Interaction]] = defaultdict(list)
+        self._by_endpoint: Dict[str, List[Interaction]] = defaultdict(list)
+        self._replayed: Dict[str, int] = defaultdict(int)
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        self._index(Interaction(**json.loads(line)))
+
+    def __len__(self) -> int:
+        return sum(map(len, self._by_key.values()))
+
+    def record(self, interaction: Interaction) -> None:
+        line = json.dumps(asdict(interaction), ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+            self._index(interaction)
+        metrics.increment("cassette.recorded")
+
+    def find(self, key: str, endpoint: str) -> Optional[Interaction]:
+        """The next recording for *key*, else a sampled recording of *endpoint*, else ``None``."""
+        with self._lock:
+            recordings = self._by_key.get(key)
+            if recordings:
+                index = self._replayed[key]
+                self._replayed[key] += 1
+                metrics.increment("cassette.hits")
+                return recordings[index % len(recordings)]
+            candidates = self._by_endpoint.get(endpoint)
+            if candidates:
+                metrics.increment("cassette.sampled")
+                return self._random.choice(candidates)
+        metrics.increment("cassette.misses")
+        return None
+
+    def _index(self, interaction: Interaction) -> None:
+        interaction.timeline = [tuple(point) for point in interaction.timeline]
+        self._by_key[interaction.key].append(interaction)
+        self._by_endpoint[interaction.endpoint].append(interaction)
+
+
+def request_key(request: httpx.Request, body: bytes) -> Tuple[str, str]:
+    """``(key, endpoint)`` identifying *request*; call after the body has been read."""
+    endpoint = f"{request.method} {request.url.path}"
+    boundary = _BOUNDARY.search(request.headers.get("content-type", "").encode())
+    if boundary:
+        body = body.replace(boundary.group(1), b"boundary")
+    else:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode()
+        except ValueError:
+            pass
+    return hashlib.sha256(endpoint.encode() + b"\0" + body).hexdigest()[:32], endpoint
+
+
+class _Recorder:
+    """Collects the body timeline of one live response and records it once complete."""
+
+    def __init__(self, cassette: Cassette, key: str, endpoint: str, response: httpx.Response, started: float):
+        self.cassette = cassette
+        self.interaction = Interaction(
+            key=key,
+            endpoint=endpoint,
+            status=response.status_code,
+            headers={name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers},
+            body="",
+            headers_seconds=round(time.perf_counter() - started, 4),
+        )
+        self.started = started
+        self.chunks: List[bytes] = []
+        self.received = 0
+        self.recorded = False
+
+    def chunk(self, data: bytes) -> bytes:
+        self.chunks.append(data)
+        self.received += len(data)
+        self.interaction.timeline.append((round(time.perf_counter() - self.started, 4), self.received))
+        return data
+
+    def complete(self, exhausted: bool) -> bool:
+        # The SDK stops reading a stream at its [DONE] event without draining the body.
+        return exhausted or b"".join(self.chunks[-2:]).rstrip().endswith(b"data: [DONE]")
+
+    def finish(self) -> None:
+        """Store the interaction; bodies that are not UTF-8 text are skipped."""
+        if self.recorded:
+            return
+        self.recorded = True
+        try:
+            self.interaction.body = b"".join(self.chunks).decode("utf-8")
+        except UnicodeDecodeError:
+            logger.warning(f"Not recording binary response from {self.interaction.endpoint}")
+            return
+        if not self.interaction.timeline:
+            self.interaction.timeline.append((self.interaction.headers_seconds, 0))
+        self.cassette.record(self.interaction)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, inner: httpx.SyncByteStream, recorder: _Recorder):
+        self.inner = inner
+        self.recorder = recorder
+        self.exhausted = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        for data in self.inner:
+            yield self.recorder.chunk(data)
+        self.exhausted = True
+
+    def close(self) -> None:
+        self.inner.close()
+        # A response abandoned halfway (e.g. a hedge that lost) would replay truncated.
+        if self.recorder.complete(self.exhausted):
+            self.recorder.finish()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner: httpx.AsyncByteStream, recorder: _Recorder):
+        self.inner = inner
+        self.recorder = recorder
+        self.exhausted = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for data in self.inner:
+            yield self.recorder.chunk(data)
+        self.exhausted = True
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+        if self.recorder.complete(self.exhausted):
+            self.recorder.finish()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Forwards requests to *inner* and records every completed response."""
+
+    def __init__(self, inner: httpx.BaseTransport, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key, endpoint = request_key(request, request.read())
+        # Record the decoded body, not whatever compression the server picks.
+        request.headers["accept-encoding"] = "identity"
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        recorder = _Recorder(self.cassette, key, endpoint, response, started)
+        # A fresh response, so even one built with pre-read content streams through the recorder.
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, recorder),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key, endpoint = request_key(request, await request.aread())
+        request.headers["accept-encoding"] = "identity"
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        recorder = _Recorder(self.cassette, key, endpoint, response, started)
+        # A fresh response, so even one built with pre-read content streams through the recorder.
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_AsyncRecordingStream(response.stream, recorder),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def _not_recorded(request: httpx.Request, endpoint: str) -> httpx.Response:
+    message = f"No cassette recording for {endpoint}"
+    return httpx.Response(404, json={"error": {"message": message, "type": "cassette_miss"}}, request=request)
+
+
+def _slices(interaction: Interaction, scale: float) -> Iterator[Tuple[float, bytes]]:
+    """``(delay after the previous slice, bytes)`` pairs following the recorded timeline."""
+    body = interaction.body.encode("utf-8")
+    previous_seconds, previous_bytes = interaction.headers_seconds, 0
+    for seconds, received in interaction.timeline:
+        delay = max(0.0, seconds - previous_seconds) * scale
+        yield delay, body[previous_bytes:received]
+        previous_seconds, previous_bytes = seconds, received
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, interaction: Interaction, scale: float):
+        self.interaction = interaction
+        self.scale = scale
+
+    def __iter__(self) -> Iterator[bytes]:
+        for delay, data in _slices(self.interaction, self.scale):
+            if delay:
+                time.sleep(delay)
+            if data:
+                yield data
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, interaction: Interaction, scale: float):
+        self.interaction = interaction
+        self.scale = scale
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for delay, data in _slices(self.interaction, self.scale):
+            if delay:
+                await asyncio.sleep(delay)
+            if data:
+                yield data
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Answers requests from a :class:`Cassette` with the recorded timing."""
+
+    def __init__(self, cassette: Cassette, *, latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key, endpoint = request_key(request, request.read())
+        interaction = self.cassette.find(key, endpoint)
+        if interaction is None:
+            return _not_recorded(request, endpoint)
+        time.sleep(interaction.headers_seconds * self.latency_scale)
+        return httpx.Response(
+            interaction.status,
+            headers=interaction.headers,
+            stream=_ReplayStream(interaction, self.latency_scale),
+            request=request,
+        )
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, *, latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key, endpoint = request_key(request, await request.aread())
+        interaction = self.cassette.find(key, endpoint)
+        if interaction is None:
+            return _not_recorded(request, endpoint)
+        await asyncio.sleep(interaction.headers_seconds * self.latency_scale)
+        return httpx.Response(
+            interaction.status,
+            headers=interaction.headers,
+            stream=_AsyncReplayStream(interaction, self.latency_scale),
+            request=request,
+        )
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The configured cassette, or ``None`` when ``OPENAI_CASSETTE_MODE`` is ``off``."""
+    global _cassette
+    settings = get_settings()
+    if settings.openai_cassette_mode == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(settings.openai_cassette_path, seed=settings.openai_cassette_seed)
+            logger.info(
+                f"OpenAI cassette in {settings.openai_cassette_mode} mode: "
+                f"{settings.openai_cassette_path} ({len(_cassette)} recorded interaction(s))"
+            )
+        return _cassette
+
+
+def reset_cassette() -> None:
+    global _cassette
+    with _cassette_lock:
+        _cassette = None
+
+
+def cassette_transport(limits: httpx.Limits) -> Optional[httpx.BaseTransport]:
+    """The transport for the pooled sync client, or ``None`` to use httpx's default."""
+    cassette = get_cassette()
+    if cassette is None:
+        return None
+    if get_settings().openai_cassette_mode == "replay":
+        return ReplayTransport(cassette, latency_scale=get_settings().openai_cassette_latency_scale)
+    return RecordingTransport(httpx.HTTPTransport(limits=limits), cassette)
+
+
+def async_cassette_transport(limits: httpx.Limits) -> Optional[httpx.AsyncBaseTransport]:
+    cassette = get_cassette()
+    if cassette is None:
+        return None
+    if get_settings().openai_cassette_mode == "replay":
+        return AsyncReplayTransport(cassette, latency_scale=get_settings().openai_cassette_latency_scale)
+    return AsyncRecordingTransport(httpx.AsyncHTTPTransport(limits=limits), cassette)
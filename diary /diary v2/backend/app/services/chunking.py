@@ -0,0 +1,149 @@
+"""Split long recordings into bounded segments and stitch their transcripts.
+
+Segments are cut at the quietest frame near each boundary so words are rarely
+split, and consecutive segments share a short overlap. The overlap can make the
+STT provider repeat a few words at the seam; :func:`stitch_transcripts` removes
+the duplicated words when joining the segment transcripts back in order.
+
+Long transcripts are split the same way for LLM formatting: :func:`split_text`
+cuts at sentence boundaries, and :func:`text_tail` gives the end of the previous
+chunk to pass along as read-only context.
+"""
+
+from __future__ import annotations
+
+import re
+
+import numpy as np
+
+from .audio import FRAME_MS, SAMPLE_WIDTH, PcmAudio, frame_rms
+
+# How far before the nominal boundary we look for a quiet frame to cut at.
+SEARCH_WINDOW_SECONDS = 10.0
+MAX_OVERLAP_WORDS = 12
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+|\s*\n\s*")
+
+
+def split_at_silence(pcm: PcmAudio, *, max_seconds: float, overlap_seconds: float = 0.0) -> list[PcmAudio]:
+    """Split *pcm* into segments no longer than ``max_seconds`` (plus overlap).
+
+    Each cut is placed at the lowest-energy frame within the last
+    ``SEARCH_WINDOW_SECONDS`` before the nominal boundary. Every segment after the
+    first starts ``overlap_seconds`` before the previous cut.
+    """
+    rate = pcm.sample_rate
+    total = len(pcm.samples) // SAMPLE_WIDTH
+    max_samples = int(max_seconds * rate)
+    if total <= max_samples:
+        return [pcm]
+
+    frame_len = rate * FRAME_MS // 1000
+    energies = frame_rms(pcm)
+    search_frames = max(1, int(min(SEARCH_WINDOW_SECONDS, max_seconds / 2) * 1000 / FRAME_MS))
+    overlap = int(overlap_seconds * rate)
+
+    cuts: list[int] = []
+    start = 0
+    while total - start > max_samples:
+        boundary_frame = (start + max_samples) // frame_len
+        window_start = max(start // frame_len + 1, boundary_frame - search_frames)
+        window = energies[window_start:boundary_frame]
+        if len(window):
+            quietest = window_start + int(np.argmin(window))
+            cut = quietest * frame_len + frame_len // 2
+        else:
+            cut = start + max_samples
+        cuts.append(cut)
+        start = cut
+
+    segments = []
+    bounds = [0, *cuts, total]
+    for index, (begin, end) in enumerate(zip(bounds, bounds[1:])):
+        if index > 0:
+            begin = max(0, begin - overlap)
+        segments.append(PcmAudio(samples=pcm.samples[begin * SAMPLE_WIDTH : end * SAMPLE_WIDTH], sample_rate=rate))
+    return segments
+
+
+def _normalize(word: str) -> str:
+    return _NON_WORD.sub("", word).lower()
+
+
+def stitch_transcripts(texts: list[str], max_overlap_words: int = MAX_OVERLAP_WORDS) -> str:
+    """Join segment transcripts in order, dropping words repeated across seams.
+
+    Words are compared case- and punctuation-insensitively; the longest run of
+    words that ends the text so far and starts the next segment is removed from
+    the next segment.
+    """
+    words: list[str] = []
+    for text in texts:
+        incoming = text.split()
+        if not incoming:
+            continue
+        tail = [_normalize(w) for w in words[-max_overlap_words:]]
+        head = [_normalize(w) for w in incoming[:max_overlap_words]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size] and any(head[:size]):
+                overlap = size
+                break
+        words.extend(incoming[overlap:])
+    return " ".join(words)
+
+
+def split_text(text: str, *, max_chars: int) -> list[str]:
+    """Split *text* into chunks of at most ``max_chars``, cutting between sentences.
+
+    Sentences longer than ``max_chars`` are cut between words instead. Chunks are
+    slices of *text*, so line breaks inside them are kept; :func:`split_text_spans`
+    gives their offsets for callers that need the whitespace between them.
+    """
+    return [text[start:end] for start, end in split_text_spans(text, max_chars=max_chars)]
+
+
+def split_text_spans(text: str, *, max_chars: int) -> list[tuple[int, int]]:
+    """``(start, end)`` offsets of the :func:`split_text` chunks of *text*."""
+    units: list[tuple[int, int]] = []
+    for start, end in _stripped_spans(text, _SENTENCE_BREAK):
+        if end - start > max_chars:
+            units.extend((start + word.start(), start + word.end()) for word in re.finditer(r"\S+", text[start:end]))
+        else:
+            units.append((start, end))
+
+    spans: list[tuple[int, int]] = []
+    for start, end in units:
+        if spans and end - spans[-1][0] <= max_chars:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def text_tail(text: str, max_chars: int) -> str:
+    """The last ``max_chars`` characters of *text*, starting at a word boundary."""
+    if max_chars <= 0:
+        return ""
+    if len(text) <= max_chars:
+        return text.strip()
+    tail = text[-max_chars:]
+    if not text[-max_chars - 1].isspace():
+        tail = tail.partition(" ")[2]
+    return tail.strip()
+
+
+def _stripped_spans(text: str, separator: re.Pattern) -> list[tuple[int, int]]:
+    """Offsets of the non-blank pieces of *text* between *separator* matches, without edge whitespace."""
+    spans = []
+    position = 0
+    for match in [*separator.finditer(text), None]:
+        piece_end = match.start() if match else len(text)
+        piece = text[position:piece_end]
+        if piece.strip():
+            leading = len(piece) - len(piece.lstrip())
+            spans.append((position + leading, position + len(piece.rstrip())))
+        if match:
+            position = match.end()
+    return spans
@@ -0,0 +1,114 @@
+"""Shared OpenAI clients with pooled keep-alive HTTP connections.
+
+Every provider used to build its own ``OpenAI(...)`` client, which meant a new
+connection pool (and TCP/TLS handshake) per request. Clients are now created
+once per API key and reused; pool size and timeouts come from settings, and
+:func:`close_clients` releases the pools on application shutdown. When
+``OPENAI_CASSETTE_MODE`` is set, the pools record to or replay from a
+:mod:`.cassette` instead of only talking to the network.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from ..core.config import get_settings
+from .cassette import async_cassette_transport, cassette_transport
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_sync_clients: Dict[str, OpenAI] = {}
+_async_clients: Dict[str, AsyncOpenAI] = {}
+
+
+def _limits() -> httpx.Limits:
+    settings = get_settings()
+    return httpx.Limits(
+        max_connections=settings.openai_pool_size,
+        max_keepalive_connections=settings.openai_pool_size,
+        keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    settings = get_settings()
+    return httpx.Timeout(settings.openai_timeout_seconds, connect=settings.openai_connect_timeout_seconds)
+
+
+def _http_client() -> httpx.Client:
+    transport = cassette_transport(_limits())
+    if transport is not None:
+        # Cassette transports are built on httpx, which the SDK accepts as well as its default client.
+        return httpx.Client(timeout=_timeout(), transport=transport, follow_redirects=True)
+    return DefaultHttpxClient(limits=_limits(), timeout=_timeout())
+
+
+def _async_http_client() -> httpx.AsyncClient:
+    transport = async_cassette_transport(_limits())
+    if transport is not None:
+        return httpx.AsyncClient(timeout=_timeout(), transport=transport, follow_redirects=True)
+    return DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout())
+
+
+def get_openai_client(api_key: Optional[str] = None) -> OpenAI:
+    """Return the shared synchronous client for *api_key* (defaults to ``OPENAI_API_KEY``)."""
+    settings = get_settings()
+    api_key = api_key or settings.openai_api_key
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is required for OpenAI requests")
+    with _lock:
+        client = _sync_clients.get(api_key)
+        if client is None:
+            client = _sync_clients[api_key] = OpenAI(
+                api_key=api_key,
+                timeout=_timeout(),
+                max_retries=settings.openai_max_retries,
+                http_client=_http_client(),
+            )
+        return client
+
+
+def get_async_openai_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Return the shared asyncio client for *api_key* (defaults to ``OPENAI_API_KEY``)."""
+    settings = get_settings()
+    api_key = api_key or settings.openai_api_key
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is required for OpenAI requests")
+    with _lock:
+        client = _async_clients.get(api_key)
+        if client is None:
+            client = _async_clients[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                timeout=_timeout(),
+                max_retries=settings.openai_max_retries,
+                http_client=_async_http_client(),
+            )
+        return client
+
+
+async def close_clients() -> None:
+    """Close every pooled client; called from the application lifespan on shutdown."""
+    with _lock:
+        sync_clients = list(_sync_clients.values())
+        async_clients = list(_async_clients.values())
+        _sync_clients.clear()
+        _async_clients.clear()
+    for client in sync_clients:
+        client.close()
+    for async_client in async_clients:
+        await async_client.close()
+    if sync_clients or async_clients:
+        logger.info(f"Closed {len(sync_clients) + len(async_clients)} pooled OpenAI client(s)")
+
+
+def reset_clients() -> None:
+    """Forget pooled clients without closing them (for tests that change settings)."""
+    with _lock:
+        _sync_clients.clear()
+        _async_clients.clear()
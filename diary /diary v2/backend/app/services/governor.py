@@ -0,0 +1,467 @@
+"""Adaptive admission control for outbound AI provider requests.
+
+Every OpenAI call goes through the :class:`OutboundGovernor` of its provider
+(``openai.chat`` or ``openai.stt``). The governor caps concurrent requests with
+a limit that adapts AIMD-style: it grows by roughly one slot per window of
+successful calls and is cut multiplicatively when the provider answers 429,
+times out, or responds slower than ``OUTBOUND_LATENCY_TARGET_SECONDS``.
+Retryable failures (429, connection errors, 5xx) are retried with full-jitter
+exponential backoff that honours ``Retry-After``; when the provider keeps
+throttling, :class:`ProviderThrottledError` lets the API answer 503.
+
+Idempotent chat completions can optionally be hedged: if the first request has
+not answered within the recent p95 latency and a slot is free, a second copy is
+sent and whichever finishes first wins.
+
+Counters, gauges and timings are published under ``outbound.<name>.*``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, Optional, TypeVar
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+THROTTLE_DECREASE = 0.5  # on 429 or timeout
+LATENCY_DECREASE = 0.9  # on a response slower than the latency target
+DECREASE_COOLDOWN_SECONDS = 1.0
+LATENCY_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+
+
+class ProviderThrottledError(RuntimeError):
+    """Raised when the provider is still rate limiting after all retries."""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(f"{provider} is rate limiting requests")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A caller queued for a slot: threads wait on an event, coroutines on a future."""
+
+    __slots__ = ("event", "loop", "future")
+
+    def __init__(
+        self,
+        event: Optional[threading.Event] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        future: Optional[asyncio.Future] = None,
+    ):
+        self.event = event
+        self.loop = loop
+        self.future = future
+
+
+class OutboundGovernor:
+    """Adaptive concurrency limit, retries and hedging for one provider.
+
+    Usable from worker threads (:meth:`call`, :meth:`slot`) and from the event
+    loop (:meth:`acall`, :meth:`aslot`); both share the same slots.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: Optional[float] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        hedge_enabled: bool = False,
+        hedge_min_delay: float = 2.0,
+        decrease_cooldown: float = DECREASE_COOLDOWN_SECONDS,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.decrease_cooldown = decrease_cooldown
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._last_decrease = 0.0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        metrics.register_gauge(f"outbound.{name}.limit", lambda: self.limit)
+        metrics.register_gauge(f"outbound.{name}.inflight", lambda: self._inflight)
+        metrics.register_gauge(f"outbound.{name}.waiting", lambda: len(self._waiters))
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, min(self.max_limit, int(self._limit)))
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    # -- slots -------------------------------------------------------------
+
+    def acquire(self) -> None:
+        """Block the calling thread until a slot is free."""
+        started = time.perf_counter()
+        with self._lock:
+            if not self._waiters and self._inflight < self.limit:
+                self._inflight += 1
+                return
+            waiter = _Waiter(event=threading.Event())
+            self._waiters.append(waiter)
+        waiter.event.wait()
+        metrics.observe(f"outbound.{self.name}.wait_seconds", time.perf_counter() - started)
+
+    async def aacquire(self) -> None:
+        """Wait on the event loop until a slot is free."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._inflight < self.limit:
+                self._inflight += 1
+                return
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            # A slot granted just before the cancellation must be handed back;
+            # a cancelled future is released by _deliver instead.
+            if not queued and waiter.future.done() and not waiter.future.cancelled():
+                self.release()
+            raise
+        metrics.observe(f"outbound.{self.name}.wait_seconds", time.perf_counter() - started)
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now."""
+        with self._lock:
+            if self._waiters or self._inflight >= self.limit:
+                return False
+            self._inflight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued callers in arrival order (caller holds the lock)."""
+        while self._waiters and self._inflight < self.limit:
+            waiter = self._waiters.popleft()
+            self._inflight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+                continue
+            try:
+                waiter.loop.call_soon_threadsafe(self._deliver, waiter.future)
+            except RuntimeError:  # the waiter's loop is closed
+                self._inflight -= 1
+
+    def _deliver(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one slot for a streamed request; failures still adjust the limit, but nothing is retried."""
+        self.acquire()
+        try:
+            yield
+        except Exception as exc:
+            self._on_failure(exc)
+            raise
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """Async variant of :meth:`slot`."""
+        await self.aacquire()
+        try:
+            yield
+        except Exception as exc:
+            self._on_failure(exc)
+            raise
+        finally:
+            self.release()
+
+    # -- limit adaptation --------------------------------------------------
+
+    def _on_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        metrics.observe(f"outbound.{self.name}.latency_seconds", latency)
+        if self.latency_target is not None and latency > self.latency_target:
+            self._decrease(LATENCY_DECREASE, "slow response")
+            return
+        with self._lock:
+            self._limit = min(float(self.max_limit), self._limit + 1 / max(1.0, self._limit))
+            self._dispatch()
+
+    def _on_failure(self, exc: Exception) -> None:
+        if isinstance(exc, RateLimitError):
+            metrics.increment(f"outbound.{self.name}.throttled")
+            self._decrease(THROTTLE_DECREASE, "rate limited")
+        elif isinstance(exc, APITimeoutError):
+            metrics.increment(f"outbound.{self.name}.timeouts")
+            self._decrease(THROTTLE_DECREASE, "timed out")
+
+    def _decrease(self, factor: float, reason: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            # One congestion signal per cooldown: a burst of 429s from requests
+            # already in flight should not collapse the limit to the floor.
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self._limit = max(float(self.min_limit), self._limit * factor)
+            limit = self.limit
+        logger.info(f"Outbound {self.name} limit lowered to {limit} ({reason})")
+
+    # -- retries -----------------------------------------------------------
+
+    def backoff_seconds(self, attempt: int, exc: Exception) -> float:
+        """Full-jitter exponential backoff, but never sooner than the provider's ``Retry-After``."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        hint = retry_after_hint(exc)
+        if hint is not None:
+            delay = max(delay, min(hint, self.backoff_max))
+        return delay
+
+    def _give_up(self, exc: Exception, attempt: int) -> Exception:
+        if not isinstance(exc, RateLimitError):
+            return exc
+        hint = retry_after_hint(exc)
+        retry_after = max(1, math.ceil(hint if hint is not None else self.backoff_base * 2**attempt))
+        logger.warning(f"Outbound {self.name} still throttled after {attempt + 1} attempt(s)")
+        return ProviderThrottledError(self.name, retry_after)
+
+    def call(self, fn: Callable[[], T], *, hedge: Optional[bool] = None) -> T:
+        """Run the blocking request *fn* under the limit, retrying transient failures.
+
+        *fn* must be safe to repeat; hedging (``None`` follows the governor's
+        setting) may run it twice at once.
+        """
+        hedge = self.hedge_enabled if hedge is None else hedge
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(fn) if hedge else self._attempt(fn)
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise self._give_up(exc, attempt) from exc
+                delay = self.backoff_seconds(attempt, exc)
+                metrics.increment(f"outbound.{self.name}.retries")
+                logger.info(f"Retrying {self.name} request in {delay:.2f}s after {exc.__class__.__name__}")
+                time.sleep(delay)
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], *, hedge: Optional[bool] = None) -> T:
+        """Async variant of :meth:`call`; *fn* returns a fresh awaitable per attempt."""
+        hedge = self.hedge_enabled if hedge is None else hedge
+        attempt = 0
+        while True:
+            try:
+                return await (self._ahedged(fn) if hedge else self._aattempt(fn))
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise self._give_up(exc, attempt) from exc
+                delay = self.backoff_seconds(attempt, exc)
+                metrics.increment(f"outbound.{self.name}.retries")
+                logger.info(f"Retrying {self.name} request in {delay:.2f}s after {exc.__class__.__name__}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _attempt(self, fn: Callable[[], T]) -> T:
+        self.acquire()
+        try:
+            return self._measure(fn)
+        finally:
+            self.release()
+
+    async def _aattempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        await self.aacquire()
+        try:
+            return await self._ameasure(fn)
+        finally:
+            self.release()
+
+    def _measure(self, fn: Callable[[], T]) -> T:
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as exc:
+            self._on_failure(exc)
+            raise
+        self._on_success(time.perf_counter() - started)
+        return result
+
+    async def _ameasure(self, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as exc:
+            self._on_failure(exc)
+            raise
+        self._on_success(time.perf_counter() - started)
+        return result
+
+    # -- hedging -----------------------------------------------------------
+
+    def hedge_delay(self) -> float:
+        """Send the hedge once the first request is slower than the recent p95."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return self.hedge_min_delay
+        ordered = sorted(self._latencies)
+        return max(self.hedge_min_delay, ordered[math.ceil(0.95 * len(ordered)) - 1])
+
+    def _submit(self, fn: Callable[[], T]) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.max_limit, thread_name_prefix=f"outbound-{self.name}"
+                )
+            executor = self._executor
+        future = executor.submit(self._measure, fn)
+        future.add_done_callback(lambda _: self.release())
+        return future
+
+    def _hedged(self, fn: Callable[[], T]) -> T:
+        self.acquire()
+        primary = self._submit(fn)
+        if wait([primary], timeout=self.hedge_delay()).done or not self.try_acquire():
+            return primary.result()
+
+        metrics.increment(f"outbound.{self.name}.hedges")
+        hedge = self._submit(fn)
+        # The losing request cannot be cancelled mid-flight; it finishes in the
+        # background and gives its slot back then.
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.increment(f"outbound.{self.name}.hedge_wins")
+                    return future.result()
+        return primary.result()
+
+    async def _ahedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        await self.aacquire()
+        primary = self._spawn(fn)
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if done or not self.try_acquire():
+                return await primary
+
+            metrics.increment(f"outbound.{self.name}.hedges")
+            hedge = self._spawn(fn)
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.increment(f"outbound.{self.name}.hedge_wins")
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _spawn(self, fn: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        # Released from a done-callback so a task cancelled before it starts still frees its slot.
+        task = asyncio.ensure_future(self._ameasure(fn))
+        task.add_done_callback(lambda _: self.release())
+        return task
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def retry_after_hint(exc: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait (``retry-after-ms`` / ``retry-after``), if any."""
+    if not isinstance(exc, APIStatusError):
+        return None
+    headers = exc.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:  # HTTP-date form; fall back to our own backoff
+        return None
+    return None
+
+
+_lock = threading.Lock()
+_governors: Dict[str, OutboundGovernor] = {}
+
+
+def get_governor(name: str) -> OutboundGovernor:
+    """Return the shared governor for *name* (``openai.chat`` or ``openai.stt``).
+
+    STT latency grows with the recording length, so only 429s and timeouts drive
+    its limit, and uploads are never hedged.
+    """
+    with _lock:
+        governor = _governors.get(name)
+        if governor is None:
+            settings = get_settings()
+            is_stt = name.endswith(".stt")
+            governor = _governors[name] = OutboundGovernor(
+                name,
+                initial_limit=settings.outbound_initial_concurrency,
+                min_limit=settings.outbound_min_concurrency,
+                max_limit=settings.outbound_max_concurrency or settings.openai_pool_size,
+                latency_target=None if is_stt else settings.outbound_latency_target_seconds,
+                max_retries=settings.outbound_max_retries,
+                backoff_base=settings.outbound_backoff_base_seconds,
+                backoff_max=settings.outbound_backoff_max_seconds,
+                hedge_enabled=settings.outbound_hedge_enabled and not is_stt,
+                hedge_min_delay=settings.outbound_hedge_min_delay_seconds,
+            )
+        return governor
+
+
+def reset_governors() -> None:
+    with _lock:
+        governors = list(_governors.values())
+        _governors.clear()
+    for governor in governors:
+        governor.shutdown()
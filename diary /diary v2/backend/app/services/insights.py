@@ -1,29 +1,66 @@
-"""Insight generation service using LLM."""
+"""Insight generation service using LLM.
+
+The generators are coroutines end to end: the LLM call goes through
+``AsyncOpenAI`` and the blocking SQLAlchemy work (lazy-loaded tags, queries and
+commits) runs in the threadpool, so a slow completion never stalls the event loop.
+
+Concurrent requests for the same entry or period share one generation via
+:class:`~.singleflight.SingleFlight`; across processes the partial unique indexes
+on ``insights`` plus an upsert keep a single row per entry/period. Each row
+records a digest of the entries it was built from, so readers can tell when it
+has gone stale.
+
+Month and year insights are composed from cached sub-period rollups (see
+``period_rollups``) instead of a sample of raw transcripts, so their prompts stay
+bounded and cover the whole period.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
 from collections import Counter
-from datetime import datetime, timedelta
-from typing import Literal, Optional
-from uuid import UUID
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Literal, Optional, TypeVar
+from uuid import UUID, uuid4
 
-from openai import OpenAI, OpenAIError
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from openai import AsyncOpenAI, OpenAIError
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, selectinload
 
 from ..core.config import get_settings
-from ..models import Entry, Insight
+from ..core.database import SessionLocal, utc_now
+from ..core.metrics import metrics
+from ..models import Entry, Insight, PeriodRollup
+from ..models.insight import ENTRY_SCOPE_PREDICATE, PERIOD_SCOPE_PREDICATE
+from .clients import get_async_openai_client
+from .governor import get_governor
+from .local_analyzer import detect_language
+from .model_router import Task, observe_latency, route
+from .singleflight import SingleFlight
+from .streaming import stream_chat_completion
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+T = TypeVar("T")
+
+_generations = SingleFlight("insights")
+
+# Columns refreshed when a generation lands on an existing entry/period row.
+UPSERT_FIELDS = ("language", "summary", "details", "meta", "input_digest", "created_at")
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
 
-def _get_openai_client() -> OpenAI:
+def _get_openai_client() -> AsyncOpenAI:
     if not settings.openai_api_key:
         raise RuntimeError("OPENAI_API_KEY is required for insight generation")
-    return OpenAI(api_key=settings.openai_api_key)
+    return get_async_openai_client(settings.openai_api_key)
 
 
 def _count_words(text: str) -> int:
@@ -52,15 +89,18 @@ Return a JSON object with these exact fields:
 }}
 
 Entry text:
-{{transcript}}
+{transcript}
 
 Entry metadata:
-- Date: {{date}}
-- Mood label: {{mood_label}}
-- Tags: {{tags}}
-- Word count: {{word_count}}
+- Date: {date}
+- Mood label: {mood_label}
+- Tags: {tags}
+- Word count: {word_count}
 """
 
+INSIGHT_SYSTEM_PROMPT = "You are a reflective diary assistant. Always respond with valid JSON."
+INSIGHT_TEMPERATURE = 0.3
+
 PERIOD_INSIGHT_PROMPT = """You are a reflective diary assistant that helps users understand patterns across multiple diary entries.
 
 Analyze the following period of entries and provide high-level insights in JSON format.
@@ -82,52 +122,159 @@ Return a JSON object with these exact fields:
 }}
 
 Period statistics:
-{{stats}}
+{stats}
 
 Sample entries (truncated):
-{{entries_text}}
+{entries_text}
 """
 
+ROLLUP_INSIGHT_PROMPT = """You are a reflective diary assistant that helps users understand patterns across multiple diary entries.
 
-async def generate_entry_insight(entry: Entry, db: Session) -> Insight:
-    """Generate an insight for a single diary entry."""
-    client = _get_openai_client()
-    tags = [tag.name for tag in entry.tags]
-    word_count = entry.word_count or _count_words(entry.transcript)
+Analyze the following period from the summaries of its {unit}s and provide high-level insights in JSON format.
 
-    prompt = ENTRY_INSIGHT_PROMPT.format(
-        transcript=entry.transcript,
-        date=entry.created_at.strftime("%Y-%m-%d"),
-        mood_label=entry.mood_label,
-        tags=", ".join(tags) if tags else "none",
-        word_count=word_count,
-    ).replace("{{", "{").replace("}}", "}")
+Rules:
+- Respond in the same language as most summaries (detect it if needed)
+- Be gentle, supportive, and non-therapeutic
+- Do not provide medical advice or diagnoses
+- Weigh every {unit} of the period, not just the first ones
+- Focus on trends, patterns, and gentle reflections
+
+Return a JSON object with these exact fields:
+{{
+  "summary": "High-level overview of this period (2-3 sentences)",
+  "key_insights": ["insight 1", "insight 2", "insight 3"],
+  "emotional_trend": "improving | declining | mixed | stable",
+  "focus_recommendations": ["recommendation 1", "recommendation 2"],
+  "top_tags": [{{"tag": "tag1", "weight": 0.7}}, {{"tag": "tag2", "weight": 0.5}}],
+  "language": "detected language code (e.g., ru, en, uk)"
+}}
+
+Period statistics:
+{stats}
 
+Summaries by {unit}, in chronological order:
+{summaries}
+"""
+
+
+async def _complete_json(prompt: str, task: Task, scope: str) -> dict:
+    """Send *prompt* to the model routed for *task* without blocking the event loop; parse the JSON reply."""
+    client = _get_openai_client()
+    decision = route(task, len(prompt))
     try:
-        completion = client.chat.completions.create(
-            model=settings.openai_llm_model,
-            temperature=0.3,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are a reflective diary assistant. Always respond with valid JSON."},
-                {"role": "user", "content": prompt},
-            ],
-        )
+        with observe_latency(decision):
+            completion = await get_governor("openai.chat").acall(
+                lambda: client.chat.completions.create(
+                    model=decision.model,
+                    max_tokens=decision.max_tokens,
+                    temperature=INSIGHT_TEMPERATURE,
+                    response_format={"type": "json_object"},
+                    messages=[
+                        {"role": "system", "content": INSIGHT_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt},
+                    ],
+                )
+            )
     except OpenAIError as exc:
-        logger.exception("OpenAI API failed for entry insight")
-        raise RuntimeError("Failed to generate entry insight") from exc
+        logger.exception(f"OpenAI API failed for {scope} insight")
+        raise RuntimeError(f"Failed to generate {scope} insight") from exc
+
+    return _parse_json_reply(completion.choices[0].message.content)
 
-    content = completion.choices[0].message.content
+
+def _parse_json_reply(content: Optional[str]) -> dict:
     if not content:
         raise ValueError("LLM returned empty content")
 
     try:
-        data = json.loads(content)
+        return json.loads(content)
     except json.JSONDecodeError as exc:
         logger.error("LLM returned invalid JSON: %s", content)
         raise ValueError("LLM returned invalid JSON") from exc
 
-    language = data.get("language", "ru")
+
+def _upsert_insight(db: Session, values: dict) -> Insight:
+    """Insert an insight, or overwrite the existing row for the same entry/period.
+
+    Returns the stored row, which is the same for every concurrent writer.
+    """
+    values = {"id": uuid4(), "created_at": utc_now(), **values}
+    if values["scope"] == "entry":
+        conflict_columns = ["user_id", "source_entry_id"]
+        conflict_where = ENTRY_SCOPE_PREDICATE
+    else:
+        conflict_columns = ["user_id", "timeframe", "period_from", "period_to"]
+        conflict_where = PERIOD_SCOPE_PREDICATE
+
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is None:
+        insight = Insight(**values)
+        db.add(insight)
+        db.commit()
+        db.refresh(insight)
+        return insight
+
+    stmt = insert(Insight).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=conflict_columns,
+        index_where=conflict_where,
+        set_={field: stmt.excluded[field] for field in UPSERT_FIELDS},
+    )
+    db.execute(stmt)
+    db.commit()
+
+    lookup = [getattr(Insight, column) == values[column] for column in conflict_columns]
+    return db.execute(
+        select(Insight)
+        .where(Insight.scope == values["scope"], *lookup)
+        .execution_options(populate_existing=True)
+    ).scalar_one()
+
+
+def _build_entry_prompt(entry: Entry) -> str:
+    tags = [tag.name for tag in entry.tags]
+    word_count = entry.word_count or _count_words(entry.transcript)
+
+    return ENTRY_INSIGHT_PROMPT.format(
+        transcript=entry.transcript,
+        date=entry.created_at.strftime("%Y-%m-%d"),
+        mood_label=entry.mood_label,
+        tags=", ".join(tags) if tags else "none",
+        word_count=word_count,
+    )
+
+
+async def generate_entry_insight(entry: Entry) -> Insight:
+    """Generate an insight for a single diary entry.
+
+    Concurrent calls for the same entry share one LLM request and return the same row.
+    The generation reloads the entry in a session of its own, so it may outlive the
+    caller; the returned row is detached from any session.
+    """
+    entry_id = entry.id
+
+    async def regenerate(db: Session) -> Insight:
+        stored = await run_in_threadpool(db.get, Entry, entry_id)
+        if stored is None:
+            raise LookupError(f"Entry {entry_id} no longer exists")
+        return await _generate_entry_insight(stored, db)
+
+    key = ("entry", entry.user_id, entry_id)
+    return await _generations.run(key, _in_own_session(regenerate))
+
+
+async def _generate_entry_insight(entry: Entry, db: Session) -> Insight:
+    prompt = await run_in_threadpool(_build_entry_prompt, entry)
+    data = await _complete_json(prompt, "entry_insight", "entry")
+    return await run_in_threadpool(store_entry_insight, entry, data, db)
+
+
+def store_entry_insight(entry: Entry, data: dict, db: Session) -> Insight:
+    """Upsert the entry insight described by an LLM reply shaped like ``ENTRY_INSIGHT_PROMPT``.
+
+    Also used to persist the insight drafted by the fused format+analyze call.
+    """
+    language = data.get("language") or detect_language(entry.transcript)[0]
     summary = data.get("summary", "")
     bullets = data.get("bullets", [])
     suggestion = data.get("suggestion", "")
@@ -142,7 +289,7 @@ async def generate_entry_insight(entry: Entry, db: Session) -> Insight:
         "top_topics": data.get("top_topics", []),
     }
 
-    insight = Insight(
+    values = dict(
         user_id=entry.user_id,
         scope="entry",
         source_entry_id=entry.id,
@@ -150,55 +297,35 @@ async def generate_entry_insight(entry: Entry, db: Session) -> Insight:
         summary=summary,
         details=details,
         meta=meta,
+        input_digest=entry_input_digest(entry),
     )
-    db.add(insight)
-    db.commit()
-    db.refresh(insight)
-    return insight
+    return _upsert_insight(db, values)
 
 
-async def generate_period_insight(
-    user_id: int,
-    period_from: datetime,
-    period_to: datetime,
-    timeframe: Literal["week", "month", "year", "custom"],
-    db: Session,
-) -> Insight:
-    """Generate an aggregated insight for a time period."""
-    client = _get_openai_client()
-
+def _load_period_entries(user_id: int, period_from: datetime, period_to: datetime, db: Session) -> list[Entry]:
     stmt = (
         select(Entry)
         .where(Entry.user_id == user_id, Entry.created_at >= period_from, Entry.created_at <= period_to)
+        .options(selectinload(Entry.tags))
         .order_by(Entry.created_at.asc())
     )
-    entries = db.execute(stmt).scalars().all()
+    return list(db.execute(stmt).scalars().all())
 
-    if not entries:
-        raise ValueError("No entries found for this period")
-
-    total_entries = len(entries)
-    days_span = (period_to - period_from).days or 1
-    entries_per_week = (total_entries / days_span) * 7
 
-    mood_labels = [e.mood_label for e in entries]
-    mood_dist = Counter(mood_labels)
+def _build_period_prompt(user_id: int, period_from: datetime, period_to: datetime, db: Session) -> tuple[str, str]:
+    """Load the period's entries and render the prompt; raises ``ValueError`` if there are none.
 
-    all_tags = []
-    for entry in entries:
-        all_tags.extend([tag.name for tag in entry.tags])
-    tag_counts = Counter(all_tags)
-    top_tags = [{"tag": tag, "count": count} for tag, count in tag_counts.most_common(10)]
+    Returns the prompt and the digest of the entries it was built from.
+    """
+    entries = _load_period_entries(user_id, period_from, period_to, db)
+    if not entries:
+        raise ValueError("No entries found for this period")
+    refs = [(entry.id, entry.created_at, entry.analysis_status) for entry in entries]
+    return _render_period_prompt(entries, period_from, period_to), entry_set_digest(refs)
 
-    word_counts = [e.word_count or _count_words(e.transcript) for e in entries]
-    avg_word_count = sum(word_counts) / len(word_counts) if word_counts else 0
 
-    stats_text = f"""Total entries: {total_entries}
-Entries per week: {entries_per_week:.1f}
-Average word count: {avg_word_count:.0f}
-Mood distribution: {dict(mood_dist)}
-Top tags: {', '.join([t['tag'] for t in top_tags[:5]])}
-"""
+def _render_period_prompt(entries: list[Entry], period_from: datetime, period_to: datetime) -> str:
+    stats_text = _format_stats(_stats_from_entries(entries), period_from, period_to)
 
     entries_text_parts = []
     for entry in entries[:20]:
@@ -209,32 +336,363 @@ Top tags: {', '.join([t['tag'] for t in top_tags[:5]])}
     if len(entries) > 20:
         entries_text += f"\n\n... and {len(entries) - 20} more entries"
 
-    prompt = PERIOD_INSIGHT_PROMPT.format(stats=stats_text, entries_text=entries_text).replace("{{", "{").replace("}}", "}")
+    return PERIOD_INSIGHT_PROMPT.format(stats=stats_text, entries_text=entries_text)
 
-    try:
-        completion = client.chat.completions.create(
-            model=settings.openai_llm_model,
-            temperature=0.3,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are a reflective diary assistant. Always respond with valid JSON."},
-                {"role": "user", "content": prompt},
-            ],
+
+def _stats_from_entries(entries: list[Entry]) -> dict:
+    tags = Counter(tag.name for entry in entries for tag in entry.tags)
+    return {
+        "entries": len(entries),
+        "words": sum(e.word_count or _count_words(e.transcript) for e in entries),
+        "moods": dict(Counter(e.mood_label for e in entries)),
+        "tags": dict(tags),
+    }
+
+
+def _merge_stats(parts: list[dict]) -> dict:
+    moods: Counter = Counter()
+    tags: Counter = Counter()
+    for part in parts:
+        moods.update(part.get("moods", {}))
+        tags.update(part.get("tags", {}))
+    return {
+        "entries": sum(part.get("entries", 0) for part in parts),
+        "words": sum(part.get("words", 0) for part in parts),
+        "moods": dict(moods),
+        "tags": dict(tags),
+    }
+
+
+def _format_stats(stats: dict, period_from: datetime, period_to: datetime) -> str:
+    total_entries = stats["entries"]
+    days_span = (period_to - period_from).days or 1
+    entries_per_week = (total_entries / days_span) * 7
+    avg_word_count = stats["words"] / total_entries if total_entries else 0
+    top_tags = [tag for tag, _ in Counter(stats["tags"]).most_common(5)]
+
+    return f"""Total entries: {total_entries}
+Entries per week: {entries_per_week:.1f}
+Average word count: {avg_word_count:.0f}
+Mood distribution: {stats["moods"]}
+Top tags: {', '.join(top_tags)}
+"""
+
+
+# ---------------------------------------------------------------------------
+# Hierarchical rollups
+#
+# Long periods are not summarized from raw transcripts. A month is composed from
+# the rollups of its weeks and a year from its months (each clipped to the
+# parent's bounds); every rollup stores its stats and LLM summary in
+# ``period_rollups`` together with a digest of the entries it covers, so only
+# sub-periods whose entries changed are summarized again.
+# ---------------------------------------------------------------------------
+
+# Sub-period units used to compose each timeframe, finest first.
+ROLLUP_UNITS: dict[str, tuple[str, ...]] = {"month": ("week",), "year": ("week", "month")}
+ROLLUP_CONCURRENCY = 4
+ROLLUP_FIELDS = ("input_digest", "entry_count", "stats", "summary", "key_insights", "emotional_trend", "language", "created_at")
+
+EntryRef = tuple[UUID, datetime, str]
+
+
+@dataclass
+class _RollupNode:
+    unit: str
+    start: datetime
+    end: datetime
+    refs: list[EntryRef]
+    children: list["_RollupNode"] = field(default_factory=list)
+    rollup: Optional[dict] = None
+
+    @property
+    def key(self) -> tuple[str, datetime, datetime]:
+        return self.unit, _as_utc(self.start), _as_utc(self.end)
+
+    @property
+    def digest(self) -> str:
+        return entry_set_digest(self.refs)
+
+
+def _load_entry_refs(db: Session, user_id: int, period_from: datetime, period_to: datetime) -> list[EntryRef]:
+    rows = db.execute(
+        select(Entry.id, Entry.created_at, Entry.analysis_status).where(
+            Entry.user_id == user_id, Entry.created_at >= period_from, Entry.created_at <= period_to
         )
-    except OpenAIError as exc:
-        logger.exception("OpenAI API failed for period insight")
-        raise RuntimeError("Failed to generate period insight") from exc
+    ).all()
+    return [tuple(row) for row in rows]
+
+
+def period_input_digest(db: Session, user_id: int, period_from: datetime, period_to: datetime) -> str:
+    """Digest of the entries a period insight for ``[period_from, period_to]`` would be built from."""
+    return entry_set_digest(_load_entry_refs(db, user_id, period_from, period_to))
+
+
+def entry_input_digest(entry: Entry) -> str:
+    """Digest of the entry state an entry insight depends on (its analysis fills mood and tags)."""
+    return entry_set_digest([(entry.id, entry.created_at, entry.analysis_status)])
+
+
+def entry_set_digest(refs: list[EntryRef]) -> str:
+    """Cheap fingerprint of a set of entries: ids with analysis status, count and newest ``created_at``.
+
+    Changes whenever an entry is added, removed or finishes background analysis.
+    """
+    digest = hashlib.sha256()
+    for entry_id, _, analysis_status in sorted(refs, key=lambda ref: str(ref[0])):
+        digest.update(f"{entry_id}:{analysis_status};".encode())
+    newest = max((_as_utc(created_at) for _, created_at, _ in refs), default=None)
+    digest.update(f"{len(refs)}:{newest.isoformat() if newest else ''}".encode())
+    return digest.hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _rollup_units(timeframe: str, period_from: datetime, period_to: datetime) -> tuple[str, ...]:
+    if timeframe in ROLLUP_UNITS:
+        return ROLLUP_UNITS[timeframe]
+    if timeframe == "custom":
+        span = (period_to - period_from).days
+        if span > 62:
+            return ROLLUP_UNITS["year"]
+        if span > 7:
+            return ROLLUP_UNITS["month"]
+    return ()
+
+
+def _split_period(start: datetime, end: datetime, unit: str) -> list[tuple[datetime, datetime]]:
+    """Cut ``[start, end]`` at calendar week (Monday) or month boundaries."""
+    segments = []
+    cursor = start
+    while cursor <= end:
+        day = cursor.replace(hour=0, minute=0, second=0, microsecond=0)
+        if unit == "week":
+            boundary = day - timedelta(days=day.weekday()) + timedelta(days=7)
+        elif day.month == 12:
+            boundary = day.replace(year=day.year + 1, month=1, day=1)
+        else:
+            boundary = day.replace(month=day.month + 1, day=1)
+        segments.append((cursor, min(boundary - timedelta(microseconds=1), end)))
+        cursor = boundary
+    return segments
+
+
+def _plan_rollups(start: datetime, end: datetime, units: tuple[str, ...], refs: list[EntryRef]) -> list[_RollupNode]:
+    """Build the rollup tree for ``[start, end]``: nodes of ``units[-1]`` with finer units below."""
+    nodes = []
+    for seg_start, seg_end in _split_period(start, end, units[-1]):
+        lower, upper = _as_utc(seg_start), _as_utc(seg_end)
+        seg_refs = [ref for ref in refs if lower <= _as_utc(ref[1]) <= upper]
+        node = _RollupNode(units[-1], seg_start, seg_end, seg_refs)
+        if len(units) > 1 and seg_refs:
+            node.children = _plan_rollups(seg_start, seg_end, units[:-1], seg_refs)
+        nodes.append(node)
+    return nodes
+
+
+def _load_rollup_inputs(
+    db: Session, user_id: int, period_from: datetime, period_to: datetime
+) -> tuple[list[EntryRef], dict[tuple[str, datetime, datetime], PeriodRollup]]:
+    """Fetch lightweight entry references and the stored rollups inside the period."""
+    refs = _load_entry_refs(db, user_id, period_from, period_to)
+    rollups = db.execute(
+        select(PeriodRollup).where(
+            PeriodRollup.user_id == user_id,
+            PeriodRollup.period_from >= period_from,
+            PeriodRollup.period_to <= period_to,
+        )
+    ).scalars().all()
+    stored = {(row.unit, _as_utc(row.period_from), _as_utc(row.period_to)): row for row in rollups}
+    return refs, stored
+
+
+def _collect_stale(
+    nodes: list[_RollupNode], stored: dict, levels: list[list[_RollupNode]], depth: int = 0
+) -> None:
+    """Reuse stored rollups whose digest still matches; queue the rest by tree depth."""
+    for node in nodes:
+        row = stored.get(node.key)
+        if not node.refs:
+            node.rollup = {"stats": _merge_stats([]), "summary": "", "key_insights": []}
+        elif row is not None and row.input_digest == node.digest:
+            node.rollup = {field_name: getattr(row, field_name) for field_name in ROLLUP_FIELDS}
+            metrics.increment("insights.rollups.reused")
+        else:
+            if len(levels) <= depth:
+                levels.append([])
+            levels[depth].append(node)
+            _collect_stale(node.children, stored, levels, depth + 1)
+
+
+def _render_rollup_prompt(nodes: list[_RollupNode], unit: str, period_from: datetime, period_to: datetime) -> str:
+    stats = _merge_stats([node.rollup["stats"] for node in nodes])
+    parts = []
+    for node in nodes:
+        if not node.rollup["stats"]["entries"]:
+            continue
+        node_stats = node.rollup["stats"]
+        header = (
+            f"[{node.start.strftime('%Y-%m-%d')} – {node.end.strftime('%Y-%m-%d')}] "
+            f"{node_stats['entries']} entries, moods: {node_stats['moods']}"
+        )
+        insights = "; ".join(node.rollup.get("key_insights") or [])
+        parts.append(f"{header}\n{node.rollup['summary']}" + (f"\nKey insights: {insights}" if insights else ""))
+    return ROLLUP_INSIGHT_PROMPT.format(
+        unit=unit, stats=_format_stats(stats, period_from, period_to), summaries="\n\n".join(parts)
+    )
 
-    content = completion.choices[0].message.content
-    if not content:
-        raise ValueError("LLM returned empty content")
 
-    try:
-        data = json.loads(content)
-    except json.JSONDecodeError as exc:
-        logger.error("LLM returned invalid JSON: %s", content)
-        raise ValueError("LLM returned invalid JSON") from exc
+def _prepare_leaf_prompts(db: Session, user_id: int, nodes: list[_RollupNode]) -> list[tuple[dict, str]]:
+    prepared = []
+    for node in nodes:
+        entries = _load_period_entries(user_id, node.start, node.end, db)
+        prepared.append((_stats_from_entries(entries), _render_period_prompt(entries, node.start, node.end)))
+    return prepared
+
+
+def _store_rollups(db: Session, user_id: int, nodes: list[_RollupNode]) -> None:
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    for node in nodes:
+        values = {
+            "id": uuid4(),
+            "user_id": user_id,
+            "unit": node.unit,
+            "period_from": node.start,
+            "period_to": node.end,
+            **node.rollup,
+        }
+        if insert is None:
+            row = db.execute(
+                select(PeriodRollup).where(
+                    PeriodRollup.user_id == user_id,
+                    PeriodRollup.unit == node.unit,
+                    PeriodRollup.period_from == node.start,
+                    PeriodRollup.period_to == node.end,
+                )
+            ).scalar_one_or_none()
+            if row is None:
+                db.add(PeriodRollup(**values))
+            else:
+                for field_name in ROLLUP_FIELDS:
+                    setattr(row, field_name, values[field_name])
+            continue
+        stmt = insert(PeriodRollup).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "unit", "period_from", "period_to"],
+            set_={field_name: stmt.excluded[field_name] for field_name in ROLLUP_FIELDS},
+        )
+        db.execute(stmt)
+    db.commit()
+
+
+def _clip(value: object, length: int) -> Optional[str]:
+    return str(value)[:length] if value else None
+
+
+async def _summarize_rollups(nodes: list[_RollupNode], prompts: list[tuple[dict, str]]) -> None:
+    limiter = asyncio.Semaphore(ROLLUP_CONCURRENCY)
+
+    async def summarize(node: _RollupNode, stats: dict, prompt: str) -> None:
+        async with limiter:
+            data = await _complete_json(prompt, "rollup", f"{node.unit} rollup")
+        node.rollup = {
+            "input_digest": node.digest,
+            "entry_count": len(node.refs),
+            "stats": stats,
+            "summary": data.get("summary", ""),
+            "key_insights": data.get("key_insights", []),
+            "emotional_trend": _clip(data.get("emotional_trend"), 16),
+            "language": _clip(data.get("language"), 8),
+            "created_at": utc_now(),
+        }
+        metrics.increment("insights.rollups.computed")
+
+    await asyncio.gather(*(summarize(node, stats, prompt) for node, (stats, prompt) in zip(nodes, prompts)))
+
+
+async def _build_rollup_prompt(
+    user_id: int, period_from: datetime, period_to: datetime, units: tuple[str, ...], db: Session
+) -> tuple[str, str]:
+    """Render the period prompt from sub-period rollups, refreshing only the stale ones.
+
+    Returns the prompt and the digest of the period's entries.
+    """
+    refs, stored = await run_in_threadpool(_load_rollup_inputs, db, user_id, period_from, period_to)
+    if not refs:
+        raise ValueError("No entries found for this period")
+
+    top = _plan_rollups(period_from, period_to, units, refs)
+    levels: list[list[_RollupNode]] = []
+    _collect_stale(top, stored, levels)
+
+    # Deepest level first, so every parent sees fresh child rollups.
+    for nodes in reversed(levels):
+        leaves = [node for node in nodes if not node.children]
+        parents = [node for node in nodes if node.children]
+        prompts = await run_in_threadpool(_prepare_leaf_prompts, db, user_id, leaves)
+        prompts += [
+            (
+                _merge_stats([child.rollup["stats"] for child in node.children]),
+                _render_rollup_prompt(node.children, node.children[0].unit, node.start, node.end),
+            )
+            for node in parents
+        ]
+        await _summarize_rollups(leaves + parents, prompts)
+        await run_in_threadpool(_store_rollups, db, user_id, leaves + parents)
+
+    return _render_rollup_prompt(top, units[-1], period_from, period_to), entry_set_digest(refs)
+
+
+async def generate_period_insight(
+    user_id: int,
+    period_from: datetime,
+    period_to: datetime,
+    timeframe: Literal["week", "month", "year", "custom"],
+) -> Insight:
+    """Generate an aggregated insight for a time period.
+
+    Concurrent calls for the same period share one LLM request and return the same row,
+    which is detached from any session (see :func:`generate_entry_insight`).
+    """
+    key = ("period", user_id, timeframe, period_from, period_to)
+    return await _generations.run(
+        key,
+        _in_own_session(lambda db: _generate_period_insight(user_id, period_from, period_to, timeframe, db)),
+    )
+
+
+async def _generate_period_insight(
+    user_id: int,
+    period_from: datetime,
+    period_to: datetime,
+    timeframe: Literal["week", "month", "year", "custom"],
+    db: Session,
+) -> Insight:
+    prompt, input_digest = await _prepare_period_prompt(user_id, period_from, period_to, timeframe, db)
+    data = await _complete_json(prompt, "period_insight", "period")
+    values = _period_insight_values(user_id, period_from, period_to, timeframe, data, input_digest)
+    return await run_in_threadpool(_upsert_insight, db, values)
+
 
+async def _prepare_period_prompt(
+    user_id: int, period_from: datetime, period_to: datetime, timeframe: str, db: Session
+) -> tuple[str, str]:
+    units = _rollup_units(timeframe, period_from, period_to)
+    if units:
+        return await _build_rollup_prompt(user_id, period_from, period_to, units, db)
+    return await run_in_threadpool(_build_period_prompt, user_id, period_from, period_to, db)
+
+
+def _period_insight_values(
+    user_id: int,
+    period_from: datetime,
+    period_to: datetime,
+    timeframe: str,
+    data: dict,
+    input_digest: str,
+) -> dict:
     language = data.get("language", "ru")
     summary = data.get("summary", "")
     key_insights = data.get("key_insights", [])
@@ -251,7 +709,7 @@ Top tags: {', '.join([t['tag'] for t in top_tags[:5]])}
         "focus_recommendations": focus_recommendations,
     }
 
-    insight = Insight(
+    return dict(
         user_id=user_id,
         scope="period",
         period_from=period_from,
@@ -261,9 +719,239 @@ Top tags: {', '.join([t['tag'] for t in top_tags[:5]])}
         summary=summary,
         details=details,
         meta=meta,
+        input_digest=input_digest,
     )
-    db.add(insight)
-    db.commit()
-    db.refresh(insight)
-    return insight
 
+
+# ---------------------------------------------------------------------------
+# Streaming
+#
+# The streaming generators yield ``{"type": "delta", "text": ...}`` for every
+# chunk of the LLM reply and finish with ``{"type": "insight", "insight": row}``
+# once the parsed reply is stored, exactly like the non-streaming generators.
+# ---------------------------------------------------------------------------
+
+
+async def stream_entry_insight(entry_id: UUID, user_id: int) -> AsyncIterator[dict]:
+    """Generate an entry insight, yielding the LLM reply as it is written.
+
+    Shares the single-flight key of :func:`generate_entry_insight`, so concurrent
+    viewers of one entry are served by a single generation.
+    """
+
+    async def regenerate(db: Session, on_delta: Optional[Callable[[str], None]]) -> Insight:
+        entry = await run_in_threadpool(db.get, Entry, entry_id)
+        if entry is None:
+            raise LookupError(f"Entry {entry_id} no longer exists")
+        prompt = await run_in_threadpool(_build_entry_prompt, entry)
+        mood_label = entry.mood_label
+        data = await _stream_json(prompt, "entry_insight", lambda: _mock_entry_insight(mood_label), on_delta)
+        return await run_in_threadpool(store_entry_insight, entry, data, db)
+
+    async for event in _stream_generation(("entry", user_id, entry_id), regenerate):
+        yield event
+
+
+async def stream_period_insight(
+    user_id: int,
+    period_from: datetime,
+    period_to: datetime,
+    timeframe: Literal["week", "month", "year", "custom"],
+) -> AsyncIterator[dict]:
+    """Generate a period insight, yielding the LLM reply as it is written.
+
+    Stale sub-period rollups are refreshed before the first chunk is sent. Shares
+    the single-flight key of :func:`generate_period_insight`.
+    """
+
+    async def regenerate(db: Session, on_delta: Optional[Callable[[str], None]]) -> Insight:
+        prompt, input_digest = await _prepare_period_prompt(user_id, period_from, period_to, timeframe, db)
+        data = await _stream_json(prompt, "period_insight", _mock_period_insight, on_delta)
+        values = _period_insight_values(user_id, period_from, period_to, timeframe, data, input_digest)
+        return await run_in_threadpool(_upsert_insight, db, values)
+
+    key = ("period", user_id, timeframe, period_from, period_to)
+    async for event in _stream_generation(key, regenerate):
+        yield event
+
+
+class _DeltaFeed:
+    """Fans the deltas of one streamed generation out to every viewer; late viewers replay from the start."""
+
+    def __init__(self) -> None:
+        self._chunks: list[str] = []
+        self._subscribers: list[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in self._chunks:
+            queue.put_nowait(chunk)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def push(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        for queue in self._subscribers:
+            queue.put_nowait(chunk)
+
+    def close(self) -> None:
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+
+# Feeds of the streamed generations in flight, under their ``_generations`` key.
+_feeds: dict[tuple, _DeltaFeed] = {}
+
+
+async def _stream_generation(
+    key: tuple, generate: Callable[[Session, Optional[Callable[[str], None]]], Awaitable[Insight]]
+) -> AsyncIterator[dict]:
+    """Yield delta events of the generation for *key*, then the stored insight.
+
+    Runs under ``_generations`` in a session of its own. A viewer joining a
+    streamed generation replays its deltas; one joining a non-streaming generation
+    (a foreground request or a background refresh) only receives the insight.
+    """
+    feed = _feeds.get(key)
+    if feed is None and not _generations.running(key):
+        feed = _feeds[key] = _DeltaFeed()
+        producer = feed
+
+        async def produce(db: Session) -> Insight:
+            try:
+                return await generate(db, producer.push)
+            finally:
+                producer.close()
+                _feeds.pop(key, None)
+
+        factory = _in_own_session(produce)
+    else:
+        factory = _in_own_session(lambda db: generate(db, None))
+
+    queue = feed.subscribe() if feed is not None else None
+    flight = asyncio.ensure_future(_generations.run(key, factory))
+    try:
+        if queue is not None:
+            while (chunk := await queue.get()) is not None:
+                yield {"type": "delta", "text": chunk}
+        yield {"type": "insight", "insight": await flight}
+    finally:
+        if feed is not None and queue is not None:
+            feed.unsubscribe(queue)
+        if not flight.done():
+            flight.cancel()  # only this viewer's wait; the shared generation is shielded
+        elif not flight.cancelled():
+            flight.exception()
+
+
+async def _stream_json(
+    prompt: str, task: Task, mock_reply: Callable[[], dict], on_delta: Optional[Callable[[str], None]]
+) -> dict:
+    """Stream the JSON completion for *prompt*, passing each chunk to *on_delta*, and parse it."""
+    content: list[str] = []
+    async for delta in stream_chat_completion(
+        INSIGHT_SYSTEM_PROMPT,
+        prompt,
+        task=task,
+        temperature=INSIGHT_TEMPERATURE,
+        json_mode=True,
+        mock_response=lambda: json.dumps(mock_reply(), ensure_ascii=False),
+    ):
+        content.append(delta)
+        if on_delta is not None:
+            on_delta(delta)
+    return _parse_json_reply("".join(content))
+
+
+def _mock_entry_insight(mood_label: str) -> dict:
+    return {
+        "summary": "Запись о том, что сейчас занимает твои мысли.",
+        "bullets": ["Ты замечаешь свои чувства.", "Тебе важно быть услышанным."],
+        "suggestion": "Что могло бы поддержать тебя завтра?",
+        "mood_trend": "negative" if mood_label in {"anxious", "sad", "angry"} else "neutral",
+        "confidence": 0.5,
+        "top_topics": [],
+        "language": "ru",
+    }
+
+
+def _mock_period_insight() -> dict:
+    return {
+        "summary": "За этот период ты часто возвращался к похожим темам.",
+        "key_insights": ["Записи становятся регулярнее."],
+        "emotional_trend": "stable",
+        "focus_recommendations": ["Отмечай моменты отдыха."],
+        "top_tags": [],
+        "language": "ru",
+    }
+
+
+# ---------------------------------------------------------------------------
+# Stale-while-revalidate
+#
+# Readers compare a stored insight's ``input_digest`` with the digest of the
+# entries it would be built from today. A stale insight can be served at once
+# while one of these background refreshes regenerates it; the refresh shares the
+# ``SingleFlight`` key of a foreground generation, so either one does the work.
+# ---------------------------------------------------------------------------
+
+_refreshes: set[asyncio.Task] = set()
+
+
+def schedule_entry_refresh(entry_id: UUID, user_id: int) -> None:
+    """Regenerate a stale entry insight in the background."""
+
+    async def regenerate(db: Session) -> Optional[Insight]:
+        entry = await run_in_threadpool(db.get, Entry, entry_id)
+        return await _generate_entry_insight(entry, db) if entry is not None else None
+
+    _schedule_refresh(("entry", user_id, entry_id), regenerate)
+
+
+def schedule_period_refresh(
+    user_id: int,
+    period_from: datetime,
+    period_to: datetime,
+    timeframe: Literal["week", "month", "year", "custom"],
+) -> None:
+    """Regenerate a stale period insight in the background."""
+    _schedule_refresh(
+        ("period", user_id, timeframe, period_from, period_to),
+        lambda db: _generate_period_insight(user_id, period_from, period_to, timeframe, db),
+    )
+
+
+def _in_own_session(generate: Callable[[Session], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+    """Wrap *generate* for ``_generations.run`` so the flight opens and closes its own session.
+
+    A flight is shielded from its callers and outlives any one of them, so it must
+    not use a request's session: that is closed, or in use by another coroutine,
+    while the generation is still running.
+    """
+
+    async def with_session() -> T:
+        db = SessionLocal()
+        try:
+            return await generate(db)
+        finally:
+            await run_in_threadpool(db.close)
+
+    return with_session
+
+
+def _schedule_refresh(key: tuple, generate: Callable[[Session], Awaitable[Optional[Insight]]]) -> None:
+    async def refresh() -> None:
+        try:
+            await _generations.run(key, _in_own_session(generate))
+        except Exception:
+            metrics.increment("insights.refresh_failures")
+            logger.exception(f"Background refresh failed for insight {key!r}")
+
+    metrics.increment("insights.refreshes")
+    task = asyncio.get_running_loop().create_task(refresh())
+    _refreshes.add(task)
+    task.add_done_callback(_refreshes.discard)
@@ -0,0 +1,410 @@
+"""Background job execution for long-running pipelines.
+
+``WorkerPool`` is a bounded thread pool that tracks queue depth, active workers
+and throughput in the metrics registry. ``TranscriptionJobQueue`` builds on it to
+run the transcription pipeline asynchronously: uploads are spooled to disk and
+job state lives in the ``transcription_jobs`` table.
+
+Every queued or running job is leased to the process that holds it; a heartbeat
+thread renews the process's leases, and any process takes over jobs whose lease
+has expired, so work of a crashed worker is resumed without two workers ever
+running the same job.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import shutil
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Deque, Optional
+from uuid import UUID, uuid4
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..core.config import get_settings
+from ..core.database import SessionLocal, utc_now
+from ..core.metrics import metrics
+from ..models import TranscriptionJob
+from .governor import ProviderThrottledError
+from .transcoder import TranscoderBusyError
+from .transcription import transcribe_upload
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"done", "failed"}
+ACTIVE_STATUSES = ("queued", "running")
+MAX_ATTEMPTS = 3
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a worker pool has no room for more queued work."""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"{pool_name} queue is full")
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    """Bounded thread pool with queue-depth and throughput accounting."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completions: Deque[float] = deque()
+
+        metrics.register_gauge(f"{name}.queued", lambda: self._queued)
+        metrics.register_gauge(f"{name}.active", lambda: self._active)
+        metrics.register_gauge(f"{name}.throughput_per_minute", self.throughput_per_minute)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def has_capacity(self) -> bool:
+        return self._queued < self.max_queue
+
+    def retry_after_seconds(self) -> int:
+        """Rough time until a queue slot frees up, used for ``Retry-After``."""
+        mean_duration = metrics.mean(f"{self.name}.duration_seconds", default=1.0)
+        return max(1, math.ceil(mean_duration * (self._queued + 1) / self.max_workers))
+
+    def submit(self, fn: Callable[..., Any], *args: Any, force: bool = False) -> Future:
+        """Queue *fn* for execution; raises :class:`QueueFullError` when saturated.
+
+        ``force`` bypasses the queue bound (used when recovering persisted work).
+        """
+        with self._lock:
+            saturated = not force and self._queued >= self.max_queue
+            if not saturated:
+                self._queued += 1
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=self.name
+                    )
+                executor = self._executor
+        if saturated:
+            metrics.increment(f"{self.name}.rejected")
+            raise QueueFullError(self.name, self.retry_after_seconds())
+        return executor.submit(self._run, fn, args)
+
+    def _run(self, fn: Callable[..., Any], args: tuple) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        started = time.perf_counter()
+        try:
+            result = fn(*args)
+            metrics.increment(f"{self.name}.completed")
+            return result
+        except Exception:
+            metrics.increment(f"{self.name}.failed")
+            logger.exception("Job failed in worker pool %s", self.name)
+            raise
+        finally:
+            metrics.observe(f"{self.name}.duration_seconds", time.perf_counter() - started)
+            with self._lock:
+                self._active -= 1
+                self._completions.append(time.monotonic())
+
+    def throughput_per_minute(self) -> float:
+        cutoff = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+        with self._lock:
+            while self._completions and self._completions[0] < cutoff:
+                self._completions.popleft()
+            return len(self._completions) * 60.0 / THROUGHPUT_WINDOW_SECONDS
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class TranscriptionJobQueue:
+    """Persisted queue of transcription jobs processed by a :class:`WorkerPool`."""
+
+    def __init__(
+        self,
+        *,
+        spool_dir: Path,
+        max_workers: int,
+        max_queue: int,
+        lease_seconds: float = 60.0,
+        session_factory: sessionmaker | Callable[[], Session] = SessionLocal,
+    ):
+        self.spool_dir = spool_dir
+        self.lease_seconds = lease_seconds
+        self.session_factory = session_factory
+        self.pool = WorkerPool("transcribe_jobs", max_workers=max_workers, max_queue=max_queue)
+        self.worker_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._heartbeat_lock = threading.Lock()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def enqueue(self, upload: BinaryIO, file_ext: str) -> TranscriptionJob:
+        """Spool *upload* to disk, persist a queued job and hand it to the pool."""
+        if not self.pool.has_capacity():
+            metrics.increment(f"{self.pool.name}.rejected")
+            raise QueueFullError(self.pool.name, self.pool.retry_after_seconds())
+        self._start_heartbeat()
+
+        job_id = uuid4()
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        spool_path = self.spool_dir / f"{job_id}{file_ext}"
+        persisted = False
+        try:
+            with open(spool_path, "wb") as spool_file:
+                shutil.copyfileobj(upload, spool_file)
+            with self.session_factory() as db:
+                job = TranscriptionJob(
+                    id=job_id, status="queued", file_ext=file_ext, spool_path=str(spool_path), **self._lease()
+                )
+                db.add(job)
+                db.commit()
+                db.refresh(job)
+            persisted = True
+        finally:
+            if not persisted:
+                spool_path.unlink(missing_ok=True)
+
+        try:
+            self.pool.submit(self._process, job_id)
+        except QueueFullError:
+            self._finish(job_id, status="failed", error="Job queue is full")
+            raise
+        return job
+
+    def get(self, job_id: UUID) -> Optional[TranscriptionJob]:
+        with self.session_factory() as db:
+            return db.get(TranscriptionJob, job_id)
+
+    async def wait(self, job_id: UUID, timeout: float, poll_interval: float = 0.5) -> Optional[TranscriptionJob]:
+        """Long-poll until the job finishes or *timeout* seconds elapse.
+
+        Reads go to the database so this works no matter which process runs the job.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await run_in_threadpool(self.get, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.status in TERMINAL_STATUSES or remaining <= 0:
+                return job
+            await asyncio.sleep(min(poll_interval, remaining))
+
+    def recover(self) -> int:
+        """Take over queued or running jobs whose lease has expired and queue them here.
+
+        Runs at startup and on every heartbeat. Each job is claimed with a
+        conditional update, so when several workers recover at once only one of
+        them gets it; jobs leased by a live worker are left alone.
+        """
+        self._start_heartbeat()
+        unleased = or_(TranscriptionJob.lease_expires_at.is_(None), TranscriptionJob.lease_expires_at < utc_now())
+        with self.session_factory() as db:
+            candidates = db.execute(
+                select(TranscriptionJob.id)
+                .where(TranscriptionJob.status.in_(ACTIVE_STATUSES), unleased)
+                .order_by(TranscriptionJob.created_at.asc())
+            ).scalars().all()
+
+            requeued = []
+            for job_id in candidates:
+                claim = (
+                    update(TranscriptionJob)
+                    .where(TranscriptionJob.id == job_id, TranscriptionJob.status.in_(ACTIVE_STATUSES), unleased)
+                    .values(status="queued", **self._lease())
+                    .execution_options(synchronize_session=False)
+                )
+                claimed = db.execute(claim).rowcount
+                db.commit()
+                if not claimed:
+                    continue
+                job = db.get(TranscriptionJob, job_id, populate_existing=True)
+                if job.attempts >= MAX_ATTEMPTS:
+                    job.status, job.error = "failed", f"Gave up after {job.attempts} attempts"
+                    job.finished_at, job.lease_owner, job.lease_expires_at = utc_now(), None, None
+                elif not job.spool_path or not Path(job.spool_path).exists():
+                    job.status, job.error = "failed", "Spooled audio is missing"
+                    job.finished_at, job.lease_owner, job.lease_expires_at = utc_now(), None, None
+                else:
+                    requeued.append(job_id)
+                db.commit()
+
+        for job_id in requeued:
+            self.pool.submit(self._process, job_id, force=True)
+        if requeued:
+            logger.info(f"Recovered {len(requeued)} transcription job(s)")
+        return len(requeued)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop the heartbeat and the pool, and hand jobs that never started back to other workers."""
+        self._stopping.set()
+        with self._heartbeat_lock:
+            thread, self._heartbeat_thread = self._heartbeat_thread, None
+        if thread is not None:
+            thread.join()
+        self.pool.shutdown(wait=wait)
+        if thread is None:
+            return
+        with self.session_factory() as db:
+            db.execute(
+                update(TranscriptionJob)
+                .where(TranscriptionJob.lease_owner == self.worker_id, TranscriptionJob.status == "queued")
+                .values(lease_owner=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+    def _lease(self) -> dict:
+        return {"lease_owner": self.worker_id, "lease_expires_at": utc_now() + timedelta(seconds=self.lease_seconds)}
+
+    def _start_heartbeat(self) -> None:
+        with self._heartbeat_lock:
+            if self._heartbeat_thread is None and not self._stopping.is_set():
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat, name=f"{self.pool.name}-heartbeat", daemon=True
+                )
+                self._heartbeat_thread.start()
+
+    def _heartbeat(self) -> None:
+        """Renew this worker's leases and take over expired ones every third of a lease."""
+        while not self._stopping.wait(self.lease_seconds / 3):
+            try:
+                with self.session_factory() as db:
+                    db.execute(
+                        update(TranscriptionJob)
+                        .where(
+                            TranscriptionJob.lease_owner == self.worker_id,
+                            TranscriptionJob.status.in_(ACTIVE_STATUSES),
+                        )
+                        .values(lease_expires_at=self._lease()["lease_expires_at"])
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.commit()
+                self.recover()
+            except Exception:
+                metrics.increment(f"{self.pool.name}.heartbeat_failures")
+                logger.exception("Transcription job heartbeat failed")
+
+    def _process(self, job_id: UUID) -> None:
+        with self.session_factory() as db:
+            # Claim the job atomically; it may have been taken over by another worker.
+            claim = (
+                update(TranscriptionJob)
+                .where(
+                    TranscriptionJob.id == job_id,
+                    TranscriptionJob.status == "queued",
+                    TranscriptionJob.lease_owner == self.worker_id,
+                )
+                .values(status="running", started_at=utc_now(), attempts=TranscriptionJob.attempts + 1, **self._lease())
+                .execution_options(synchronize_session=False)
+            )
+            claimed = db.execute(claim).rowcount
+            db.commit()
+            if not claimed:
+                metrics.increment(f"{self.pool.name}.claim_lost")
+                return
+            job = db.get(TranscriptionJob, job_id)
+            spool_path, file_ext = job.spool_path, job.file_ext
+
+        try:
+            with open(spool_path, "rb") as upload:
+                result = transcribe_upload(upload, file_ext)
+        except (TranscoderBusyError, ProviderThrottledError) as exc:
+            self._requeue(job_id, delay=exc.retry_after)
+            return
+        except Exception as exc:
+            self._finish(job_id, status="failed", error=str(exc) or exc.__class__.__name__)
+            raise
+        self._finish(job_id, status="done", text=result.text, language=result.language)
+
+    def _requeue(self, job_id: UUID, delay: float) -> None:
+        """Put a job back in the queue after *delay* seconds, or fail it after ``MAX_ATTEMPTS``.
+
+        Used when the transcoder is saturated or the STT provider keeps throttling;
+        the job stays ``queued`` and leased to this worker in the database, so it is
+        taken over by another worker if this process exits first.
+        """
+        with self.session_factory() as db:
+            job = db.get(TranscriptionJob, job_id)
+            if job is None or job.lease_owner != self.worker_id:
+                return
+            attempts = job.attempts
+            if attempts < MAX_ATTEMPTS:
+                job.status = "queued"
+                db.commit()
+        if attempts >= MAX_ATTEMPTS:
+            self._finish(job_id, status="failed", error=f"Gave up after {attempts} attempts: provider busy")
+            return
+
+        metrics.increment(f"{self.pool.name}.requeued")
+        timer = threading.Timer(delay, self.pool.submit, args=(self._process, job_id), kwargs={"force": True})
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, job_id: UUID, *, status: str, **fields: Optional[str]) -> None:
+        spool_path: Optional[str] = None
+        try:
+            with self.session_factory() as db:
+                job = db.get(TranscriptionJob, job_id)
+                if job is None or job.lease_owner != self.worker_id:
+                    return  # taken over by another worker, which now owns the spooled audio
+                spool_path, job.spool_path = job.spool_path, None
+                job.status = status
+                job.finished_at = utc_now()
+                job.lease_owner, job.lease_expires_at = None, None
+                for name, value in fields.items():
+                    setattr(job, name, value)
+                db.commit()
+        finally:
+            # The spooled audio is private; never leave it behind, even if the update fails.
+            if spool_path:
+                Path(spool_path).unlink(missing_ok=True)
+
+
+_queue: Optional[TranscriptionJobQueue] = None
+
+
+def get_job_queue() -> TranscriptionJobQueue:
+    global _queue
+    if _queue is None:
+        settings = get_settings()
+        spool_dir = settings.job_spool_dir.resolve()
+        if not settings.media_base_url.startswith("http") and spool_dir.is_relative_to(settings.media_root.resolve()):
+            # MEDIA_ROOT is served publicly as static files; spooled uploads must not be.
+            raise ValueError(f"JOB_SPOOL_DIR {spool_dir} must be outside MEDIA_ROOT")
+        _queue = TranscriptionJobQueue(
+            spool_dir=spool_dir,
+            max_workers=settings.transcribe_job_workers,
+            max_queue=settings.transcribe_job_queue_size,
+            lease_seconds=settings.transcribe_job_lease_seconds,
+        )
+    return _queue
+
+
+def reset_job_queue() -> None:
+    global _queue
+    if _queue is not None:
+        _queue.shutdown(wait=False)
+    _queue = None
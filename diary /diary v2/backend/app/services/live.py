@@ -0,0 +1,125 @@
+"""Live transcription of audio streamed while the user is still recording.
+
+Clients push raw 16 kHz mono pcm_s16le chunks. Whenever the buffered audio ends
+in a pause (or grows past the maximum segment length) the buffer is cut into a
+segment that is transcribed and formatted in the background, so by the time the
+user stops recording only the last few seconds are still in flight.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+from .audio import FRAME_MS, SAMPLE_WIDTH, TARGET_SAMPLE_RATE, PcmAudio
+from .chunking import split_at_silence, stitch_transcripts
+from .llm import format_transcript
+from .providers import STTProvider, build_stt_provider
+from .transcription import transcribe_pcm_segment
+from .vad import detect_speech
+
+logger = logging.getLogger(__name__)
+
+SendFn = Callable[[dict], Awaitable[None]]
+
+
+class LiveTranscriptionSession:
+    """Segments an incoming PCM stream and transcribes segments concurrently.
+
+    Messages sent through *send*:
+
+    - ``{"type": "partial", "index": i, "text": raw}`` once segment *i* is transcribed
+    - ``{"type": "formatted", "index": i, "text": formatted}`` once it is formatted
+    - ``{"type": "error", "index": i, "detail": message}`` if a segment fails
+    """
+
+    def __init__(self, send: SendFn, stt_provider: Optional[STTProvider] = None):
+        settings = get_settings()
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self._stt = stt_provider or build_stt_provider()
+        self._buffer = bytearray()
+        self._tasks: list[asyncio.Task] = []
+        self._raw: dict[int, str] = {}
+        self._formatted: dict[int, str] = {}
+        self._min_bytes = int(settings.live_segment_min_seconds * TARGET_SAMPLE_RATE) * SAMPLE_WIDTH
+        self._max_seconds = settings.stt_segment_max_seconds
+        self._pause_frames = max(1, settings.live_segment_pause_ms // FRAME_MS)
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._tasks)
+
+    async def feed(self, chunk: bytes) -> None:
+        """Append a PCM chunk and dispatch any segments that are now complete."""
+        self._buffer.extend(chunk)
+        while (cut := self._find_cut()) is not None:
+            self._dispatch(cut)
+
+    async def finish(self) -> dict:
+        """Flush the remaining audio, wait for every segment and return the final result."""
+        aligned = len(self._buffer) - len(self._buffer) % SAMPLE_WIDTH
+        if aligned:
+            self._dispatch(aligned)
+        self._buffer.clear()
+        await asyncio.gather(*self._tasks)
+
+        order = range(len(self._tasks))
+        raw = stitch_transcripts([self._raw[i] for i in order if i in self._raw])
+        text = "\n\n".join(self._formatted[i] for i in order if self._formatted.get(i))
+        return {"type": "final", "text": text, "raw": raw, "segments": len(self._tasks)}
+
+    async def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _find_cut(self) -> Optional[int]:
+        """Return the byte offset to cut the buffer at, or ``None`` to keep buffering."""
+        if len(self._buffer) < self._min_bytes:
+            return None
+
+        pcm = PcmAudio(samples=bytes(self._buffer[: len(self._buffer) - len(self._buffer) % SAMPLE_WIDTH]))
+        if pcm.duration_seconds >= self._max_seconds:
+            first = split_at_silence(pcm, max_seconds=self._max_seconds)[0]
+            return len(first.samples)
+
+        speech = detect_speech(pcm)
+        if len(speech) >= self._pause_frames and not speech[-self._pause_frames :].any():
+            return len(pcm.samples)
+        return None
+
+    def _dispatch(self, cut: int) -> None:
+        segment = PcmAudio(samples=bytes(self._buffer[:cut]))
+        del self._buffer[:cut]
+        index = len(self._tasks)
+        self._tasks.append(asyncio.create_task(self._process(index, segment)))
+        metrics.increment("live.segments")
+
+    async def _process(self, index: int, segment: PcmAudio) -> None:
+        if not detect_speech(segment).any():
+            metrics.increment("live.silent_segments_skipped")
+            return
+        try:
+            with metrics.timer("live.segment_stt_seconds"):
+                raw = await run_in_threadpool(transcribe_pcm_segment, self._stt, segment)
+            self._raw[index] = raw.strip()
+            await self._emit({"type": "partial", "index": index, "text": self._raw[index]})
+
+            if self._raw[index]:
+                formatted = await run_in_threadpool(format_transcript, self._raw[index])
+                self._formatted[index] = formatted.strip() or self._raw[index]
+                await self._emit({"type": "formatted", "index": index, "text": self._formatted[index]})
+        except Exception as exc:
+            logger.exception(f"Live transcription failed for segment {index}")
+            metrics.increment("live.segment_errors")
+            await self._emit({"type": "error", "index": index, "detail": str(exc)})
+
+    async def _emit(self, message: dict) -> None:
+        async with self._send_lock:
+            await self._send(message)
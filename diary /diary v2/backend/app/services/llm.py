@@ -3,12 +3,24 @@ from __future__ import annotations
 """LLM analysis service built on pluggable providers."""
 
 import logging
-from typing import Optional
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from functools import partial
+from typing import Any, Callable, Iterator, List, Optional, Union
 
-from openai import OpenAI, OpenAIError
+from openai import OpenAIError
 
 from ..core.config import get_settings
-from .providers import LLMProvider, build_llm_provider
+from ..core.metrics import metrics
+from .batching import MicroBatcher, batch_prompt, run_batch
+from .chunking import split_text_spans, text_tail
+from .clients import get_openai_client
+from .governor import get_governor
+from .model_router import ModelRoute, observe_latency, route, routing_signature
+from .llm_cache import llm_cache_key, lookup_llm_response, store_llm_response
+from .providers import LLMProvider, OpenAILLMProvider, build_llm_provider, mock_format_text, parse_json_content
+from .streaming import completion_delta, mock_chunks
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +38,9 @@ Transcript (in language that is spoken)):
 {transcript}
 """
 
+# Very low temperature for maximum consistency and preservation
+FORMATTING_TEMPERATURE = 0.1
+
 TRANSCRIPT_FORMATTING_PROMPT = """You receive a raw transcript from automatic speech recognition.
 
 The text may contain multiple languages in one message (code-switching).
@@ -59,6 +74,51 @@ Do NOT add commentary, explanations, or interpretations.
 
 Output ONLY the final cleaned diary text with ALL languages preserved in their original order, nothing else."""
 
+# Appended to the formatting prompt when a long transcript is formatted in chunks.
+CHUNK_CONTEXT_INSTRUCTIONS = """
+
+This transcript is long and is formatted in parts. The user message contains <context>, the end of the previous
+part, followed by <part>, the text to format. Use the context only to continue sentences and style naturally;
+do NOT output it. Output ONLY the formatted text of <part>, without the tags."""
+
+_PART_TAGS = re.compile(r"</?part>")
+
+
+FORMAT_AND_ANALYZE_PROMPT = """You receive a raw transcript of a personal voice diary entry from automatic speech recognition.
+Do three things in one pass and return a single valid JSON object.
+
+1. formatted_text – the cleaned transcript:
+- Preserve every word, in every language, exactly as in the original; the text may switch languages mid-sentence.
+- Do NOT translate, summarize, shorten, merge languages or drop sentences.
+- Only fix spacing, add natural punctuation and capitalization, and smooth out stutters and filler words.
+- Use punctuation to reflect intonation (long pauses → "…", abrupt shifts → "—"). Do NOT add labels like (laughs) or commentary.
+
+2. Analysis of the entry:
+- title – short, 3–7 words, like a journal entry title.
+- mood_label – one word in English describing the dominant mood (e.g. "anxious", "calm", "angry", "sad", "hopeful").
+- tags – 2–6 short tags (1–2 words each), summarizing topics and feelings.
+- insights – 2–3 short supportive observations in the language of the transcript, without medical terms or diagnoses.
+
+3. insight – a gentle, non-therapeutic reflection on the entry, in the language of the transcript.
+
+Return exactly these fields:
+{
+  "formatted_text": "...",
+  "title": "...",
+  "mood_label": "...",
+  "tags": ["..."],
+  "insights": ["..."],
+  "insight": {
+    "summary": "1-2 sentence summary of what this entry is about",
+    "bullets": ["insight 1", "insight 2", "insight 3"],
+    "suggestion": "one gentle suggestion or reflection question",
+    "mood_trend": "neutral | positive | negative",
+    "confidence": 0.0-1.0,
+    "top_topics": ["topic1", "topic2"],
+    "language": "detected language code (e.g., ru, en, uk)"
+  }
+}"""
+
 
 def analyze_transcript(transcript: str) -> dict:
     """Return structured data extracted from *transcript*.
@@ -86,80 +146,344 @@ def format_transcript(raw_text: str, language: str | None = None) -> str:
     Raises:
         RuntimeError: If LLM formatting fails
     """
+    formatted, _ = format_transcript_checked(raw_text)
+    return formatted
+
+
+def format_transcript_checked(raw_text: str) -> tuple[str, bool]:
+    """Like :func:`format_transcript`, also returning whether the result is degraded.
+
+    A result is degraded when the formatting was enabled but did not fully apply:
+    the raw text served after a failed or empty reply, a chunk that kept its raw
+    text, or a reply that fails the dropped-content check. Callers should not
+    cache degraded results.
+    """
     settings = get_settings()
     
     # Safety bypass: if formatting is disabled, return raw transcript as-is
     if not settings.transcript_formatting_enabled:
         logger.info("Transcript formatting is disabled, returning raw transcript")
-        return raw_text.strip()
-    
-    # Use the prompt as-is (it already instructs to preserve original language)
-    prompt = TRANSCRIPT_FORMATTING_PROMPT
+        return raw_text.strip(), False
     
     # For mock provider, return cleaned version of mock text
     if settings.llm_provider == "mock":
-        # Simple mock formatting: capitalize first letter, add period if missing
-        formatted = raw_text.strip()
-        if formatted and not formatted.endswith((".", "!", "?", "…")):
-            formatted += "."
-        if formatted:
-            formatted = formatted[0].upper() + formatted[1:] if len(formatted) > 1 else formatted.upper()
-        return formatted
+        return mock_format_text(raw_text), False
     
     # Use OpenAI for real formatting
     if settings.llm_provider == "openai":
         if not settings.openai_api_key:
             logger.warning("No OpenAI API key, returning raw transcript without formatting")
-            return raw_text
+            return raw_text, True
         
+        decision = route("format", len(raw_text))
+        chunked = _needs_chunking(raw_text)
+        key = _formatting_cache_key(raw_text, decision.model, chunked=chunked)
+
         try:
-            client = OpenAI(api_key=settings.openai_api_key)
-            completion = client.chat.completions.create(
-                model=settings.openai_llm_model,
-                temperature=0.1,  # Very low temperature for maximum consistency and preservation
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": raw_text},
-                ],
-            )
-            
-            formatted = completion.choices[0].message.content
+            degraded = False
+            formatted = lookup_llm_response("format_transcript", key)
+            if formatted is None:
+                if chunked:
+                    formatted, degraded = _format_in_chunks(raw_text)
+                elif (batcher := _get_format_batcher(decision.model)) is not None:
+                    formatted = batcher.submit(raw_text)
+                else:
+                    formatted = _request_formatting(raw_text, decision)
+                # Raw-text fallbacks and suspiciously short results are served but not cached.
+                if formatted and not degraded and not _dropped_content(raw_text, formatted.strip()):
+                    store_llm_response(key, formatted)
             if not formatted:
                 logger.warning("LLM returned empty formatted text, using raw transcript")
-                return raw_text
+                return raw_text, True
             
             # Do NOT aggressively trim - preserve the full text
             formatted = formatted.strip()
             
             # Log if significant content was lost (safety check)
-            if len(formatted) < len(raw_text) * 0.5:
+            if _dropped_content(raw_text, formatted):
                 logger.warning(
                     f"Formatted transcript is significantly shorter than raw: "
                     f"raw={len(raw_text)} chars, formatted={len(formatted)} chars. "
                     f"This may indicate content was dropped."
                 )
+                degraded = True
             
-            return formatted
+            return formatted, degraded
             
         except OpenAIError as exc:
             logger.exception(f"OpenAI formatting failed: {exc}")
             # Fallback to raw text if formatting fails
             logger.warning("Falling back to raw transcript due to formatting error")
-            return raw_text
+            return raw_text, True
         except Exception as exc:
             logger.exception(f"Unexpected error during transcript formatting: {exc}")
-            return raw_text
+            return raw_text, True
     
     # Unknown provider, return raw
     logger.warning(f"Unknown LLM provider '{settings.llm_provider}', returning raw transcript")
-    return raw_text
+    return raw_text, True
+
+
+def _dropped_content(raw_text: str, formatted: str) -> bool:
+    """Whether formatting lost so much text that content was probably dropped or truncated."""
+    return len(formatted) < len(raw_text) * 0.5
+
+
+def _needs_chunking(raw_text: str) -> bool:
+    settings = get_settings()
+    return settings.format_chunking_enabled and len(raw_text) > settings.format_chunk_max_chars
+
+
+def _format_in_chunks(raw_text: str) -> tuple[str, bool]:
+    """Format a long transcript as sentence-aligned chunks in parallel and join them in order.
+
+    Output tokens dominate formatting latency, so wall-clock time tracks the
+    longest chunk rather than the whole transcript. Every chunk after the first
+    gets the end of the previous chunk as read-only context. The length-safety
+    check applies per chunk: a chunk that comes back much shorter keeps its raw text.
+    Returns the joined text and whether any chunk fell back like that.
+    """
+    settings = get_settings()
+    spans = split_text_spans(raw_text, max_chars=settings.format_chunk_max_chars)
+    chunks = [raw_text[start:end] for start, end in spans]
+    contexts = [""] + [text_tail(chunk, settings.format_chunk_overlap_chars) for chunk in chunks[:-1]]
+    logger.info(f"Formatting {len(raw_text)} chars as {len(chunks)} chunks in parallel")
+    metrics.observe("format.chunks_per_request", len(chunks))
+
+    with ThreadPoolExecutor(max_workers=min(settings.format_max_concurrency, len(chunks))) as executor:
+        results = list(executor.map(_format_chunk, chunks, contexts))
+    formatted = [text for text, _ in results]
+    gaps = [raw_text[end:start] for (_, end), (start, _) in zip(spans, spans[1:])]
+    joined = formatted[0] + "".join(_chunk_boundary(gap) + chunk for gap, chunk in zip(gaps, formatted[1:]))
+    return joined, any(fell_back for _, fell_back in results)
+
+
+def _chunk_boundary(gap: str) -> str:
+    """The break between two formatted chunks: the original line or paragraph break, else a space."""
+    return "\n" * min(gap.count("\n"), 2) or " "
+
+
+def _format_chunk(chunk: str, context: str) -> tuple[str, bool]:
+    """The formatted *chunk*, or the raw chunk and ``True`` if formatting dropped content."""
+    formatted = _PART_TAGS.sub("", _request_formatting(chunk, context=context) or "").strip()
+    if _dropped_content(chunk, formatted):
+        logger.warning(
+            f"Formatted chunk is significantly shorter than raw ({len(formatted)} < {len(chunk)} chars), "
+            f"keeping the raw chunk"
+        )
+        metrics.increment("format.chunk_fallbacks")
+        return chunk, True
+    return formatted, False
+
+
+def _request_formatting(
+    raw_text: str, decision: Optional[ModelRoute] = None, *, context: str = ""
+) -> Optional[str]:
+    """Format *raw_text* with one completion; *context* is the preceding text of a chunked transcript."""
+    settings = get_settings()
+    client = get_openai_client(settings.openai_api_key)
+    decision = decision or route("format", len(raw_text))
+    system_prompt, user_content = TRANSCRIPT_FORMATTING_PROMPT, raw_text
+    if context:
+        system_prompt += CHUNK_CONTEXT_INSTRUCTIONS
+        user_content = f"<context>\n{context}\n</context>\n<part>\n{raw_text}\n</part>"
+    with observe_latency(decision):
+        completion = get_governor("openai.chat").call(
+            lambda: client.chat.completions.create(
+                model=decision.model,
+                max_tokens=decision.max_tokens,
+                temperature=FORMATTING_TEMPERATURE,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content},
+                ],
+            )
+        )
+    return completion.choices[0].message.content
+
+
+def _format_many(raw_texts: List[str], model: str) -> List[Union[Optional[str], Exception]]:
+    """Format several transcripts with one JSON-mode completion (see :mod:`.batching`).
+
+    Every item was routed to *model* on its own and is cached under a key naming
+    that model, so the batch and any per-item fallback run on *model* as well;
+    only the output budget is sized for the whole batch.
+    """
+    settings = get_settings()
+    client = get_openai_client(settings.openai_api_key)
+
+    def request_batch(items: str) -> dict:
+        decision = replace(route("format", sum(map(len, raw_texts)), items=len(raw_texts)), model=model)
+        with observe_latency(decision):
+            completion = get_governor("openai.chat").call(
+                lambda: client.chat.completions.create(
+                    model=decision.model,
+                    max_tokens=decision.max_tokens,
+                    temperature=FORMATTING_TEMPERATURE,
+                    response_format={"type": "json_object"},
+                    messages=[
+                        {"role": "system", "content": batch_prompt(TRANSCRIPT_FORMATTING_PROMPT)},
+                        {"role": "user", "content": items},
+                    ],
+                )
+            )
+        return parse_json_content(completion.choices[0].message.content)
+
+    def request_one(raw_text: str) -> Optional[str]:
+        return _request_formatting(raw_text, replace(route("format", len(raw_text)), model=model))
+
+    return run_batch(
+        "format_transcript",
+        raw_texts,
+        batch_call=request_batch,
+        single_call=request_one,
+        parse_item=_batched_formatted_text,
+    )
+
+
+def _batched_formatted_text(result: Any) -> str:
+    if not isinstance(result, str) or not result.strip():
+        raise ValueError("Batched formatting result must be a non-empty string")
+    return result
+
+
+def stream_format_transcript(raw_text: str) -> Iterator[str]:
+    """Yield the formatted transcript chunk by chunk as the LLM writes it.
+
+    Follows :func:`format_transcript`: disabled formatting or a missing API key
+    yield the raw text, the mock provider streams its cleaned text word by word,
+    and responses are served from / stored in the LLM cache. A request that fails
+    before the first token falls back to the raw transcript.
+
+    Raises:
+        RuntimeError: if the stream breaks after text was already sent
+    """
+    settings = get_settings()
+    if not settings.transcript_formatting_enabled:
+        yield raw_text.strip()
+        return
+    if settings.llm_provider == "mock":
+        yield from mock_chunks(mock_format_text(raw_text))
+        return
+    if settings.llm_provider != "openai" or not settings.openai_api_key:
+        logger.warning("Streaming formatting unavailable, returning raw transcript")
+        yield raw_text
+        return
+
+    decision = route("format", len(raw_text))
+    key = _formatting_cache_key(raw_text, decision.model)
+    cached = lookup_llm_response("format_transcript", key)
+    if cached is not None:
+        yield cached.strip()
+        return
+
+    parts: list[str] = []
+    try:
+        with get_governor("openai.chat").slot(), observe_latency(decision):
+            stream = get_openai_client(settings.openai_api_key).chat.completions.create(
+                model=decision.model,
+                max_tokens=decision.max_tokens,
+                temperature=FORMATTING_TEMPERATURE,
+                stream=True,
+                messages=[
+                    {"role": "system", "content": TRANSCRIPT_FORMATTING_PROMPT},
+                    {"role": "user", "content": raw_text},
+                ],
+            )
+            for chunk in stream:
+                if delta := completion_delta(chunk):
+                    # Hold back leading whitespace so the streamed text matches format_transcript's strip().
+                    if not parts and not delta.strip():
+                        continue
+                    parts.append(delta if parts else delta.lstrip())
+                    yield parts[-1]
+    except OpenAIError as exc:
+        if parts:
+            raise RuntimeError(f"Formatting stream interrupted: {exc}") from exc
+        logger.exception(f"OpenAI streaming formatting failed: {exc}")
+        yield raw_text
+        return
+
+    if not parts:
+        logger.warning("LLM returned empty formatted text, using raw transcript")
+        yield raw_text
+        return
+    text = "".join(parts).strip()
+    # Like format_transcript: a reply that dropped content was already streamed, but is not cached.
+    if not text or _dropped_content(raw_text, text):
+        logger.warning(
+            f"Streamed formatting is significantly shorter than raw: "
+            f"raw={len(raw_text)} chars, formatted={len(text)} chars, not caching it"
+        )
+        return
+    store_llm_response(key, text)
+
+
+def _formatting_cache_key(raw_text: str, model: str, *, chunked: bool = False) -> str:
+    """Key one formatting; a *chunked* run is keyed on the chunking settings and the chunk prompt too."""
+    variant = ()
+    if chunked:
+        # Chunks are routed by their own length, not that of the whole input behind *model*.
+        variant = ("chunked", CHUNK_CONTEXT_INSTRUCTIONS, *format_chunking_signature(), *routing_signature())
+    return llm_cache_key(
+        "format_transcript",
+        system_prompt=TRANSCRIPT_FORMATTING_PROMPT,
+        model=model,
+        temperature=FORMATTING_TEMPERATURE,
+        user_input=raw_text,
+        variant=variant,
+    )
+
+
+def format_chunking_signature() -> tuple:
+    """Settings that change how a long transcript is formatted (for cache keys built upstream)."""
+    settings = get_settings()
+    if not settings.format_chunking_enabled:
+        return (False,)
+    return (True, settings.format_chunk_max_chars, settings.format_chunk_overlap_chars)
+
+
+def format_and_analyze_transcript(raw_text: str) -> dict:
+    """Format and analyze *raw_text* with a single structured-JSON completion.
+
+    Returns the :func:`analyze_transcript` fields plus ``formatted_text`` and an
+    optional entry ``insight``; the payload is validated like ``analyze``.
+
+    Raises:
+        ValueError: if the response is empty, malformed or misses required fields
+        RuntimeError: if the LLM request fails
+    """
+    provider = _get_provider()
+    return provider.format_and_analyze(raw_text, FORMAT_AND_ANALYZE_PROMPT)
 
 
 _provider_cache: Optional[LLMProvider] = None
+_format_batchers: dict[str, MicroBatcher[str, Optional[str]]] = {}
 
 
 def _get_provider() -> LLMProvider:
     global _provider_cache
     if _provider_cache is None:
         _provider_cache = build_llm_provider(prompt=LLM_PROMPT)
+        if isinstance(_provider_cache, OpenAILLMProvider) and get_settings().llm_batching_enabled:
+            _provider_cache.batcher = _make_batcher("analyze", _provider_cache.analyze_many)
     return _provider_cache
+
+
+def _get_format_batcher(model: str) -> Optional[MicroBatcher[str, Optional[str]]]:
+    """The formatting micro-batcher for items routed to *model*, or ``None`` unless ``LLM_BATCHING_ENABLED``."""
+    if not get_settings().llm_batching_enabled:
+        return None
+    if model not in _format_batchers:
+        _format_batchers[model] = _make_batcher("format_transcript", partial(_format_many, model=model))
+    return _format_batchers[model]
+
+
+def _make_batcher(name: str, handler: Callable[[List[str]], list]) -> MicroBatcher:
+    settings = get_settings()
+    return MicroBatcher(
+        name,
+        handler,
+        max_size=settings.llm_batch_max_size,
+        window_seconds=settings.llm_batch_window_ms / 1000,
+    )
@@ -0,0 +1,95 @@
+"""Response cache for LLM calls that are (nearly) deterministic in their inputs.
+
+Responses are keyed on the call site, system prompt, model, temperature and user
+input, so editing a prompt or switching models never serves stale answers. The
+cache is a :class:`~.cache.TwoTierCache` with a TTL; hits and misses are counted
+per call site (``llm_cache.<site>.hit|miss``) together with a hit-rate gauge.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Callable, Optional
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+from .cache import TwoTierCache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+_registered_sites: set[str] = set()
+
+
+def llm_cache_key(
+    site: str, *, system_prompt: str, model: str, temperature: float, user_input: str, variant: tuple = ()
+) -> str:
+    """*variant* holds any other settings that shape the response (e.g. how the input was chunked)."""
+    return make_cache_key(site, system_prompt, model, temperature, user_input, *variant)
+
+
+def cached_llm_call(site: str, key: str, call: Callable[[], Optional[str]]) -> Optional[str]:
+    """Return the cached response for *key*, or run *call* and cache a non-empty result.
+
+    Exceptions from *call* propagate and nothing is cached.
+    """
+    cached = lookup_llm_response(site, key)
+    if cached is not None:
+        return cached
+    response = call()
+    store_llm_response(key, response)
+    return response
+
+
+def lookup_llm_response(site: str, key: str) -> Optional[str]:
+    """Return the cached response for *key* (counting a hit or miss), or ``None``."""
+    cache = _get_llm_cache()
+    if cache is None:
+        return None
+
+    _register_site(site)
+    cached = cache.get(key)
+    metrics.increment(f"llm_cache.{site}.{'miss' if cached is None else 'hit'}")
+    return cached
+
+
+def store_llm_response(key: str, response: Optional[str]) -> None:
+    """Cache a non-empty *response*; used directly by streaming callers once the stream completes."""
+    cache = _get_llm_cache()
+    if cache is not None and response:
+        cache.set(key, response)
+
+
+def _register_site(site: str) -> None:
+    if site in _registered_sites:
+        return
+    _registered_sites.add(site)
+
+    def hit_rate() -> float:
+        hits = metrics.counter(f"llm_cache.{site}.hit")
+        total = hits + metrics.counter(f"llm_cache.{site}.miss")
+        return hits / total if total else 0.0
+
+    metrics.register_gauge(f"llm_cache.{site}.hit_rate", hit_rate)
+
+
+_llm_cache: Optional[TwoTierCache] = None
+
+
+def _get_llm_cache() -> Optional[TwoTierCache]:
+    global _llm_cache
+    settings = get_settings()
+    if not settings.llm_cache_enabled:
+        return None
+    if _llm_cache is None:
+        _llm_cache = TwoTierCache(
+            "llm",
+            memory_max_bytes=settings.llm_cache_memory_max_bytes,
+            persistent_max_bytes=settings.llm_cache_persistent_max_bytes,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+        )
+    return _llm_cache
+
+
+def reset_llm_cache() -> None:
+    global _llm_cache
+    _llm_cache = None
@@ -0,0 +1,138 @@
+"""Per-task model and output-budget selection for LLM calls.
+
+Formatting a short transcript and summarising a year of entries have very
+different needs, so each call site asks :func:`route` for a :class:`ModelRoute`
+instead of using ``OPENAI_LLM_MODEL`` directly. The choice is made from the
+task's policy, the input length and recent latency:
+
+* every task has a default tier: ``small`` (``LLM_SMALL_MODEL``) or ``large``
+  (``LLM_LARGE_MODEL``); both fall back to the caller's base model;
+* tasks that reason over the whole input escalate to the large tier once the
+  input exceeds ``LLM_ROUTE_LONG_INPUT_CHARS``;
+* interactive tasks drop back to the small tier while the large model's mean
+  latency is over the task's latency budget;
+* ``max_tokens`` is fixed per task, or scales with the input for tasks that
+  rewrite the transcript.
+
+``LLM_ROUTE_OVERRIDES`` pins the model and/or ``max_tokens`` of any task.
+Decisions are counted as ``llm_route.<task>.<model>`` and call latency is
+recorded per model as ``llm_route.<model>.latency_seconds``.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Literal, Optional
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Task = Literal["format", "analyze", "format_and_analyze", "entry_insight", "period_insight", "rollup"]
+Tier = Literal["small", "large"]
+
+# Conservative chars-per-token for mixed Cyrillic/Latin text; only used to size output budgets.
+CHARS_PER_TOKEN = 2
+MAX_OUTPUT_TOKENS = 16000
+# While a task is downgraded for latency, every Nth call still goes to the large
+# model so its latency window keeps updating and the downgrade can lift.
+LATENCY_PROBE_EVERY = 10
+
+
+@dataclass(frozen=True)
+class TaskPolicy:
+    tier: Tier
+    max_tokens: int
+    # Output is a rewrite of the input, so the budget grows with it.
+    scales_with_input: bool = False
+    # Escalate to the large tier for inputs over LLM_ROUTE_LONG_INPUT_CHARS.
+    escalate_long_input: bool = False
+    # Fall back to the small tier while the large model is slower than this on average.
+    latency_budget_seconds: Optional[float] = None
+
+
+TASK_POLICIES: dict[str, TaskPolicy] = {
+    "format": TaskPolicy("small", max_tokens=256, scales_with_input=True),
+    "format_and_analyze": TaskPolicy("small", max_tokens=1024, scales_with_input=True),
+    "analyze": TaskPolicy("small", max_tokens=600, escalate_long_input=True),
+    "entry_insight": TaskPolicy("small", max_tokens=800, escalate_long_input=True, latency_budget_seconds=15.0),
+    "rollup": TaskPolicy("small", max_tokens=900),
+    "period_insight": TaskPolicy("large", max_tokens=1500, latency_budget_seconds=45.0),
+}
+
+
+_latency_downgrades: Counter[str] = Counter()
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    task: str
+    model: str
+    max_tokens: int
+    reason: str
+
+
+def route(task: Task, input_chars: int, base_model: Optional[str] = None, items: int = 1) -> ModelRoute:
+    """Pick the model and ``max_tokens`` for one *task* call over *input_chars* characters.
+
+    *items* > 1 sizes the output budget for a micro-batched multi-item prompt.
+    """
+    settings = get_settings()
+    policy = TASK_POLICIES[task]
+    base_model = base_model or settings.openai_llm_model
+    models = {
+        "small": settings.llm_small_model or base_model,
+        "large": settings.llm_large_model or base_model,
+    }
+
+    tier, reason = policy.tier, "default"
+    if policy.escalate_long_input and input_chars > settings.llm_route_long_input_chars:
+        tier, reason = "large", "long_input"
+    if (
+        tier == "large"
+        and policy.latency_budget_seconds is not None
+        and metrics.mean(f"llm_route.{models['large']}.latency_seconds") > policy.latency_budget_seconds
+    ):
+        _latency_downgrades[task] += 1
+        if _latency_downgrades[task] % LATENCY_PROBE_EVERY:
+            tier, reason = "small", "latency"
+
+    max_tokens = policy.max_tokens * items
+    if policy.scales_with_input:
+        max_tokens += input_chars // CHARS_PER_TOKEN
+    model = models[tier]
+
+    override = settings.llm_route_overrides.get(task)
+    if override is not None:
+        model = override.model or model
+        max_tokens = override.max_tokens or max_tokens
+        reason = "override"
+
+    decision = ModelRoute(task=task, model=model, max_tokens=min(max_tokens, MAX_OUTPUT_TOKENS), reason=reason)
+    metrics.increment(f"llm_route.{task}.{model}")
+    if reason != "default":
+        metrics.increment(f"llm_route.{task}.{reason}")
+    logger.debug(f"Routed {task} ({input_chars} chars) to {model}, max_tokens={decision.max_tokens} ({reason})")
+    return decision
+
+
+@contextmanager
+def observe_latency(decision: ModelRoute) -> Iterator[None]:
+    """Record how long a call to the routed model took; feeds the latency rule."""
+    with metrics.timer(f"llm_route.{decision.model}.latency_seconds"):
+        yield
+
+
+def routing_signature() -> tuple:
+    """Settings that change which model formats a transcript (for cache keys built upstream)."""
+    settings = get_settings()
+    override = settings.llm_route_overrides.get("format")
+    return (
+        settings.llm_small_model,
+        settings.llm_large_model,
+        override.model if override is not None else None,
+    )
@@ -2,27 +2,49 @@
 
 from __future__ import annotations
 
+import io
 import json
 import logging
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Dict, Optional
+from typing import BinaryIO, Dict, List, Optional, Union
 
-from openai import OpenAI
 from openai import OpenAIError
 
 from ..core.config import get_settings
+from .batching import MicroBatcher, batch_prompt, run_batch
+from .clients import get_openai_client
+from .governor import get_governor
+from .llm_cache import cached_llm_call, llm_cache_key
+from .local_analyzer import detect_language
+from .model_router import ModelRoute, observe_latency, route
 
 logger = logging.getLogger(__name__)
 
 
 class STTProvider(ABC):
-    """Base interface for speech-to-text providers."""
+    """Base interface for speech-to-text providers.
+
+    Providers implement :meth:`transcribe_file`, which receives a readable binary
+    stream so audio can flow to the HTTP client without an extra in-memory copy.
+    Only uploads sent as-is (and ``transcribe(path)``) avoid memory entirely:
+    audio the pipeline decodes for VAD or chunking is held as PCM and sent from
+    in-memory buffers via :meth:`transcribe_bytes`.
+    """
 
     @abstractmethod
-    def transcribe(self, file_path: str) -> str:
+    def transcribe_file(self, audio: BinaryIO, filename: str = "audio.wav") -> str:
+        """Transcribe audio read from the binary stream *audio*; *filename* hints the format."""
         raise NotImplementedError
 
+    def transcribe(self, file_path: str) -> str:
+        with open(file_path, "rb") as audio_file:
+            return self.transcribe_file(audio_file, filename=Path(file_path).name)
+
+    def transcribe_bytes(self, audio_bytes: bytes, filename: str = "audio.wav") -> str:
+        """Transcribe an in-memory audio buffer; *filename* hints the format."""
+        return self.transcribe_file(io.BytesIO(audio_bytes), filename=filename)
+
 
 class LLMProvider(ABC):
     """Base interface for transcript analysis providers."""
@@ -31,6 +53,14 @@ class LLMProvider(ABC):
     def analyze(self, transcript: str) -> Dict:
         raise NotImplementedError
 
+    def format_and_analyze(self, transcript: str, prompt: str) -> Dict:
+        """Format *transcript* and analyze it in one round trip.
+
+        Returns the :meth:`analyze` fields plus ``formatted_text`` and an optional
+        ``insight`` object shaped like an entry insight.
+        """
+        raise NotImplementedError
+
 
 class MockSTTProvider(STTProvider):
     """Deterministic STT provider for local development and tests."""
@@ -41,29 +71,36 @@ class MockSTTProvider(STTProvider):
             raise FileNotFoundError(file_path)
         return "Это тестовая запись пользователя про работу и усталость"
 
+    def transcribe_file(self, audio: BinaryIO, filename: str = "audio.wav") -> str:  # noqa: D401
+        if not audio.read(1):
+            raise ValueError("Audio buffer is empty")
+        return "Это тестовая запись пользователя про работу и усталость"
+
 
 class WhisperSTTProvider(STTProvider):
     """Wrapper around OpenAI Whisper (or GPT-4o transcribe) endpoints."""
 
     def __init__(self, api_key: str, model: str):
-        self.client = OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key)
         self.model = model
 
-    def transcribe(self, file_path: str) -> str:  # noqa: D401
-        try:
-            file_path_obj = Path(file_path)
-            filename = file_path_obj.name
-            
-            # Read file as bytes and pass with filename for format detection
-            with open(file_path, "rb") as audio_file:
-                audio_bytes = audio_file.read()
-            
-            # Pass as tuple (filename, bytes) so OpenAI can detect the format
-            response = self.client.audio.transcriptions.create(
+    def transcribe_file(self, audio: BinaryIO, filename: str = "audio.wav") -> str:  # noqa: D401
+        start = audio.tell() if audio.seekable() else 0
+
+        def request_transcription():
+            # A retried upload has to be read from the start again.
+            if audio.seekable():
+                audio.seek(start)
+            # Pass as tuple (filename, file object) so OpenAI can detect the format;
+            # httpx streams the multipart body from the file object in chunks.
+            return self.client.audio.transcriptions.create(
                 model=self.model,
-                file=(filename, audio_bytes),
+                file=(filename, audio),
                 response_format="text",
             )
+
+        try:
+            response = get_governor("openai.stt").call(request_transcription)
         except OpenAIError as exc:  # pragma: no cover - network failure
             error_msg = str(exc)
             logger.exception(f"OpenAI STT failed: {error_msg}")
@@ -98,51 +135,171 @@ class MockLLMProvider(LLMProvider):
             "insights": insights,
         }
 
+    def format_and_analyze(self, transcript: str, prompt: str) -> Dict:
+        analysis = self.analyze(transcript)
+        return {
+            **analysis,
+            "formatted_text": mock_format_text(transcript),
+            "insight": {
+                "summary": analysis["title"],
+                "bullets": analysis["insights"],
+                "suggestion": "",
+                "mood_trend": "negative" if analysis["mood_label"] == "anxious" else "neutral",
+                "confidence": 0.5,
+                "top_topics": analysis["tags"][:2],
+                "language": detect_language(transcript)[0],
+            },
+        }
+
+
+def mock_format_text(text: str) -> str:
+    """Mock formatting: capitalize the first letter and add a period if missing."""
+    formatted = text.strip()
+    if formatted and not formatted.endswith((".", "!", "?", "…")):
+        formatted += "."
+    if formatted:
+        formatted = formatted[0].upper() + formatted[1:] if len(formatted) > 1 else formatted.upper()
+    return formatted
+
 
 class OpenAILLMProvider(LLMProvider):
     """OpenAI-powered analyzer that enforces JSON responses."""
 
+    temperature = 0.2
+    fused_temperature = 0.1  # the fused call also formats, which wants maximum consistency
+
     def __init__(self, api_key: str, prompt: str, model: str):
-        self.client = OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key)
         self.prompt = prompt
-        self.model = model
+        self.model = model  # base model; the router may pick a smaller/larger one per call
+        # Set by llm._get_provider when LLM_BATCHING_ENABLED; cache misses then go through it.
+        self.batcher: Optional[MicroBatcher[str, Dict]] = None
 
     def analyze(self, transcript: str) -> Dict:
+        decision = route("analyze", len(transcript), self.model)
+        key = llm_cache_key(
+            "analyze",
+            system_prompt=self.prompt,
+            model=decision.model,
+            temperature=self.temperature,
+            user_input=transcript,
+        )
+        # Only validated payloads are cached, re-serialised as JSON.
+        cached = cached_llm_call(
+            "analyze", key, lambda: json.dumps(self._analyze_uncached(transcript, decision), ensure_ascii=False)
+        )
+        return json.loads(cached)
+
+    def format_and_analyze(self, transcript: str, prompt: str) -> Dict:
+        decision = route("format_and_analyze", len(transcript), self.model)
+        key = llm_cache_key(
+            "format_and_analyze",
+            system_prompt=prompt,
+            model=decision.model,
+            temperature=self.fused_temperature,
+            user_input=transcript,
+        )
+        cached = cached_llm_call(
+            "format_and_analyze",
+            key,
+            lambda: json.dumps(
+                validate_fused_response(self._complete_json(prompt, transcript, self.fused_temperature, decision)),
+                ensure_ascii=False,
+            ),
+        )
+        return json.loads(cached)
+
+    def analyze_many(self, transcripts: List[str]) -> List[Union[Dict, Exception]]:
+        """Analyze *transcripts* with one multi-item completion.
+
+        Items missing from the reply or failing validation are analyzed one by one.
+        """
+        decision = route("analyze", sum(map(len, transcripts)), self.model, items=len(transcripts))
+        return run_batch(
+            "analyze",
+            transcripts,
+            batch_call=lambda items: self._complete_json(batch_prompt(self.prompt), items, self.temperature, decision),
+            single_call=self._analyze_one,
+            parse_item=lambda result: validate_analysis(result if isinstance(result, dict) else {}),
+        )
+
+    def _analyze_uncached(self, transcript: str, decision: Optional[ModelRoute] = None) -> Dict:
+        if self.batcher is not None:
+            return self.batcher.submit(transcript)
+        return self._analyze_one(transcript, decision)
+
+    def _analyze_one(self, transcript: str, decision: Optional[ModelRoute] = None) -> Dict:
+        decision = decision or route("analyze", len(transcript), self.model)
+        return validate_analysis(self._complete_json(self.prompt, transcript, self.temperature, decision))
+
+    def _complete_json(self, system_prompt: str, user_content: str, temperature: float, decision: ModelRoute) -> Dict:
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                temperature=0.2,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": self.prompt},
-                    {"role": "user", "content": transcript},
-                ],
-            )
+            with observe_latency(decision):
+                completion = get_governor("openai.chat").call(
+                    lambda: self.client.chat.completions.create(
+                        model=decision.model,
+                        max_tokens=decision.max_tokens,
+                        temperature=temperature,
+                        response_format={"type": "json_object"},
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_content},
+                        ],
+                    )
+                )
         except OpenAIError as exc:  # pragma: no cover - network failure
             logger.exception("OpenAI LLM failed")
             raise RuntimeError("OpenAI LLM request failed") from exc
 
-        content = completion.choices[0].message.content
-        if not content:
-            raise ValueError("LLM returned empty content")
+        return parse_json_content(completion.choices[0].message.content)
 
-        try:
-            payload = json.loads(content)
-        except json.JSONDecodeError as exc:
-            logger.error("LLM responded with invalid JSON: %s", content)
-            raise ValueError("LLM returned invalid JSON") from exc
-
-        required_fields = {"title", "mood_label", "tags", "insights"}
-        missing = required_fields - payload.keys()
-        if missing:
-            raise ValueError(f"LLM response missing fields: {', '.join(sorted(missing))}")
-
-        if not isinstance(payload["tags"], list):
-            raise ValueError("LLM response field 'tags' must be a list")
-        if not isinstance(payload["insights"], list):
-            raise ValueError("LLM response field 'insights' must be a list")
-
-        return payload
+
+def parse_json_content(content: Optional[str]) -> Dict:
+    """Decode a JSON-mode completion, rejecting empty or malformed content."""
+    if not content:
+        raise ValueError("LLM returned empty content")
+
+    try:
+        payload = json.loads(content)
+    except json.JSONDecodeError as exc:
+        logger.error("LLM responded with invalid JSON: %s", content)
+        raise ValueError("LLM returned invalid JSON") from exc
+
+    if not isinstance(payload, dict):
+        raise ValueError("LLM response must be a JSON object")
+    return payload
+
+
+def validate_analysis(payload: Dict) -> Dict:
+    """Check the title/mood_label/tags/insights fields that entries are built from."""
+    required_fields = {"title", "mood_label", "tags", "insights"}
+    missing = required_fields - payload.keys()
+    if missing:
+        raise ValueError(f"LLM response missing fields: {', '.join(sorted(missing))}")
+
+    if not isinstance(payload["tags"], list):
+        raise ValueError("LLM response field 'tags' must be a list")
+    if not isinstance(payload["insights"], list):
+        raise ValueError("LLM response field 'insights' must be a list")
+
+    return payload
+
+
+def validate_fused_response(payload: Dict) -> Dict:
+    """Validate a fused format+analyze payload: analysis fields, formatted text and insight."""
+    validate_analysis(payload)
+
+    formatted = payload.get("formatted_text")
+    if not isinstance(formatted, str) or not formatted.strip():
+        raise ValueError("LLM response field 'formatted_text' must be a non-empty string")
+
+    insight = payload.get("insight")
+    if insight is not None and not isinstance(insight, dict):
+        raise ValueError("LLM response field 'insight' must be an object")
+    if isinstance(insight, dict) and not isinstance(insight.get("bullets", []), list):
+        raise ValueError("LLM response field 'insight.bullets' must be a list")
+
+    return payload
 
 
 def build_stt_provider() -> STTProvider:
@@ -0,0 +1,47 @@
+"""Request coalescing for expensive async work.
+
+Concurrent callers asking for the same key share one in-flight task instead of
+each starting their own. The task is shielded, so a caller that disconnects does
+not cancel the work the other callers are waiting for.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls per key within one event loop."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def running(self, key: Hashable) -> bool:
+        """Whether a call for *key* is in flight."""
+        return key in self._inflight
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """Await the in-flight call for *key*, starting ``factory()`` if there is none."""
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.increment(f"singleflight.{self.name}.started")
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics.increment(f"singleflight.{self.name}.coalesced")
+            logger.debug(f"Coalesced {self.name} request for {key!r}")
+        return await asyncio.shield(task)
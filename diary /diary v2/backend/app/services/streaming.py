@@ -0,0 +1,82 @@
+"""Streaming LLM completions to clients as Server-Sent Events.
+
+Streaming endpoints forward completion tokens as they arrive instead of waiting
+for the whole reply, so the client renders text within the first few hundred
+milliseconds. With the mock provider the canned reply is streamed word by word,
+which keeps the endpoints testable offline.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from ..core.config import get_settings
+from .clients import get_async_openai_client
+from .governor import get_governor
+from .model_router import Task, observe_latency, route
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# Disable proxy buffering (nginx) and caching so events reach the client immediately.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+_WORD_CHUNKS = re.compile(r"\s*\S+\s*|\s+")
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Encode one SSE message; *data* is sent as a single JSON line."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def mock_chunks(text: str) -> Iterator[str]:
+    """Split *text* into word-sized chunks the way a streamed completion arrives."""
+    return iter(_WORD_CHUNKS.findall(text))
+
+
+def completion_delta(chunk: Any) -> str:
+    """Text carried by one streamed ``ChatCompletionChunk`` (empty for role/stop chunks)."""
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+async def stream_chat_completion(
+    system_prompt: str,
+    user_content: str,
+    *,
+    task: Task,
+    temperature: float,
+    json_mode: bool,
+    mock_response: Callable[[], str],
+) -> AsyncIterator[str]:
+    """Yield the completion for *user_content* chunk by chunk, from the model routed for *task*.
+
+    With ``LLM_PROVIDER=mock`` the text from *mock_response* is streamed instead.
+    """
+    settings = get_settings()
+    if settings.llm_provider == "mock":
+        for chunk in mock_chunks(mock_response()):
+            yield chunk
+            await asyncio.sleep(0)
+        return
+
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    decision = route(task, len(user_content))
+    async with get_governor("openai.chat").aslot():
+        with observe_latency(decision):
+            stream = await get_async_openai_client().chat.completions.create(
+                model=decision.model,
+                max_tokens=decision.max_tokens,
+                temperature=temperature,
+                stream=True,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content},
+                ],
+                **extra,
+            )
+            async for chunk in stream:
+                if delta := completion_delta(chunk):
+                    yield delta
@@ -0,0 +1,120 @@
+"""Admission control for ffmpeg subprocesses.
+
+Every conversion and encode goes through the shared :class:`Transcoder`, which
+caps how many ffmpeg processes run at once (one per core by default). Callers
+beyond the cap wait in a bounded queue; once that queue is full, or a caller has
+waited longer than ``TRANSCODER_QUEUE_TIMEOUT_SECONDS``, :class:`TranscoderBusyError`
+is raised so the API can answer 503 instead of oversubscribing the CPU.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TranscoderBusyError(RuntimeError):
+    """Raised when no transcoder slot is available within the queue bounds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Audio transcoder is busy")
+        self.retry_after = retry_after
+
+
+class Transcoder:
+    """Runs ffmpeg pipelines with bounded concurrency and a bounded wait queue."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+        metrics.register_gauge(f"{name}.queued", lambda: self._queued)
+        metrics.register_gauge(f"{name}.active", lambda: self._active)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def retry_after_seconds(self) -> int:
+        """Rough time until a slot frees up, used for ``Retry-After``."""
+        mean_duration = metrics.mean(f"{self.name}.duration_seconds", default=1.0)
+        return max(1, math.ceil(mean_duration * (self._queued + 1) / self.max_concurrency))
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one transcoder slot for the duration of the block."""
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                admitted = self._queued < self.max_queue
+                if admitted:
+                    self._queued += 1
+            if not admitted:
+                metrics.increment(f"{self.name}.rejected")
+                raise TranscoderBusyError(self.retry_after_seconds())
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._queued -= 1
+            if not acquired:
+                metrics.increment(f"{self.name}.timeouts")
+                raise TranscoderBusyError(self.retry_after_seconds())
+        metrics.observe(f"{self.name}.wait_seconds", time.perf_counter() - started)
+
+        with self._lock:
+            self._active += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.observe(f"{self.name}.duration_seconds", time.perf_counter() - started)
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    def run(self, stream: Any, **run_kwargs: Any) -> Any:
+        """Run an ``ffmpeg.input(...).output(...)`` stream once a slot is free."""
+        with self.slot():
+            return stream.run(**run_kwargs)
+
+
+_transcoder: Optional[Transcoder] = None
+
+
+def get_transcoder() -> Transcoder:
+    global _transcoder
+    if _transcoder is None:
+        settings = get_settings()
+        _transcoder = Transcoder(
+            "transcoder",
+            max_concurrency=settings.transcoder_max_concurrency or os.cpu_count() or 1,
+            max_queue=settings.transcoder_queue_size,
+            queue_timeout=settings.transcoder_queue_timeout_seconds,
+        )
+    return _transcoder
+
+
+def reset_transcoder() -> None:
+    global _transcoder
+    _transcoder = None
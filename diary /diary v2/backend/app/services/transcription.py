@@ -0,0 +1,493 @@
+"""Upload → 16kHz WAV → STT → LLM formatting pipeline.
+
+Shared by the synchronous ``POST /transcribe`` endpoint and the background
+transcription job workers so both paths run identical stages.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Optional
+
+from ..core.config import get_settings
+from ..core.metrics import metrics
+from .audio import (
+    PIPE_UNSAFE_EXTENSIONS,
+    SAMPLE_WIDTH,
+    TARGET_SAMPLE_RATE,
+    AudioConversionError,
+    PcmAudio,
+    convert_bytes_to_pcm,
+    convert_file_to_wav,
+    decode_wav_file,
+    encode_for_stt,
+    is_wav_header,
+    sniff_container,
+)
+from .cache import TwoTierCache, make_cache_key
+from .chunking import split_at_silence, stitch_transcripts
+from .governor import ProviderThrottledError
+from .llm import _dropped_content, format_and_analyze_transcript, format_chunking_signature, format_transcript_checked
+from .model_router import routing_signature
+from .providers import STTProvider, build_stt_provider, validate_analysis
+from .stt import TranscriptionError
+from .transcoder import TranscoderBusyError
+from .vad import trim_silence, vad_signature
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "AudioConversionError",
+    "EmptyAudioError",
+    "ProviderThrottledError",
+    "TranscoderBusyError",
+    "TranscriptionError",
+    "TranscriptionResult",
+    "reset_transcript_cache",
+    "transcribe_pcm_segment",
+    "transcribe_upload",
+]
+
+HASH_CHUNK_SIZE = 1024 * 1024
+SNIFF_BYTES = 64
+
+# Containers the STT provider decodes itself (by extension, as named by
+# ``sniff_container``), and its upload size limit. Compressed uploads are only
+# sent as-is when no pipeline stage needs the decoded samples, i.e. with both
+# VAD_ENABLED and STT_CHUNKING_ENABLED off; WAV uploads skip ffmpeg either way.
+STT_NATIVE_CONTAINERS = {
+    ".mp3": "mpeg",
+    ".mpeg": "mpeg",
+    ".mpga": "mpeg",
+    ".mp4": "mp4",
+    ".m4a": "mp4",
+    ".wav": "wav",
+    ".webm": "webm",
+}
+STT_NATIVE_MAX_BYTES = 25 * 1024 * 1024
+WAV_HEADER_BYTES = 44
+
+
+class EmptyAudioError(ValueError):
+    """Raised when the upload or the resulting transcript is empty."""
+
+
+@dataclass
+class TranscriptionResult:
+    text: str
+    language: str = "auto"  # Whisper detects language automatically
+    trimmed_ratio: Optional[float] = None  # share of the audio removed by VAD before STT
+    analysis: Optional[dict] = None  # title/mood_label/tags/insights (+ insight) from fused mode
+    degraded: bool = False  # formatting or fused analysis fell back; such results are not cached
+
+
+def transcribe_upload(upload: BinaryIO, file_ext: str, *, formatted: bool = True) -> TranscriptionResult:
+    """Run the full transcription pipeline for an uploaded audio stream.
+
+    With ``formatted=False`` the raw STT transcript is returned unformatted, for
+    callers that stream the formatting themselves.
+
+    Raises:
+        EmptyAudioError: if the upload or the transcript is empty
+        AudioConversionError: if ffmpeg cannot convert the upload
+        TranscoderBusyError: if no ffmpeg slot frees up within the queue bounds
+        TranscriptionError: if the STT provider fails
+    """
+    cache = _get_transcript_cache()
+    cache_key: Optional[str] = None
+    if cache is not None:
+        cache_key = transcript_cache_key(upload, formatted=formatted)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving transcript from content-hash cache")
+            return TranscriptionResult(**json.loads(cached))
+
+    result = _run_pipeline(upload, file_ext, formatted=formatted)
+    if cache is not None and cache_key is not None and not result.degraded:
+        cache.set(cache_key, json.dumps(asdict(result), ensure_ascii=False))
+    return result
+
+
+def transcript_cache_key(upload: BinaryIO, *, formatted: bool = True) -> str:
+    """Key a transcript by the SHA-256 of the upload plus every setting that shapes the output.
+
+    The stream is hashed in chunks and rewound so the pipeline can read it again.
+    """
+    settings = get_settings()
+    digest = hashlib.sha256()
+    while chunk := upload.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    upload.seek(0)
+    return make_cache_key(
+        digest.hexdigest(),
+        settings.stt_provider,
+        settings.openai_stt_model,
+        settings.llm_provider,
+        settings.openai_llm_model,
+        *routing_signature(),
+        *audio_pipeline_signature(),
+        settings.transcript_formatting_enabled,
+        *format_chunking_signature(),
+        settings.llm_fused_mode,
+        *(() if formatted else ("raw",)),
+    )
+
+
+def audio_pipeline_signature() -> tuple:
+    """Settings that change the audio the STT provider hears, and so the transcript."""
+    settings = get_settings()
+    vad = (settings.vad_max_pause_ms, *vad_signature()) if settings.vad_enabled else ()
+    chunking = (
+        (settings.stt_segment_max_seconds, settings.stt_segment_overlap_seconds) if settings.stt_chunking_enabled else ()
+    )
+    codec = (settings.stt_upload_codec, settings.stt_opus_bitrate if settings.stt_upload_codec == "opus" else None)
+    return ("vad", settings.vad_enabled, *vad, "chunking", settings.stt_chunking_enabled, *chunking, *codec)
+
+
+def _run_pipeline(upload: BinaryIO, file_ext: str, formatted: bool = True) -> TranscriptionResult:
+    settings = get_settings()
+    temp_paths: list[str] = []
+
+    try:
+        output_path: str | None = None
+        pcm: PcmAudio | None = None
+        wav_path: str | None = None
+        native_filename: str | None = None
+        with metrics.timer("transcribe.convert_seconds"):
+            if settings.audio_fast_path_enabled:
+                native_filename = _native_upload_filename(upload, file_ext)
+                if native_filename is None:
+                    pcm, wav_path = _decode_in_process(upload)
+
+            if native_filename is not None:
+                audio_label = f"{file_ext} upload streamed as-is"
+            elif pcm is not None:
+                audio_label = f"{pcm.duration_seconds:.1f}s of in-memory PCM"
+            elif settings.audio_conversion_mode == "pipe":
+                metrics.increment("transcribe.decode_path.ffmpeg")
+                pcm = _convert_piped(upload, file_ext, temp_paths)
+                audio_label = f"{pcm.duration_seconds:.1f}s of in-memory PCM"
+            else:
+                metrics.increment("transcribe.decode_path.ffmpeg")
+                output_path = _convert_via_temp_files(upload, file_ext, temp_paths)
+                audio_label = output_path
+                wav_seconds = os.path.getsize(output_path) / (SAMPLE_WIDTH * TARGET_SAMPLE_RATE)
+                if settings.vad_enabled or settings.stt_upload_codec != "wav" or _needs_chunking(wav_seconds):
+                    pcm = PcmAudio.from_wav_file(output_path)
+
+        trimmed_ratio: Optional[float] = None
+        if pcm is not None and settings.vad_enabled:
+            pcm, trimmed_ratio = _trim_silence(pcm)
+        if wav_path == "passthrough" and not trimmed_ratio and _fits_one_request(upload, pcm):
+            # The upload is already the 16 kHz mono WAV we would send: no need to re-encode it.
+            metrics.increment("transcribe.upload_path.passthrough")
+            native_filename, pcm = "audio.wav", None
+
+        # Transcribe using Whisper
+        logger.info(f"Transcribing {audio_label} with Whisper")
+
+        try:
+            with metrics.timer("transcribe.stt_seconds"):
+                stt_provider = build_stt_provider()
+                if native_filename is not None:
+                    raw_transcript = stt_provider.transcribe_file(upload, filename=native_filename)
+                elif pcm is not None:
+                    # Audio decoded without ffmpeg goes up as WAV too, so no encoder is spawned.
+                    raw_transcript = _transcribe_pcm(stt_provider, pcm, prefer_wav=wav_path is not None)
+                else:
+                    raw_transcript = stt_provider.transcribe(output_path)
+        except ProviderThrottledError:
+            raise
+        except Exception as exc:
+            logger.exception("Whisper transcription failed")
+            raise TranscriptionError(str(exc)) from exc
+        logger.info(f"Raw transcription successful: {len(raw_transcript)} characters")
+
+        # DEBUG: Log raw transcript to verify both languages are present
+        logger.info(f"RAW_TRANSCRIPT: {raw_transcript}")
+
+        # Validate transcript is not empty
+        if not raw_transcript or not raw_transcript.strip():
+            raise EmptyAudioError("Transcription produced empty result. Please check your audio file.")
+
+        if not formatted:
+            return TranscriptionResult(text=raw_transcript.strip(), trimmed_ratio=trimmed_ratio)
+
+        # Post-process transcript with LLM formatting
+        logger.info("Formatting transcript with LLM post-processing")
+        with metrics.timer("transcribe.format_seconds"):
+            formatted_transcript, analysis, degraded = _format_transcript(raw_transcript)
+        logger.info(f"Transcript formatting complete: {len(formatted_transcript)} characters")
+
+        # DEBUG: Log formatted transcript to verify both languages are preserved
+        logger.info(f"FORMATTED_TRANSCRIPT: {formatted_transcript}")
+
+        # Validate formatted transcript is not empty
+        if not formatted_transcript or not formatted_transcript.strip():
+            logger.warning("Formatted transcript is empty, using raw transcript")
+            formatted_transcript, degraded = raw_transcript.strip(), True
+
+        return TranscriptionResult(
+            text=formatted_transcript, trimmed_ratio=trimmed_ratio, analysis=analysis, degraded=degraded
+        )
+    finally:
+        # Cleanup temporary files
+        for path in temp_paths:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                    logger.debug(f"Cleaned up temp file: {path}")
+                except Exception as e:
+                    logger.warning(f"Failed to remove temp file {path}: {e}")
+
+
+def _format_transcript(raw_transcript: str) -> tuple[str, Optional[dict], bool]:
+    """Format the transcript, also analyzing it in the same LLM call when fused mode is on.
+
+    Returns the text, the fused analysis and whether the result is degraded. A
+    failed fused call falls back to plain formatting without analysis, which
+    counts as degraded. So does a fused reply whose text fails the
+    dropped-content check: the transcript is formatted again on its own and the
+    fused analysis is kept only if it still validates.
+    """
+    settings = get_settings()
+    if settings.llm_fused_mode and settings.transcript_formatting_enabled:
+        try:
+            payload = format_and_analyze_transcript(raw_transcript)
+        except Exception:
+            logger.exception("Fused format+analyze failed, falling back to formatting only")
+            metrics.increment("transcribe.fused_fallbacks")
+        else:
+            formatted = payload.pop("formatted_text")
+            if not _dropped_content(raw_transcript, formatted.strip()):
+                return formatted, payload, False
+            logger.warning(
+                f"Fused formatting is significantly shorter than raw ({len(formatted.strip())} < "
+                f"{len(raw_transcript)} chars), formatting the transcript on its own"
+            )
+            metrics.increment("transcribe.fused_dropped_content")
+            formatted, _ = format_transcript_checked(raw_transcript)
+            return formatted, _still_valid_analysis(payload), True
+        formatted, _ = format_transcript_checked(raw_transcript)
+        return formatted, None, True
+    formatted, degraded = format_transcript_checked(raw_transcript)
+    return formatted, None, degraded
+
+
+def _still_valid_analysis(payload: dict) -> Optional[dict]:
+    try:
+        return validate_analysis(payload)
+    except ValueError:
+        return None
+
+
+def _native_upload_filename(upload: BinaryIO, file_ext: str) -> Optional[str]:
+    """Return the filename to stream the upload under if it can go to the STT provider untouched.
+
+    That is only possible when neither VAD nor chunking needs decoded samples, and
+    the extension and the sniffed header agree on a container the provider
+    accepts within its size limit.
+    """
+    settings = get_settings()
+    if settings.vad_enabled or settings.stt_chunking_enabled or file_ext not in STT_NATIVE_CONTAINERS:
+        return None
+    size = upload.seek(0, os.SEEK_END)
+    upload.seek(0)
+    if size > STT_NATIVE_MAX_BYTES:
+        return None
+    if not size:
+        raise EmptyAudioError("Uploaded file is empty or invalid")
+    container = sniff_container(upload.read(SNIFF_BYTES))
+    upload.seek(0)
+    if container != STT_NATIVE_CONTAINERS[file_ext]:
+        metrics.increment("transcribe.native_mismatches")
+        return None
+    metrics.increment("transcribe.decode_path.native")
+    return f"audio{file_ext}"
+
+
+def _decode_in_process(upload: BinaryIO) -> tuple[Optional[PcmAudio], Optional[str]]:
+    """Decode plain PCM WAV uploads with NumPy; ``(None, None)`` means ffmpeg is needed.
+
+    Returns the samples and the decode path (``passthrough`` or ``numpy``). The
+    container is sniffed from the header rather than trusted from the extension.
+    """
+    if not is_wav_header(upload.read(12)):
+        upload.seek(0)
+        return None, None
+    upload.seek(0)
+    decoded = decode_wav_file(upload)
+    upload.seek(0)
+    if decoded is None or not decoded[0].samples:
+        return None, None
+    pcm, path = decoded
+    metrics.increment(f"transcribe.decode_path.{path}")
+    logger.info(f"Decoded WAV upload in process ({path}): {pcm.duration_seconds:.1f}s")
+    return pcm, path
+
+
+def _fits_one_request(upload: BinaryIO, pcm: PcmAudio) -> bool:
+    size = upload.seek(0, os.SEEK_END)
+    upload.seek(0)
+    return size <= STT_NATIVE_MAX_BYTES and not _needs_chunking(pcm.duration_seconds)
+
+
+def _trim_silence(pcm: PcmAudio) -> tuple[PcmAudio, float]:
+    """Run VAD over *pcm* and record how much audio never reaches the STT provider."""
+    settings = get_settings()
+    with metrics.timer("transcribe.vad_seconds"):
+        result = trim_silence(pcm, max_pause_ms=settings.vad_max_pause_ms)
+    logger.info(
+        f"VAD kept {result.kept_seconds:.1f}s of {result.original_seconds:.1f}s "
+        f"(trimmed {result.trimmed_ratio:.0%})"
+    )
+    metrics.observe("transcribe.vad_trimmed_ratio", result.trimmed_ratio)
+    metrics.increment("transcribe.vad_input_seconds", result.original_seconds)
+    metrics.increment("transcribe.vad_trimmed_seconds", result.trimmed_seconds)
+    return result.pcm, result.trimmed_ratio
+
+
+def transcribe_pcm_segment(stt_provider: STTProvider, pcm: PcmAudio, *, prefer_wav: bool = False) -> str:
+    """Encode *pcm* with ``STT_UPLOAD_CODEC`` and send it to the STT provider.
+
+    With ``prefer_wav`` the samples are sent as WAV, which needs no ffmpeg, as long
+    as that stays within the provider's size limit. Falls back to WAV if the
+    encoder fails or the transcoder is saturated. Encoded size, encode time and
+    request time are recorded per codec.
+    """
+    settings = get_settings()
+    codec = settings.stt_upload_codec
+    if prefer_wav and len(pcm.samples) + WAV_HEADER_BYTES <= STT_NATIVE_MAX_BYTES:
+        codec = "wav"
+    started = time.perf_counter()
+    try:
+        payload, filename = encode_for_stt(pcm, codec, opus_bitrate=settings.stt_opus_bitrate)
+    except (AudioConversionError, TranscoderBusyError):
+        logger.warning(f"Encoding STT upload as {codec} failed, falling back to WAV")
+        metrics.increment(f"stt_upload.{codec}.encode_failures")
+        codec = "wav"
+        payload, filename = encode_for_stt(pcm, codec)
+    metrics.observe(f"stt_upload.{codec}.encode_seconds", time.perf_counter() - started)
+    metrics.increment(f"stt_upload.{codec}.requests")
+    metrics.increment(f"stt_upload.{codec}.bytes", len(payload))
+    metrics.increment(f"stt_upload.{codec}.audio_seconds", pcm.duration_seconds)
+
+    with metrics.timer(f"stt_upload.{codec}.request_seconds"):
+        return stt_provider.transcribe_bytes(payload, filename=filename)
+
+
+def _needs_chunking(duration_seconds: float) -> bool:
+    settings = get_settings()
+    return settings.stt_chunking_enabled and duration_seconds > settings.stt_segment_max_seconds
+
+
+def _transcribe_pcm(stt_provider: STTProvider, pcm: PcmAudio, *, prefer_wav: bool = False) -> str:
+    """Transcribe *pcm*, fanning long recordings out as parallel segment requests.
+
+    Segments are cut at silences, transcribed concurrently (bounded by
+    ``STT_MAX_CONCURRENCY``) and stitched back in order, so latency tracks the
+    longest segment rather than the whole recording.
+    """
+    settings = get_settings()
+    if not _needs_chunking(pcm.duration_seconds):
+        return transcribe_pcm_segment(stt_provider, pcm, prefer_wav=prefer_wav)
+
+    segments = split_at_silence(
+        pcm,
+        max_seconds=settings.stt_segment_max_seconds,
+        overlap_seconds=settings.stt_segment_overlap_seconds,
+    )
+    logger.info(f"Split {pcm.duration_seconds:.1f}s of audio into {len(segments)} segments for parallel STT")
+    metrics.observe("transcribe.segments_per_request", len(segments))
+
+    def transcribe_segment(segment: PcmAudio) -> str:
+        return transcribe_pcm_segment(stt_provider, segment, prefer_wav=prefer_wav)
+
+    with ThreadPoolExecutor(max_workers=min(settings.stt_max_concurrency, len(segments))) as executor:
+        texts = list(executor.map(transcribe_segment, segments))
+    return stitch_transcripts(texts)
+
+
+_transcript_cache: Optional[TwoTierCache] = None
+
+
+def _get_transcript_cache() -> Optional[TwoTierCache]:
+    global _transcript_cache
+    settings = get_settings()
+    if not settings.transcript_cache_enabled:
+        return None
+    if _transcript_cache is None:
+        _transcript_cache = TwoTierCache(
+            "transcripts",
+            memory_max_bytes=settings.transcript_cache_memory_max_bytes,
+            persistent_max_bytes=settings.transcript_cache_persistent_max_bytes,
+        )
+    return _transcript_cache
+
+
+def reset_transcript_cache() -> None:
+    global _transcript_cache
+    _transcript_cache = None
+
+
+def _save_upload_to_temp_file(upload: BinaryIO, file_ext: str, temp_paths: list[str]) -> str:
+    suffix = file_ext or ".webm"
+    tmp_file = NamedTemporaryFile(delete=False, suffix=suffix)
+    input_path = tmp_file.name
+    temp_paths.append(input_path)
+
+    logger.info(f"Saving uploaded audio to {input_path}")
+
+    with tmp_file:
+        shutil.copyfileobj(upload, tmp_file)
+
+    # Verify file exists and has content
+    if not os.path.exists(input_path) or os.path.getsize(input_path) == 0:
+        raise EmptyAudioError("Uploaded file is empty or invalid")
+    return input_path
+
+
+def _convert_via_temp_files(upload: BinaryIO, file_ext: str, temp_paths: list[str]) -> str:
+    """Copy the upload to disk and let ffmpeg convert it file-to-file."""
+    input_path = _save_upload_to_temp_file(upload, file_ext, temp_paths)
+
+    # Convert to 16kHz mono WAV for optimal Whisper quality
+    output_path = input_path.rsplit(".", 1)[0] + ".wav"
+    temp_paths.append(output_path)
+
+    logger.info(f"Converting {input_path} to {output_path} (16kHz mono WAV)")
+    convert_file_to_wav(input_path, output_path)
+
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        raise AudioConversionError("Audio conversion produced empty file")
+    return output_path
+
+
+def _convert_piped(upload: BinaryIO, file_ext: str, temp_paths: list[str]) -> PcmAudio:
+    """Stream the upload through ffmpeg and return 16kHz mono PCM held in memory."""
+    input_path: str | None = None
+    if file_ext in PIPE_UNSAFE_EXTENSIONS:
+        # ffmpeg needs a seekable input for MP4-family containers; only the
+        # output side can stay in memory.
+        input_path = _save_upload_to_temp_file(upload, file_ext, temp_paths)
+        upload_bytes = b""
+    else:
+        upload_bytes = upload.read()
+        logger.info(f"Piping {len(upload_bytes)} bytes of uploaded audio to ffmpeg")
+        if not upload_bytes:
+            raise EmptyAudioError("Uploaded file is empty or invalid")
+
+    pcm = convert_bytes_to_pcm(upload_bytes, input_path=input_path)
+    if not pcm.samples:
+        raise AudioConversionError("Audio conversion produced empty file")
+
+    logger.info(f"Converted upload to {pcm.duration_seconds:.1f}s of 16kHz mono PCM in memory")
+    return pcm
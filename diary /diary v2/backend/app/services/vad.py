@@ -0,0 +1,117 @@
+"""Vectorized voice-activity detection and silence trimming.
+
+Frames are classified as speech from their energy relative to the recording's
+own noise floor, with zero-crossing rate rescuing quiet unvoiced consonants
+(s, sh, f) that energy alone misses. Leading and trailing silence is dropped
+and long internal pauses are shortened before the audio goes to STT.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .audio import FRAME_MS, SAMPLE_WIDTH, PcmAudio, frame_rms, frame_samples
+
+# Speech must be this far above the noise floor (10th percentile frame energy).
+ENERGY_MARGIN_DB = 12.0
+# Quieter frames still count as speech when they are this loud and noisy (fricatives).
+FRICATIVE_MARGIN_DB = 6.0
+FRICATIVE_MIN_ZCR = 0.25
+# Frames below this level are never speech, even in a perfectly silent recording.
+ABSOLUTE_FLOOR_DBFS = -55.0
+# Cap on the estimated noise floor so a window of continuous speech is not
+# mistaken for background noise.
+NOISE_FLOOR_CEILING_DBFS = -40.0
+# Speech regions are padded so word onsets and decays are not clipped.
+HANGOVER_MS = 150
+
+
+@dataclass
+class VadResult:
+    pcm: PcmAudio
+    original_seconds: float
+    kept_seconds: float
+
+    @property
+    def trimmed_seconds(self) -> float:
+        return self.original_seconds - self.kept_seconds
+
+    @property
+    def trimmed_ratio(self) -> float:
+        if self.original_seconds <= 0:
+            return 0.0
+        return self.trimmed_seconds / self.original_seconds
+
+
+def detect_speech(pcm: PcmAudio, frame_ms: int = FRAME_MS) -> np.ndarray:
+    """Return a boolean speech mask with one value per ``frame_ms`` frame."""
+    framed = frame_samples(pcm, frame_ms)
+    if not len(framed):
+        return np.zeros(0, dtype=bool)
+
+    energy_db = 20 * np.log10(frame_rms(pcm, frame_ms) / 32768.0 + 1e-10)
+    signs = np.signbit(framed)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+    noise_floor = min(np.percentile(energy_db, 10), NOISE_FLOOR_CEILING_DBFS)
+    loud = energy_db > max(noise_floor + ENERGY_MARGIN_DB, ABSOLUTE_FLOOR_DBFS)
+    fricative = (energy_db > max(noise_floor + FRICATIVE_MARGIN_DB, ABSOLUTE_FLOOR_DBFS)) & (zcr > FRICATIVE_MIN_ZCR)
+    speech = loud | fricative
+
+    hangover = max(1, HANGOVER_MS // frame_ms)
+    kernel = np.ones(2 * hangover + 1)
+    # mode="same" returns max(len(speech), len(kernel)) values; keep one per frame for short clips.
+    return (np.convolve(speech.astype(np.float64), kernel, mode="same") > 0)[: len(speech)]
+
+
+def vad_signature() -> tuple:
+    """Detection thresholds, for cache keys of results that depend on trimming."""
+    return (
+        ENERGY_MARGIN_DB,
+        FRICATIVE_MARGIN_DB,
+        FRICATIVE_MIN_ZCR,
+        ABSOLUTE_FLOOR_DBFS,
+        NOISE_FLOOR_CEILING_DBFS,
+        HANGOVER_MS,
+    )
+
+
+def trim_silence(pcm: PcmAudio, *, max_pause_ms: int, frame_ms: int = FRAME_MS) -> VadResult:
+    """Drop leading/trailing silence and shorten pauses longer than ``max_pause_ms``.
+
+    Long pauses keep ``max_pause_ms`` of silence, split evenly around the cut, so
+    sentence boundaries still sound like boundaries to the STT model. Audio with no
+    detectable speech is returned unchanged and left for the provider to judge.
+    """
+    original_seconds = pcm.duration_seconds
+    speech = detect_speech(pcm, frame_ms)
+    if not speech.any():
+        return VadResult(pcm=pcm, original_seconds=original_seconds, kept_seconds=original_seconds)
+
+    keep = speech.copy()
+    max_pause_frames = max_pause_ms // frame_ms
+    edges = np.flatnonzero(np.diff(np.concatenate(([1], speech.astype(np.int8), [1]))))
+    # edges pair up as [start, end) of every silent run
+    for start, end in zip(edges[::2], edges[1::2]):
+        if start == 0 or end == len(speech):
+            continue  # leading/trailing silence is dropped entirely
+        head = min(end - start, max_pause_frames - max_pause_frames // 2)
+        tail = min(end - start - head, max_pause_frames // 2)
+        keep[start : start + head] = True
+        keep[end - tail : end] = True
+
+    frame_len = pcm.sample_rate * frame_ms // 1000
+    samples = np.frombuffer(pcm.samples, dtype="<i2")
+    sample_mask = np.repeat(keep, frame_len)
+    ragged_tail = len(samples) - len(sample_mask)
+    if ragged_tail:
+        sample_mask = np.concatenate((sample_mask, np.full(ragged_tail, keep[-1])))
+    trimmed = PcmAudio(samples=samples[sample_mask].tobytes(), sample_rate=pcm.sample_rate)
+
+    return VadResult(
+        pcm=trimmed,
+        original_seconds=original_seconds,
+        kept_seconds=len(trimmed.samples) / (SAMPLE_WIDTH * pcm.sample_rate),
+    )
@@ -0,0 +1 @@
+"""Standalone benchmark scripts for the backend (run with ``python -m benchmarks.<name>``)."""
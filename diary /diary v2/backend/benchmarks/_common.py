@@ -0,0 +1,45 @@
+"""Helpers shared by the benchmark scripts."""
+
+from __future__ import annotations
+
+import os
+import statistics
+import subprocess
+from typing import Sequence
+
+
+def configure_environment() -> None:
+    """Provide the settings the app needs at import time, forcing mock AI providers."""
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("USE_MOCK_AI", "true")
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of *samples* (pct in 0..100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(label: str, latencies: Sequence[float]) -> str:
+    """Format p50/p95/mean latencies (seconds in, milliseconds out)."""
+    return (
+        f"{label:<24} n={len(latencies):<4} "
+        f"p50={percentile(latencies, 50) * 1000:8.1f}ms "
+        f"p95={percentile(latencies, 95) * 1000:8.1f}ms "
+        f"mean={statistics.fmean(latencies) * 1000 if latencies else 0.0:8.1f}ms"
+    )
+
+
+def synthesize_audio(seconds: float, fmt: str = "webm") -> bytes:
+    """Generate a speech-band test tone encoded as *fmt* using ffmpeg's lavfi source."""
+    codec = {"webm": ["-c:a", "libopus"], "mp3": ["-c:a", "libmp3lame"], "wav": []}[fmt]
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=48000",
+        "-ac", "2", *codec, "-f", fmt, "pipe:1",
+    ]
+    return subprocess.run(cmd, check=True, capture_output=True).stdout
@@ -0,0 +1,96 @@
+"""Compare file-based and piped ffmpeg conversion for /transcribe.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_conversion --seconds 120 --iterations 20
+    python -m benchmarks.bench_conversion --input sample.webm
+
+Reports p50/p95 latency per mode together with the bytes the pipeline wrote to
+and read from temporary files and the block I/O reported by the kernel for the
+ffmpeg children.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import resource
+import time
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from ._common import configure_environment, summarize, synthesize_audio
+
+configure_environment()
+
+from app.services.audio import convert_bytes_to_pcm, convert_file_to_wav  # noqa: E402
+
+
+def run_file_mode(upload: bytes, suffix: str) -> tuple[bytes, int, int]:
+    """Mirror the temp-file path: upload → disk → ffmpeg → disk → memory."""
+    written = read = 0
+    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(upload)
+        input_path = tmp.name
+    written += len(upload)
+    output_path = input_path.rsplit(".", 1)[0] + ".wav"
+    try:
+        convert_file_to_wav(input_path, output_path)
+        wav = Path(output_path).read_bytes()
+        written += len(wav)  # ffmpeg output
+        read += len(upload) + len(wav)  # ffmpeg input + STT read-back
+        return wav, written, read
+    finally:
+        for path in (input_path, output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run_pipe_mode(upload: bytes) -> tuple[bytes, int, int]:
+    return convert_bytes_to_pcm(upload).to_wav(), 0, 0
+
+
+def _blocks() -> tuple[int, int]:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_inblock, usage.ru_oublock
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, help="Audio file to convert (default: synthetic tone)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of the synthetic tone")
+    parser.add_argument("--format", default="webm", choices=["webm", "mp3", "wav"])
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.input:
+        upload, suffix = args.input.read_bytes(), args.input.suffix
+    else:
+        upload, suffix = synthesize_audio(args.seconds, args.format), f".{args.format}"
+    print(f"Input: {len(upload) / 1024:.0f} KiB ({suffix}), {args.iterations} iterations per mode\n")
+
+    modes = {
+        "file": lambda: run_file_mode(upload, suffix),
+        "pipe": lambda: run_pipe_mode(upload),
+    }
+    for name, run in modes.items():
+        latencies: list[float] = []
+        bytes_written = bytes_read = 0
+        in_before, out_before = _blocks()
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            _, written, read = run()
+            latencies.append(time.perf_counter() - started)
+            bytes_written += written
+            bytes_read += read
+        in_after, out_after = _blocks()
+        print(summarize(name, latencies))
+        print(
+            f"{'':<24} temp-file bytes/request: written={bytes_written / args.iterations / 1024:.0f} KiB "
+            f"read={bytes_read / args.iterations / 1024:.0f} KiB; "
+            f"ffmpeg blocks in={in_after - in_before} out={out_after - out_before}"
+        )
+
+
+if __name__ == "__main__":
+    main()
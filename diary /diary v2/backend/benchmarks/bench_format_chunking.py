@@ -0,0 +1,63 @@
+"""Compare single-completion and chunked parallel formatting of a long transcript.
+
+Usage (from ``backend/``, needs a real ``OPENAI_API_KEY``)::
+
+    python -m benchmarks.bench_format_chunking --transcript-file long_entry.txt --iterations 3
+
+Without ``--transcript-file`` the built-in sample is repeated to about the length
+of a 20-minute entry. Both modes go through ``format_transcript`` with the
+response cache bypassed; only ``FORMAT_CHUNKING_ENABLED`` differs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from ._common import configure_environment, summarize
+
+if not os.environ.get("OPENAI_API_KEY"):
+    raise SystemExit("OPENAI_API_KEY must be set to run this benchmark")
+os.environ["USE_MOCK_AI"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+configure_environment()
+
+from app.core.config import get_settings  # noqa: E402
+from app.services.llm import format_transcript  # noqa: E402
+
+SAMPLE_SENTENCE = (
+    "ну сегодня опять весь день на работе дедлайн перенесли и я честно говоря устал "
+    "today I feel really tired и вообще вымотался за неделю хочется просто выспаться. "
+)
+# Roughly 150 spoken words per minute.
+TWENTY_MINUTES_WORDS = 3000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcript-file", type=Path, help="Raw transcript to use (default: repeated sample)")
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.transcript_file:
+        transcript = args.transcript_file.read_text()
+    else:
+        transcript = SAMPLE_SENTENCE * (TWENTY_MINUTES_WORDS // len(SAMPLE_SENTENCE.split()))
+    settings = get_settings()
+    print(f"Transcript: {len(transcript.split())} words, {len(transcript)} chars, {args.iterations} iterations\n")
+
+    for name, chunked in {"single completion": False, "chunked parallel": True}.items():
+        settings.format_chunking_enabled = chunked
+        latencies = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            formatted = format_transcript(transcript)
+            latencies.append(time.perf_counter() - started)
+        print(summarize(name, latencies))
+        print(f"{'':<24} output chars={len(formatted)} ({len(formatted) / len(transcript):.0%} of input)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compare the multi-call LLM path with the fused format+analyze call.
+
+Usage (from ``backend/``, needs a real ``OPENAI_API_KEY``)::
+
+    python -m benchmarks.bench_llm_fused --iterations 5
+    python -m benchmarks.bench_llm_fused --transcript-file note.txt
+
+The multi-call path mirrors what a client pays today: ``format_transcript``,
+then ``analyze_transcript`` and the entry insight prompt on the formatted text.
+The fused path is one ``format_and_analyze`` completion. Latency percentiles and
+mean prompt/completion tokens per entry are reported for both; the response
+cache is bypassed so every iteration hits the API.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+from datetime import date
+from pathlib import Path
+
+from ._common import configure_environment, summarize
+
+if not os.environ.get("OPENAI_API_KEY"):
+    raise SystemExit("OPENAI_API_KEY must be set to run this benchmark")
+os.environ["USE_MOCK_AI"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+configure_environment()
+
+from app.core.config import get_settings  # noqa: E402
+from app.services.clients import get_openai_client  # noqa: E402
+from app.services.insights import ENTRY_INSIGHT_PROMPT  # noqa: E402
+from app.services.llm import FORMAT_AND_ANALYZE_PROMPT, LLM_PROMPT, TRANSCRIPT_FORMATTING_PROMPT  # noqa: E402
+
+SAMPLE_TRANSCRIPT = (
+    "ну сегодня опять весь день на работе эээ дедлайн перенесли и я честно говоря устал "
+    "today I feel really tired и вообще вымотался за неделю хочется просто выспаться "
+    "и может в выходные съездить за город с друзьями"
+)
+
+
+def _complete(system: str, user: str, *, temperature: float, json_mode: bool) -> tuple[str, int, int]:
+    settings = get_settings()
+    kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+    completion = get_openai_client().chat.completions.create(
+        model=settings.openai_llm_model,
+        temperature=temperature,
+        messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+        **kwargs,
+    )
+    usage = completion.usage
+    return completion.choices[0].message.content or "", usage.prompt_tokens, usage.completion_tokens
+
+
+def run_multi_call(transcript: str) -> tuple[int, int]:
+    formatted, p1, c1 = _complete(TRANSCRIPT_FORMATTING_PROMPT, transcript, temperature=0.1, json_mode=False)
+    _, p2, c2 = _complete(LLM_PROMPT, formatted, temperature=0.2, json_mode=True)
+    insight_prompt = ENTRY_INSIGHT_PROMPT.format(
+        transcript=formatted,
+        date=date.today().isoformat(),
+        mood_label="neutral",
+        tags="none",
+        word_count=len(formatted.split()),
+    ).replace("{{", "{").replace("}}", "}")
+    _, p3, c3 = _complete(
+        "You are a reflective diary assistant. Always respond with valid JSON.",
+        insight_prompt,
+        temperature=0.3,
+        json_mode=True,
+    )
+    return p1 + p2 + p3, c1 + c2 + c3
+
+
+def run_fused(transcript: str) -> tuple[int, int]:
+    _, prompt_tokens, completion_tokens = _complete(FORMAT_AND_ANALYZE_PROMPT, transcript, temperature=0.1, json_mode=True)
+    return prompt_tokens, completion_tokens
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcript-file", type=Path, help="Raw transcript to use (default: built-in sample)")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    transcript = args.transcript_file.read_text() if args.transcript_file else SAMPLE_TRANSCRIPT
+    print(f"Transcript: {len(transcript.split())} words, {args.iterations} iterations per mode\n")
+
+    for name, run in {"multi-call (3 requests)": run_multi_call, "fused (1 request)": run_fused}.items():
+        latencies, prompt_tokens, completion_tokens = [], [], []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            prompt, completion = run(transcript)
+            latencies.append(time.perf_counter() - started)
+            prompt_tokens.append(prompt)
+            completion_tokens.append(completion)
+        print(summarize(name, latencies))
+        print(
+            f"{'':<24} tokens/entry: prompt={statistics.fmean(prompt_tokens):.0f} "
+            f"completion={statistics.fmean(completion_tokens):.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Check that the offline local analyzer stays within its latency budget.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_local_analyzer --iterations 200 --budget-ms 2
+    python -m benchmarks.bench_local_analyzer --transcript-file entry.txt
+
+Times :func:`~app.services.local_analyzer.analyze_locally` on a ~1,600-character
+Russian entry (or ``--transcript-file``) against a three-tag vocabulary, once
+with the per-word stem/mood caches warm and once with them cleared before every
+call. Exits with status 1 when the cold p50 is over ``--budget-ms``, the budget
+the module docstring promises.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from ._common import configure_environment, percentile, summarize
+
+configure_environment()
+
+from app.services import local_analyzer  # noqa: E402
+from app.services.local_analyzer import TagVocabulary, analyze_locally  # noqa: E402
+
+BUDGET_MS = 2.0
+SAMPLE_ENTRY = (
+    "Сегодня проснулся рано, ещё до будильника, и долго лежал, глядя в потолок. В голове крутились мысли о "
+    "завтрашней презентации: кажется, я снова не успеваю подготовить все слайды, а начальник ждёт полный отчёт "
+    "по кварталу. На работе весь день было шумно, коллеги обсуждали новый проект, и мне трудно было "
+    "сосредоточиться. Пообедать толком не получилось — перекусил бутербродом прямо за столом. Вечером позвонила "
+    "мама, спрашивала, когда я приеду в гости. Я пообещал выбраться в выходные, хотя сам не уверен, что найду "
+    "силы. Потом всё-таки вышел пройтись по парку: листья уже желтеют, воздух прохладный, и стало немного "
+    "спокойнее. Встретил соседа с собакой, поболтали о погоде и о ремонте в подъезде. Дома приготовил гречку с "
+    "овощами, посмотрел пару серий сериала и понял, что ужасно устал. Чувствую тревогу из-за работы и какую-то "
+    "пустоту, будто бегу по кругу. Хочется больше времени проводить с друзьями, заниматься спортом, читать "
+    "книги, а не только сидеть за ноутбуком. Надеюсь, что после презентации станет легче и я смогу наконец "
+    "отдохнуть. Завтра попробую лечь пораньше и не проверять почту перед сном. Ещё нужно записаться к "
+    "стоматологу и оплатить счета за квартиру. В целом день был длинный, но не совсем плохой: прогулка и "
+    "разговор с мамой всё-таки согрели. Благодарен себе за то, что не сорвался и дошёл до конца. Перед сном "
+    "записал несколько идей для выходных: съездить за город, позвать друзей на ужин и наконец разобрать балкон. Кажется, "
+    "мне просто нужно чуть больше отдыха и меньше требований к себе, тогда и работа пойдёт легче."
+)
+VOCABULARY = TagVocabulary(frequencies={"работа": 12, "усталость": 5, "друзья": 3}, documents=40)
+
+
+def _clear_word_caches() -> None:
+    local_analyzer._stem.cache_clear()
+    local_analyzer._mood_of.cache_clear()
+
+
+def _time_calls(transcript: str, iterations: int, *, cold: bool) -> list[float]:
+    latencies = []
+    for _ in range(iterations):
+        if cold:
+            _clear_word_caches()
+        started = time.perf_counter()
+        analyze_locally(transcript, VOCABULARY)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcript-file", type=Path, help="Entry text to analyze (default: built-in sample)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="Allowed cold p50 per call")
+    args = parser.parse_args()
+
+    transcript = args.transcript_file.read_text() if args.transcript_file else SAMPLE_ENTRY
+    print(f"Entry: {len(transcript)} chars, {len(VOCABULARY.frequencies)} tags, {args.iterations} iterations\n")
+
+    analyze_locally(transcript, VOCABULARY)  # compile regexes, warm the caches
+    print(summarize("warm word caches", _time_calls(transcript, args.iterations, cold=False)))
+    cold = _time_calls(transcript, args.iterations, cold=True)
+    print(summarize("cold word caches", cold))
+
+    p50_ms = percentile(cold, 50) * 1000
+    if p50_ms > args.budget_ms:
+        print(f"\nFAIL: cold p50 {p50_ms:.2f}ms is over the {args.budget_ms:.2f}ms budget")
+        sys.exit(1)
+    print(f"\nOK: cold p50 {p50_ms:.2f}ms is within the {args.budget_ms:.2f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
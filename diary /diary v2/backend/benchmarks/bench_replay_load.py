@@ -0,0 +1,79 @@
+"""Offline load test of entry analysis against a recorded OpenAI cassette.
+
+Usage (from ``backend/``)::
+
+    # once, with a real OPENAI_API_KEY: record the workload's responses and timing
+    python -m benchmarks.bench_replay_load --record --requests 40 --concurrency 4
+    # any time after, without network access
+    python -m benchmarks.bench_replay_load --requests 400 --concurrency 32
+
+Each request runs ``analyze_transcript`` on one of a few sample transcripts
+through the real provider stack (router, micro-batcher, outbound governor, SDK),
+with the response cache bypassed. Replay delivers the recorded responses with
+their recorded latency, so throughput, queueing in the governor and tail latency
+behave like the live API; ``--latency-scale`` speeds the provider up or slows it
+down. Requests beyond what was recorded reuse recordings of the same endpoint.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ._common import configure_environment, summarize
+
+SAMPLE_TRANSCRIPTS = [
+    "ну сегодня опять весь день на работе дедлайн перенесли и я честно говоря устал",
+    "today I feel really tired и вообще вымотался за неделю хочется просто выспаться",
+    "в выходные съездили за город с друзьями было спокойно и очень хорошо",
+    "сьогодні хвилююся через співбесіду але намагаюся думати про хороше",
+]
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--record", action="store_true", help="Call the real API and append to the cassette")
+parser.add_argument("--cassette", default="cassettes/bench_replay_load.jsonl")
+parser.add_argument("--requests", type=int, default=100)
+parser.add_argument("--concurrency", type=int, default=8)
+parser.add_argument("--latency-scale", type=float, default=1.0)
+args = parser.parse_args()
+
+if args.record and not os.environ.get("OPENAI_API_KEY"):
+    raise SystemExit("OPENAI_API_KEY must be set to record a cassette")
+os.environ["OPENAI_CASSETTE_MODE"] = "record" if args.record else "replay"
+os.environ["OPENAI_CASSETTE_PATH"] = args.cassette
+os.environ["OPENAI_CASSETTE_LATENCY_SCALE"] = str(args.latency_scale)
+os.environ.setdefault("OPENAI_CASSETTE_SEED", "0")
+os.environ["USE_MOCK_AI"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+configure_environment()
+
+from app.core.metrics import metrics  # noqa: E402
+from app.services.llm import analyze_transcript  # noqa: E402
+
+
+def timed_analysis(index: int) -> float:
+    started = time.perf_counter()
+    analyze_transcript(SAMPLE_TRANSCRIPTS[index % len(SAMPLE_TRANSCRIPTS)])
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    mode = "record" if args.record else f"replay x{args.latency_scale:g}"
+    print(f"{mode}: {args.requests} requests, concurrency {args.concurrency}, cassette {args.cassette}\n")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(timed_analysis, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    print(summarize("analyze_transcript", latencies))
+    print(f"{'throughput':<24} {args.requests / elapsed:.1f} req/s over {elapsed:.1f}s")
+    counters = ("recorded", "hits", "sampled", "misses")
+    print(f"{'cassette':<24} " + " ".join(f"{name}={metrics.counter(f'cassette.{name}')}" for name in counters))
+    print(f"{'governor queueing':<24} mean wait={metrics.mean('outbound.openai.chat.wait_seconds') * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Measure peak RSS of a whole transcription request for each STT upload path.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_stt_memory --size-mb 20 --iterations 3
+
+Every measurement runs in a fresh subprocess and reports how far the process's
+peak RSS rose above its RSS at the start of one request, so every copy the
+request makes counts, not only allocations inside the provider call. Linux
+only: the peak (``VmHWM``) is reset through ``/proc/self/clear_refs``. The upload is a
+16 kHz mono WAV file (noise, so VAD keeps all of it); a local stub server stands
+in for the OpenAI transcription endpoint and drains the multipart body, so the
+numbers include the real SDK/httpx upload path. Modes:
+
+* ``default`` – ``transcribe_upload`` with VAD and STT chunking on (the default
+  settings): the samples are decoded into memory, and VAD output and per-segment
+  WAV payloads are held while the segments upload;
+* ``native`` – ``transcribe_upload`` with VAD and chunking off: the upload is
+  streamed to the provider from its file handle (at most 25 MB);
+* ``bytes`` – the provider alone, handed the upload read into memory.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from ._common import configure_environment, summarize
+
+os.environ["TRANSCRIPT_CACHE_ENABLED"] = "false"
+configure_environment()
+
+from app.core.config import get_settings  # noqa: E402
+from app.services import transcription  # noqa: E402
+from app.services.providers import WhisperSTTProvider  # noqa: E402
+
+DRAIN_CHUNK = 64 * 1024
+MODES = ("default", "native", "bytes")
+
+
+class _StubTranscriptionHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:  # noqa: N802
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(DRAIN_CHUNK, remaining)))
+        body = b"stub transcript"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+
+def _status_mib(field: str) -> float:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith(f"{field}:"):
+            return int(line.split()[1]) / 1024  # reported in kB
+    raise RuntimeError(f"{field} missing from /proc/self/status")
+
+
+def _reset_peak_rss() -> float:
+    """Make the current RSS the new peak and return it."""
+    Path("/proc/self/clear_refs").write_text("5")
+    return _status_mib("VmRSS")
+
+
+def _run_request(mode: str, audio_path: str) -> dict:
+    """Child process: serve the stub, run one request in *mode* and report its RSS growth."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubTranscriptionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    provider = WhisperSTTProvider(api_key="bench", model="whisper-1")
+    provider.client = provider.client.with_options(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    transcription.build_stt_provider = lambda: provider
+    if mode == "native":
+        settings = get_settings()
+        settings.vad_enabled = settings.stt_chunking_enabled = False
+
+    baseline = _reset_peak_rss()
+    started = time.perf_counter()
+    if mode == "bytes":
+        provider.transcribe_bytes(Path(audio_path).read_bytes(), filename="audio.wav")
+    else:
+        with open(audio_path, "rb") as upload:
+            transcription.transcribe_upload(upload, ".wav", formatted=False)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return {"seconds": elapsed, "rss_growth_mib": _status_mib("VmHWM") - baseline}
+
+
+def _write_noise_wav(size_mb: float) -> str:
+    with NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+        with wave.open(tmp, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(os.urandom(int(size_mb * 1024 * 1024) // 2 * 2))
+        return tmp.name
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=20.0, help="Size of the uploaded WAV file")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--audio", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_run_request(args.child, args.audio)))
+        return
+
+    audio_path = _write_noise_wav(args.size_mb)
+    print(f"Upload: {args.size_mb:.0f} MiB WAV, {args.iterations} iterations per mode\n")
+    try:
+        for mode in MODES:
+            runs = [
+                json.loads(
+                    subprocess.run(
+                        [sys.executable, "-m", "benchmarks.bench_stt_memory", "--child", mode, "--audio", audio_path],
+                        check=True,
+                        capture_output=True,
+                        text=True,
+                    ).stdout.splitlines()[-1]
+                )
+                for _ in range(args.iterations)
+            ]
+            print(summarize(mode, [run["seconds"] for run in runs]))
+            print(f"{'':<24} peak RSS growth/request: {max(run['rss_growth_mib'] for run in runs):.1f} MiB")
+    finally:
+        os.remove(audio_path)
+
+
+if __name__ == "__main__":
+    main()
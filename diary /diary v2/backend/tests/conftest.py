@@ -19,6 +19,8 @@ os.environ["USE_MOCK_AI"] = "true"
 os.environ["LLM_PROVIDER"] = "mock"
 os.environ["STT_PROVIDER"] = "mock"
 os.environ["STORAGE_PROVIDER"] = "local"
+# Unit tests run without an ffmpeg binary, so keep STT uploads as in-process WAV.
+os.environ["STT_UPLOAD_CODEC"] = "wav"
 os.environ.setdefault("MEDIA_ROOT", "backend/app/data")
 os.environ.setdefault("ALLOWED_ORIGINS", "http://localhost:5173")
 
@@ -0,0 +1,219 @@
+"""Tests for the background entry-analysis pipeline."""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models import Entry, Insight, Tag
+from app.models.user import User
+from app.services import analysis as analysis_service
+from app.services.analysis import EntryAnalysisQueue, store_supplied_analysis
+from app.services.local_analyzer import TagVocabulary, analyze_locally
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, expire_on_commit=False)
+    finally:
+        Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def make_queue(session_factory):
+    queues = []
+
+    def factory(max_workers=1, max_queue=4, local_analyzer=False):
+        queue = EntryAnalysisQueue(
+            max_workers=max_workers,
+            max_queue=max_queue,
+            precompute_insight=False,
+            local_analyzer=local_analyzer,
+            session_factory=session_factory,
+        )
+        queues.append(queue)
+        return queue
+
+    yield factory
+    for queue in queues:
+        queue.shutdown(wait=True)
+
+
+@pytest.fixture
+def create_entry(session_factory):
+    with session_factory() as db:
+        user = User(email="analysis@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+
+    def factory(transcript="Сегодня много работы", status="pending"):
+        with session_factory() as db:
+            entry = Entry(
+                user_id=user_id,
+                transcript=transcript,
+                title="",
+                mood_label="neutral",
+                insights=[],
+                analysis_status=status,
+            )
+            db.add(entry)
+            db.commit()
+            return entry.id
+
+    return factory
+
+
+def wait_for_status(session_factory, entry_id, statuses=("done", "failed"), timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        with session_factory() as db:
+            entry = db.get(Entry, entry_id)
+            if entry.analysis_status in statuses or time.monotonic() > deadline:
+                return entry, [tag.name for tag in entry.tags]
+        time.sleep(0.01)
+
+
+def test_queue_enriches_pending_entry(make_queue, create_entry, session_factory):
+    entry_id = create_entry()
+
+    assert make_queue().enqueue(entry_id)
+    entry, tags = wait_for_status(session_factory, entry_id)
+
+    assert entry.analysis_status == "done"
+    assert entry.analysis_attempts == 1
+    assert entry.title == "Мысли о работе"
+    assert entry.mood_label == "anxious"
+    assert tags == ["работа", "усталость", "сомнения"]
+
+
+def test_tags_are_shared_between_entries(make_queue, create_entry, session_factory):
+    queue = make_queue()
+    first, second = create_entry(), create_entry("Опять работа")
+    queue.enqueue(first)
+    queue.enqueue(second)
+    wait_for_status(session_factory, first)
+    wait_for_status(session_factory, second)
+
+    with session_factory() as db:
+        names = db.execute(select(Tag.name)).scalars().all()
+    assert sorted(names) == sorted(["работа", "усталость", "сомнения"])
+
+
+def test_failed_analysis_is_recorded(make_queue, create_entry, session_factory, monkeypatch):
+    def failing_analyze(transcript):
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(analysis_service, "analyze_transcript", failing_analyze)
+    monkeypatch.setattr(analysis_service, "MAX_ATTEMPTS", 1)
+    entry_id = create_entry()
+
+    make_queue().enqueue(entry_id)
+    entry, tags = wait_for_status(session_factory, entry_id)
+
+    assert entry.analysis_status == "failed"
+    assert entry.analysis_error == "LLM unavailable"
+    assert tags == []
+
+
+def test_saturated_queue_defers_and_sweeps_pending_entries(make_queue, create_entry, session_factory, monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+    original = analysis_service.analyze_transcript
+
+    def blocking_analyze(transcript):
+        started.set()
+        release.wait(5)
+        return original(transcript)
+
+    monkeypatch.setattr(analysis_service, "analyze_transcript", blocking_analyze)
+    queue = make_queue(max_workers=1, max_queue=1)
+    running, waiting, deferred = create_entry(), create_entry(), create_entry()
+
+    assert queue.enqueue(running)
+    started.wait(5)
+    assert queue.enqueue(waiting)
+    assert not queue.enqueue(deferred)
+    release.set()
+
+    entry, _ = wait_for_status(session_factory, deferred)
+    assert entry.analysis_status == "done"
+
+
+def test_recover_resumes_interrupted_entries(make_queue, create_entry, session_factory):
+    interrupted = create_entry(status="running")
+    pending = create_entry()
+    skipped = create_entry(status="skipped")
+
+    assert make_queue().recover() == 2
+
+    assert wait_for_status(session_factory, interrupted)[0].analysis_status == "done"
+    assert wait_for_status(session_factory, pending)[0].analysis_status == "done"
+    assert wait_for_status(session_factory, skipped, timeout=0.05)[0].analysis_status == "skipped"
+
+
+def test_supplied_analysis_is_stored_without_llm(create_entry, session_factory, monkeypatch):
+    monkeypatch.setattr(analysis_service, "analyze_transcript", lambda transcript: pytest.fail("LLM called"))
+    entry_id = create_entry()
+    analysis = {
+        "title": "Рабочий день",
+        "mood_label": "tired",
+        "tags": ["Работа"],
+        "insights": ["Ты много успел."],
+        "insight": {"summary": "Про работу", "bullets": ["Усталость"], "language": "ru"},
+    }
+
+    with session_factory() as db:
+        entry = db.get(Entry, entry_id)
+        store_supplied_analysis(db, entry, analysis)
+
+    entry, tags = wait_for_status(session_factory, entry_id)
+    assert entry.analysis_status == "done" and entry.title == "Рабочий день"
+    assert tags == ["работа"]
+    with session_factory() as db:
+        insight = db.execute(select(Insight).where(Insight.source_entry_id == entry_id)).scalar_one()
+    assert insight.summary == "Про работу" and insight.details == "- Усталость"
+
+
+def test_local_analyzer_matches_the_users_tags_without_llm(make_queue, create_entry, session_factory, monkeypatch):
+    queue = make_queue()
+    first = create_entry("Сегодня много работы, я устал и сомневаюсь в себе")
+    queue.enqueue(first)
+    wait_for_status(session_factory, first)
+
+    monkeypatch.setattr(analysis_service, "analyze_transcript", lambda transcript: pytest.fail("LLM called"))
+    second = create_entry("Опять работа до ночи. Очень устала, переживаю и волнуюсь из-за отчёта.")
+    make_queue(local_analyzer=True).enqueue(second)
+    entry, tags = wait_for_status(session_factory, second)
+
+    assert entry.analysis_status == "done"
+    assert entry.title == "Опять работа до ночи"
+    assert entry.mood_label == "anxious" and entry.insights == []
+    assert sorted(tags) == ["работа", "усталость"]
+
+
+def test_local_analyzer_escalates_when_unsure(make_queue, create_entry, session_factory):
+    entry_id = create_entry("Сегодня много работы")  # no tag vocabulary and no mood words yet
+
+    make_queue(local_analyzer=True).enqueue(entry_id)
+    entry, tags = wait_for_status(session_factory, entry_id)
+
+    assert entry.title == "Мысли о работе"  # from the (mock) LLM
+    assert tags == ["работа", "усталость", "сомнения"]
+
+
+def test_local_analyzer_detects_language_and_discounts_common_tags():
+    vocabulary = TagVocabulary({"work": 9, "family": 1, "sleep": 1}, documents=10)
+
+    result = analyze_locally("I worked late again and missed dinner with my family. So tired and worried.", vocabulary)
+
+    assert result.language == "en" and result.language_confidence > 0.9
+    assert result.tags == ["family", "work"]
+    assert result.mood_label in {"tired", "anxious"}
+    assert analyze_locally("Сьогодні я дуже втомився на роботі, але ввечері відпочив.").language == "uk"
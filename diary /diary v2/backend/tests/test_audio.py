@@ -0,0 +1,360 @@
+"""Tests for the audio conversion pipeline."""
+
+import io
+import json
+import time
+import wave
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.metrics import metrics
+from app.main import app
+from app.services import audio as audio_service
+from app.services import transcription as transcription_service
+from app.services.audio import AudioConversionError, PcmAudio, decode_wav_bytes
+from app.services.chunking import split_at_silence, stitch_transcripts
+from app.services.vad import trim_silence
+
+
+def test_pcm_audio_to_wav_has_valid_header():
+    pcm = PcmAudio(samples=b"\x01\x00" * 16000)
+
+    with wave.open(io.BytesIO(pcm.to_wav())) as wav_file:
+        assert wav_file.getnchannels() == 1
+        assert wav_file.getsampwidth() == 2
+        assert wav_file.getframerate() == 16000
+        assert wav_file.getnframes() == 16000
+    assert pcm.duration_seconds == 1.0
+
+
+def test_transcribe_pipe_mode_never_writes_temp_files(monkeypatch):
+    received = {}
+
+    def fake_convert(upload_bytes, input_path=None):
+        received["upload"] = upload_bytes
+        received["input_path"] = input_path
+        return PcmAudio(samples=b"\x00\x00" * 1600)
+
+    def fail_temp_file(*args, **kwargs):
+        raise AssertionError("pipe mode must not spool the upload to disk")
+
+    monkeypatch.setattr(transcription_service.get_settings(), "audio_conversion_mode", "pipe")
+    monkeypatch.setattr(transcription_service, "convert_bytes_to_pcm", fake_convert)
+    monkeypatch.setattr(transcription_service, "NamedTemporaryFile", fail_temp_file)
+
+    client = TestClient(app)
+    response = client.post("/transcribe", files={"file": ("note.webm", b"webm-bytes", "audio/webm")})
+
+    assert response.status_code == 200
+    assert response.json()["text"].startswith("Это тестовая запись")
+    assert received == {"upload": b"webm-bytes", "input_path": None}
+
+
+def _tone_with_gaps(pattern):
+    """Build 16kHz PCM from (seconds, loud) pairs: loud spans are a square wave, others silence."""
+    chunks = []
+    for seconds, loud in pattern:
+        count = int(seconds * 16000)
+        samples = np.where(np.arange(count) % 40 < 20, 8000, -8000) if loud else np.zeros(count)
+        chunks.append(samples.astype("<i2").tobytes())
+    return PcmAudio(samples=b"".join(chunks))
+
+
+def test_split_at_silence_cuts_inside_pauses():
+    pcm = _tone_with_gaps([(8, True), (1, False), (8, True), (1, False), (4, True)])
+
+    segments = split_at_silence(pcm, max_seconds=10, overlap_seconds=0.25)
+
+    assert len(segments) == 3
+    assert all(segment.duration_seconds <= 10.25 for segment in segments)
+    # first cut lands inside the pause between 8s and 9s
+    assert 8.0 <= segments[0].duration_seconds <= 9.0
+    total = sum(segment.duration_seconds for segment in segments)
+    assert total == pytest.approx(pcm.duration_seconds + 2 * 0.25, abs=0.05)
+
+
+def test_stitch_transcripts_drops_words_repeated_at_seams():
+    stitched = stitch_transcripts([
+        "Today I went to the park and",
+        "the park, and then I saw a friend.",
+        "",
+        "Потом мы пошли домой.",
+    ])
+
+    assert stitched == "Today I went to the park and then I saw a friend. Потом мы пошли домой."
+
+
+def test_long_audio_is_transcribed_in_parallel_segments(monkeypatch):
+    settings = transcription_service.get_settings()
+    monkeypatch.setattr(settings, "stt_segment_max_seconds", 10.0)
+    monkeypatch.setattr(settings, "stt_max_concurrency", 3)
+
+    class SlowProvider:
+        def transcribe_bytes(self, audio_bytes, filename="audio.wav"):
+            with wave.open(io.BytesIO(audio_bytes)) as wav_file:
+                seconds = wav_file.getnframes() / wav_file.getframerate()
+            time.sleep(0.2 if seconds > 6 else 0.05)  # the short last segment finishes first
+            return f"{seconds:.2f}s"
+
+    pcm = _tone_with_gaps([(8, True), (1, False), (8, True), (1, False), (4, True)])
+    segments = split_at_silence(pcm, max_seconds=10.0, overlap_seconds=settings.stt_segment_overlap_seconds)
+
+    started = time.perf_counter()
+    text = transcription_service._transcribe_pcm(SlowProvider(), pcm)
+
+    assert time.perf_counter() - started < 0.4  # segments ran concurrently
+    assert text == " ".join(f"{segment.duration_seconds:.2f}s" for segment in segments)
+
+
+def test_vad_trims_edges_and_compresses_long_pauses():
+    pcm = _tone_with_gaps([(1, False), (2, True), (3, False), (2, True), (1.5, False)])
+
+    result = trim_silence(pcm, max_pause_ms=600)
+
+    # 4s of speech + hangover padding + one shortened 0.6s pause
+    assert 4.6 <= result.kept_seconds <= 5.4
+    assert result.original_seconds == pytest.approx(9.5)
+    assert result.trimmed_ratio == pytest.approx(1 - result.kept_seconds / 9.5)
+    assert result.pcm.duration_seconds == pytest.approx(result.kept_seconds)
+
+
+@pytest.mark.parametrize("seconds", [0.1, 0.2, 0.3])
+def test_vad_handles_clips_shorter_than_the_smoothing_window(seconds):
+    pcm = _tone_with_gaps([(seconds, True)])
+
+    result = trim_silence(pcm, max_pause_ms=600)
+
+    assert result.kept_seconds == pytest.approx(seconds)
+
+
+def test_vad_keeps_audio_without_detectable_speech():
+    silence = PcmAudio(samples=b"\x00\x00" * 16000)
+
+    result = trim_silence(silence, max_pause_ms=600)
+
+    assert result.pcm is silence
+    assert result.trimmed_ratio == 0.0
+
+
+def test_stt_upload_uses_configured_codec(monkeypatch):
+    calls = []
+
+    class RecordingSTT:
+        def transcribe_bytes(self, audio_bytes, filename="audio.wav"):
+            calls.append((audio_bytes, filename))
+            return "text"
+
+    def fake_encode(pcm, codec, opus_bitrate="24k"):
+        assert codec == "opus"
+        return b"OggS" + b"\x00" * 10, "audio.ogg"
+
+    monkeypatch.setattr(transcription_service.get_settings(), "stt_upload_codec", "opus")
+    monkeypatch.setattr(transcription_service, "encode_for_stt", fake_encode)
+    metrics.reset()
+
+    text = transcription_service.transcribe_pcm_segment(RecordingSTT(), PcmAudio(samples=b"\x00\x00" * 16000))
+
+    assert text == "text"
+    assert calls == [(b"OggS" + b"\x00" * 10, "audio.ogg")]
+    assert metrics.counter("stt_upload.opus.bytes") == 14
+    assert metrics.counter("stt_upload.opus.requests") == 1
+
+
+def test_stt_upload_falls_back_to_wav_when_encoding_fails(monkeypatch):
+    filenames = []
+
+    class RecordingSTT:
+        def transcribe_bytes(self, audio_bytes, filename="audio.wav"):
+            filenames.append(filename)
+            return "text"
+
+    def fake_encode(pcm, codec, opus_bitrate="24k"):
+        if codec != "wav":
+            raise AudioConversionError("encoder missing")
+        return pcm.to_wav(), "audio.wav"
+
+    monkeypatch.setattr(transcription_service.get_settings(), "stt_upload_codec", "flac")
+    monkeypatch.setattr(transcription_service, "encode_for_stt", fake_encode)
+    metrics.reset()
+
+    transcription_service.transcribe_pcm_segment(RecordingSTT(), PcmAudio(samples=b"\x00\x00" * 1600))
+
+    assert filenames == ["audio.wav"]
+    assert metrics.counter("stt_upload.flac.encode_failures") == 1
+    assert metrics.counter("stt_upload.wav.requests") == 1
+
+
+def _wav_bytes(samples, sample_rate, channels):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+    return buffer.getvalue()
+
+
+def test_compatible_wav_passes_through_unchanged():
+    samples = (np.sin(np.arange(16000) / 5) * 8000).astype("<i2")
+
+    pcm, path = decode_wav_bytes(_wav_bytes(samples, 16000, 1))
+
+    assert path == "passthrough"
+    assert pcm.samples == samples.tobytes()
+
+
+def test_stereo_48k_wav_is_downmixed_and_resampled_in_process():
+    t = np.arange(48000) / 48000
+    tone = np.sin(2 * np.pi * 440 * t) * 10000
+    stereo = np.column_stack((tone, tone)).ravel()
+
+    pcm, path = decode_wav_bytes(_wav_bytes(stereo, 48000, 2))
+
+    assert path == "numpy"
+    assert pcm.sample_rate == 16000
+    assert pcm.duration_seconds == pytest.approx(1.0)
+    resampled = np.frombuffer(pcm.samples, dtype="<i2").astype(np.float64)
+    spectrum = np.abs(np.fft.rfft(resampled))
+    assert np.argmax(spectrum) == pytest.approx(440, abs=1)
+    assert np.sqrt(np.mean(resampled[100:-100] ** 2)) == pytest.approx(10000 / np.sqrt(2), rel=0.05)
+
+
+def test_wav_upload_skips_ffmpeg(monkeypatch):
+    def fail_convert(*args, **kwargs):
+        raise AssertionError("WAV uploads must not spawn ffmpeg")
+
+    monkeypatch.setattr(transcription_service, "convert_bytes_to_pcm", fail_convert)
+    monkeypatch.setattr(transcription_service, "convert_file_to_wav", fail_convert)
+    monkeypatch.setattr(audio_service, "get_transcoder", fail_convert)
+    monkeypatch.setattr(transcription_service.get_settings(), "stt_upload_codec", "flac")
+    metrics.reset()
+
+    pcm = _tone_with_gaps([(0.5, False), (2, True), (0.5, False)])
+    wav = _wav_bytes(np.frombuffer(pcm.samples, dtype="<i2"), 16000, 1)
+    client = TestClient(app)
+    response = client.post("/transcribe", files={"file": ("note.wav", wav, "audio/wav")})
+
+    assert response.status_code == 200
+    assert metrics.counter("transcribe.decode_path.passthrough") == 1
+    assert metrics.counter("transcribe.decode_path.ffmpeg") == 0
+    assert metrics.counter("stt_upload.wav.requests") == 1  # VAD trimmed the edges, samples sent as WAV
+
+
+class _RecordingSTT:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe_file(self, audio, filename="audio.wav"):
+        self.calls.append(("file", audio.read(), filename))
+        return "Привет."
+
+    def transcribe_bytes(self, audio_bytes, filename="audio.wav"):
+        self.calls.append(("bytes", audio_bytes, filename))
+        return "Привет."
+
+
+def test_untouched_16k_wav_is_uploaded_unchanged(monkeypatch):
+    stt = _RecordingSTT()
+    monkeypatch.setattr(transcription_service, "build_stt_provider", lambda: stt)
+    monkeypatch.setattr(transcription_service.get_settings(), "stt_upload_codec", "flac")
+    metrics.reset()
+    pcm = _tone_with_gaps([(2, True)])
+    wav = _wav_bytes(np.frombuffer(pcm.samples, dtype="<i2"), 16000, 1)
+
+    transcription_service._run_pipeline(io.BytesIO(wav), ".wav", formatted=False)
+
+    assert stt.calls == [("file", wav, "audio.wav")]
+    assert metrics.counter("transcribe.upload_path.passthrough") == 1
+
+
+@pytest.mark.parametrize(
+    "file_ext, header, native",
+    [
+        (".webm", b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x84webm", True),
+        (".m4a", b"\x00\x00\x00\x20ftypM4A ", True),
+        (".mp3", b"ID3\x04\x00", True),
+        (".mp3", b"RIFF\x24\x00\x00\x00WAVEfmt ", False),  # extension and container disagree
+        (".webm", b"not audio at all", False),
+    ],
+)
+def test_native_upload_requires_matching_magic_bytes(monkeypatch, file_ext, header, native):
+    settings = transcription_service.get_settings()
+    monkeypatch.setattr(settings, "vad_enabled", False)
+    monkeypatch.setattr(settings, "stt_chunking_enabled", False)
+    upload = io.BytesIO(header + b"\x00" * 100)
+
+    filename = transcription_service._native_upload_filename(upload, file_ext)
+
+    assert filename == (f"audio{file_ext}" if native else None)
+    assert upload.tell() == 0
+
+
+def test_float_wav_falls_back_to_ffmpeg():
+    header = _wav_bytes([0, 0], 16000, 1)
+    # Flip the format tag from PCM (1) to IEEE float (3).
+    float_wav = header[:20] + (3).to_bytes(2, "little") + header[22:]
+
+    assert decode_wav_bytes(float_wav) is None
+
+
+def test_fused_mode_returns_analysis_with_transcript(monkeypatch):
+    monkeypatch.setattr(transcription_service.get_settings(), "llm_fused_mode", True)
+    pcm = _tone_with_gaps([(0.3, False), (1.7, True), (0.3, False)])
+    wav = _wav_bytes(np.frombuffer(pcm.samples, dtype="<i2"), 16000, 1)
+
+    client = TestClient(app)
+    response = client.post("/transcribe", files={"file": ("fused.wav", wav, "audio/wav")})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["text"].startswith("Это тестовая запись")
+    assert body["analysis"]["mood_label"] == "anxious"
+    assert "работа" in body["analysis"]["tags"]
+    assert body["analysis"]["insight"]["bullets"]
+
+
+@pytest.mark.parametrize("tags, keeps_analysis", [(["работа"], True), (None, False)])
+def test_fused_reply_that_dropped_content_is_formatted_again(monkeypatch, tags, keeps_analysis):
+    raw = "сегодня было много работы и я совсем не успел отдохнуть вечером"
+    payload = {"title": "Работа", "mood_label": "tired", "insights": ["Отдых важен."], "formatted_text": "Сегодня…"}
+    if tags is not None:
+        payload["tags"] = tags
+    monkeypatch.setattr(transcription_service.get_settings(), "llm_fused_mode", True)
+    monkeypatch.setattr(transcription_service, "format_and_analyze_transcript", lambda text: dict(payload))
+    monkeypatch.setattr(transcription_service, "format_transcript_checked", lambda text: (text.capitalize(), False))
+
+    text, analysis, degraded = transcription_service._format_transcript(raw)
+
+    assert text == raw.capitalize()
+    assert degraded
+    assert (analysis is not None) == keeps_analysis
+    if keeps_analysis:
+        assert analysis["title"] == "Работа" and "formatted_text" not in analysis
+
+
+def _sse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_sse_transcription_streams_raw_then_formatted_text():
+    pcm = _tone_with_gaps([(0.3, False), (1.5, True), (0.4, False)])
+    wav = _wav_bytes(np.frombuffer(pcm.samples, dtype="<i2"), 16000, 1)
+
+    response = TestClient(app).post("/transcribe/sse", files={"file": ("stream.wav", wav, "audio/wav")})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "transcript" and names[-1] == "done"
+    assert names.count("delta") > 1  # the mock provider streams word by word
+    assert events[0][1]["text"] == "Это тестовая запись пользователя про работу и усталость"
+    streamed = "".join(data["text"] for name, data in events if name == "delta")
+    assert streamed.strip() == events[-1][1]["text"]
+    assert events[-1][1]["text"].startswith("Это тестовая запись") and events[-1][1]["text"].endswith(".")
@@ -0,0 +1,262 @@
+"""Tests for the two-tier result cache and transcript caching."""
+
+import io
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from openai import BadRequestError
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.core.metrics import metrics
+from app.models import CacheEntry
+from app.services import llm as llm_service
+from app.services import cache as cache_module
+from app.services import llm_cache
+from app.services import transcription as transcription_service
+from app.services.cache import LRUCache, TwoTierCache
+from app.services.transcription import TranscriptionResult
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, expire_on_commit=False)
+    finally:
+        Base.metadata.drop_all(engine)
+
+
+def test_lru_evicts_least_recently_used_when_over_budget():
+    cache = LRUCache(max_bytes=10)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    cache.get("a")  # "b" is now the oldest
+
+    assert cache.set("c", "cccc") == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa" and cache.get("c") == "cccc"
+    assert cache.size_bytes == 8
+
+
+def test_two_tier_cache_promotes_and_evicts_persistent_rows(session_factory):
+    cache = TwoTierCache("test", memory_max_bytes=1024, persistent_max_bytes=10, session_factory=session_factory)
+    cache.set("first", "11111")
+    cache.set("second", "22222")
+    cache.clear_memory()
+
+    assert cache.get("second") == "22222"  # served by the database, then promoted
+    assert cache.memory.get("second") == "22222"
+
+    cache.set("third", "33333")  # pushes the namespace over 10 bytes
+    cache.clear_memory()
+    assert cache.get("first") is None
+    assert cache.get("third") == "33333"
+
+
+def test_two_tier_cache_writes_do_not_rescan_the_namespace_under_budget(session_factory):
+    statements = []
+    engine = session_factory.kw["bind"]
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.lower())  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        cache = TwoTierCache("sized", memory_max_bytes=1024, persistent_max_bytes=20, session_factory=session_factory)
+        for index in range(4):
+            cache.set(f"key-{index}", "12345")
+        assert sum("sum(" in statement for statement in statements) == 1  # only the initial sync
+        assert not any(statement.startswith("delete") for statement in statements)
+
+        cache.set("key-4", "12345")  # passes the budget: evict the least recently written row
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    cache.clear_memory()
+    assert cache.get("key-0") is None
+    assert cache.get("key-4") == "12345"
+
+
+def test_two_tier_cache_throttles_access_time_writes(session_factory, monkeypatch):
+    cache = TwoTierCache("touch", memory_max_bytes=1024, persistent_max_bytes=1024, session_factory=session_factory)
+    cache.set("key", "value")
+
+    def last_accessed():
+        with session_factory() as db:
+            return db.get(CacheEntry, ("touch", "key")).last_accessed_at
+
+    written = last_accessed()
+    cache.clear_memory()
+    assert cache.get("key") == "value"
+    assert last_accessed() == written  # a fresh entry is not rewritten on every hit
+
+    monkeypatch.setattr(cache_module, "ACCESS_TOUCH_INTERVAL", timedelta(0))
+    cache.clear_memory()
+    assert cache.get("key") == "value"
+    assert last_accessed() > written
+
+
+def test_repeat_upload_is_served_from_cache(session_factory, monkeypatch):
+    calls = []
+
+    def fake_pipeline(upload, file_ext, formatted=True):
+        calls.append(upload.read())
+        return TranscriptionResult(text="Кэшированная запись.")
+
+    cache = TwoTierCache("transcripts", memory_max_bytes=1024, persistent_max_bytes=1024, session_factory=session_factory)
+    monkeypatch.setattr(transcription_service, "_transcript_cache", cache)
+    monkeypatch.setattr(transcription_service, "_run_pipeline", fake_pipeline)
+    metrics.reset()
+
+    first = transcription_service.transcribe_upload(io.BytesIO(b"same-audio"), ".webm")
+    second = transcription_service.transcribe_upload(io.BytesIO(b"same-audio"), ".webm")
+
+    assert first == second
+    assert calls == [b"same-audio"]  # the hash pass rewinds the stream for the pipeline
+    assert metrics.counter("cache.transcripts.miss") == 1
+    assert metrics.counter("cache.transcripts.hit_memory") == 1
+
+
+def test_transcript_is_not_cached_when_formatting_falls_back(session_factory, monkeypatch):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    replies = [BadRequestError("bad request", response=httpx.Response(400, request=request), body=None)]
+
+    def create(**kwargs):
+        if replies:
+            raise replies.pop()
+        completion = MagicMock()
+        completion.choices[0].message.content = "Сырая запись."
+        return completion
+
+    def fake_pipeline(upload, file_ext, formatted=True):
+        text, analysis, degraded = transcription_service._format_transcript("сырая запись")
+        return TranscriptionResult(text=text, analysis=analysis, degraded=degraded)
+
+    fake_client = MagicMock()
+    fake_client.chat.completions.create.side_effect = create
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "llm_batching_enabled", False)
+    monkeypatch.setattr(settings, "llm_fused_mode", False)
+    monkeypatch.setattr(settings, "transcript_formatting_enabled", True)
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: fake_client)
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    cache = TwoTierCache("transcripts", memory_max_bytes=1024, persistent_max_bytes=1024, session_factory=session_factory)
+    monkeypatch.setattr(transcription_service, "_transcript_cache", cache)
+    monkeypatch.setattr(transcription_service, "_run_pipeline", fake_pipeline)
+
+    first = transcription_service.transcribe_upload(io.BytesIO(b"same-audio"), ".webm")
+    second = transcription_service.transcribe_upload(io.BytesIO(b"same-audio"), ".webm")
+    third = transcription_service.transcribe_upload(io.BytesIO(b"same-audio"), ".webm")
+
+    assert first.text == "сырая запись" and first.degraded  # the raw-text fallback is served...
+    assert second.text == third.text == "Сырая запись."  # ...but the next upload retries the formatting
+    assert fake_client.chat.completions.create.call_count == 2  # and the good result is cached
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [
+        ("vad_enabled", False),
+        ("vad_max_pause_ms", 1200),
+        ("stt_upload_codec", "opus"),
+        ("stt_chunking_enabled", False),
+        ("stt_segment_max_seconds", 30.0),
+    ],
+)
+def test_transcript_cache_key_changes_with_audio_settings(monkeypatch, setting, value):
+    settings = transcription_service.get_settings()
+    before = transcription_service.transcript_cache_key(io.BytesIO(b"same-audio"))
+
+    monkeypatch.setattr(settings, setting, value)
+
+    assert transcription_service.transcript_cache_key(io.BytesIO(b"same-audio")) != before
+
+
+def test_two_tier_cache_expires_entries_after_ttl(session_factory):
+    metrics.reset()
+    cache = TwoTierCache("ttl", memory_max_bytes=1024, persistent_max_bytes=1024, ttl_seconds=0.05, session_factory=session_factory)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    time.sleep(0.1)
+    assert cache.memory.get("key") is None
+    assert cache.get("key") is None
+    assert metrics.counter("cache.ttl.expired") == 1
+
+
+def test_format_transcript_responses_are_cached_per_prompt(session_factory, monkeypatch):
+    calls = []
+
+    class FakeCompletions:
+        def create(self, model, temperature, messages, max_tokens=None):
+            calls.append(messages[0]["content"])
+            completion = MagicMock()
+            completion.choices[0].message.content = "Отформатированный текст."
+            return completion
+
+    fake_client = MagicMock()
+    fake_client.chat.completions = FakeCompletions()
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: fake_client)
+    monkeypatch.setattr(
+        llm_cache,
+        "_llm_cache",
+        TwoTierCache("llm", memory_max_bytes=1024, persistent_max_bytes=4096, ttl_seconds=60, session_factory=session_factory),
+    )
+    metrics.reset()
+
+    assert llm_service.format_transcript("отформатированный текст") == "Отформатированный текст."
+    assert llm_service.format_transcript("отформатированный текст") == "Отформатированный текст."
+    assert len(calls) == 1
+    assert metrics.counter("llm_cache.format_transcript.hit") == 1
+    assert metrics.snapshot()["gauges"]["llm_cache.format_transcript.hit_rate"] == 0.5
+
+    monkeypatch.setattr(llm_service, "TRANSCRIPT_FORMATTING_PROMPT", "Edited prompt")
+    llm_service.format_transcript("отформатированный текст")
+    assert len(calls) == 2  # a prompt edit changes the key
+
+
+def test_degraded_formatting_is_not_cached(session_factory, monkeypatch):
+    calls = []
+
+    def create(**kwargs):
+        part = kwargs["messages"][1]["content"].split("<part>\n")[-1].removesuffix("\n</part>")
+        calls.append(part)
+        completion = MagicMock()
+        # Every chunk but the first comes back truncated and falls back to its raw text.
+        completion.choices[0].message.content = part.upper() if part.startswith("предложение 0 ") else "обрезано"
+        return completion
+
+    fake_client = MagicMock()
+    fake_client.chat.completions.create.side_effect = create
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "llm_batching_enabled", False)
+    monkeypatch.setattr(settings, "format_chunk_max_chars", 200)
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: fake_client)
+    monkeypatch.setattr(
+        llm_cache,
+        "_llm_cache",
+        TwoTierCache("llm", memory_max_bytes=8192, persistent_max_bytes=8192, ttl_seconds=60, session_factory=session_factory),
+    )
+    raw = " ".join(f"предложение {index} про длинный прошедший день." for index in range(12))
+
+    first = llm_service.format_transcript(raw)
+    requests = len(calls)
+    second = llm_service.format_transcript(raw)
+
+    assert first == second and "обрезано" not in first
+    assert len(calls) == 2 * requests  # the partial fallback was not cached
+
+    calls.clear()
+    llm_service.format_transcript("короткий текст, который модель обрезала")
+    llm_service.format_transcript("короткий текст, который модель обрезала")
+    assert len(calls) == 2  # nor was a single reply that dropped content
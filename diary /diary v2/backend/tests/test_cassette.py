@@ -0,0 +1,119 @@
+"""Tests for OpenAI record/replay cassettes."""
+
+import json
+import time
+
+import httpx
+import pytest
+from openai import AsyncOpenAI, NotFoundError, OpenAI
+
+from app.core.metrics import metrics
+from app.services.cassette import (
+    AsyncReplayTransport,
+    Cassette,
+    RecordingTransport,
+    ReplayTransport,
+)
+
+CHUNK_DELAY = 0.05
+
+
+def _completion(content):
+    choice = {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+    return {"id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "stub", "choices": [choice]}
+
+
+def _sse_chunks(words):
+    for word in words:
+        time.sleep(CHUNK_DELAY)
+        delta = {"index": 0, "delta": {"content": word}, "finish_reason": None}
+        chunk = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "stub", "choices": [delta]}
+        yield f"data: {json.dumps(chunk)}\n\n".encode()
+    yield b"data: [DONE]\n\n"
+
+
+def _network(request: httpx.Request) -> httpx.Response:
+    """Stand-in for the OpenAI API: slow JSON answers, a chunked stream and transcriptions."""
+    if request.url.path.endswith("/audio/transcriptions"):
+        return httpx.Response(200, json={"text": "привет"})
+    payload = json.loads(request.content)
+    if payload.get("stream"):
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse_chunks(["a", "b", "c"]))
+    time.sleep(0.1)
+    return httpx.Response(200, json=_completion(payload["messages"][-1]["content"].upper()))
+
+
+def _client(transport):
+    return OpenAI(api_key="test-key", http_client=httpx.Client(transport=transport), max_retries=0)
+
+
+def _chat(client, text, **kwargs):
+    return client.chat.completions.create(model="stub", messages=[{"role": "user", "content": text}], **kwargs)
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    path = tmp_path / "openai.jsonl"
+    client = _client(RecordingTransport(httpx.MockTransport(_network), Cassette(path)))
+    _chat(client, "hello")
+    list(_chat(client, "stream me", stream=True))
+    client.audio.transcriptions.create(model="whisper-1", file=("a.wav", b"RIFF-audio"))
+    client.audio.transcriptions.create(model="whisper-1", file=("a.wav", b"RIFF-audio"))
+    client.close()
+    return path
+
+
+def test_recording_stores_timing_but_no_credentials(recorded):
+    lines = [json.loads(line) for line in recorded.read_text().splitlines()]
+
+    assert [line["endpoint"] for line in lines] == ["POST /v1/chat/completions"] * 2 + ["POST /v1/audio/transcriptions"] * 2
+    assert lines[0]["headers_seconds"] >= 0.1
+    assert len(lines[1]["timeline"]) >= 3  # the stream arrived in several timed pieces
+    assert lines[2]["key"] == lines[3]["key"]  # random multipart boundaries do not change the key
+    assert "test-key" not in recorded.read_text()
+
+
+def test_replay_returns_recorded_responses_with_recorded_latency(recorded):
+    client = _client(ReplayTransport(Cassette(recorded)))
+
+    started = time.perf_counter()
+    completion = _chat(client, "hello")
+    assert time.perf_counter() - started >= 0.09
+    assert completion.choices[0].message.content == "HELLO"
+
+    arrivals, words = [], []
+    started = time.perf_counter()
+    for chunk in _chat(client, "stream me", stream=True):
+        arrivals.append(time.perf_counter() - started)
+        words.append(chunk.choices[0].delta.content)
+    assert words == ["a", "b", "c"]
+    assert arrivals[-1] - arrivals[0] >= CHUNK_DELAY  # chunks still trickle in
+    assert client.audio.transcriptions.create(model="whisper-1", file=("b.wav", b"RIFF-audio")).text == "привет"
+
+
+def test_unrecorded_requests_sample_their_endpoint_or_miss(recorded):
+    client = _client(ReplayTransport(Cassette(recorded, seed=1), latency_scale=0))
+    sampled = metrics.counter("cassette.sampled")
+
+    assert _chat(client, "never recorded").choices[0].message.content in {"HELLO", None}
+    assert metrics.counter("cassette.sampled") == sampled + 1
+    with pytest.raises(NotFoundError, match="No cassette recording for POST /v1/embeddings"):
+        client.embeddings.create(model="stub", input="x")
+
+
+@pytest.mark.asyncio
+async def test_async_replay(recorded):
+    client = AsyncOpenAI(
+        api_key="test-key",
+        http_client=httpx.AsyncClient(transport=AsyncReplayTransport(Cassette(recorded), latency_scale=0.5)),
+        max_retries=0,
+    )
+    try:
+        started = time.perf_counter()
+        completion = await client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hello"}])
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.close()
+
+    assert completion.choices[0].message.content == "HELLO"
+    assert 0.045 <= elapsed < 0.1
@@ -0,0 +1,193 @@
+"""Tests for the adaptive outbound governor against a fault-injecting stub server."""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+
+from app.core.metrics import metrics
+from app.services.governor import OutboundGovernor, ProviderThrottledError
+
+
+class _FaultInjectingHandler(BaseHTTPRequestHandler):
+    """Stub chat completions endpoint that replays the server's scripted faults.
+
+    Each request pops the next ``(status, delay)`` from ``server.script``; once the
+    script is exhausted every request succeeds immediately.
+    """
+
+    def do_POST(self):  # noqa: N802
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            status, delay = self.server.script.pop(0) if self.server.script else (200, 0.0)
+        time.sleep(delay)
+        if status == 429:
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "rate_limit"}}).encode()
+            headers = {"retry-after-ms": "10"}
+        else:
+            content = json.dumps({"ok": True})
+            message = {"role": "assistant", "content": content}
+            choice = {"index": 0, "message": message, "finish_reason": "stop"}
+            body = json.dumps(
+                {"id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub", "choices": [choice]}
+            ).encode()
+            headers = {}
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FaultInjectingHandler)
+    server.script, server.requests, server.lock = [], 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def client(stub_server):
+    client = OpenAI(api_key="test-key", base_url=f"http://127.0.0.1:{stub_server.server_port}/v1", max_retries=0)
+    yield client
+    client.close()
+
+
+def make_governor(name, **overrides):
+    options = dict(
+        initial_limit=4, min_limit=1, max_limit=8, max_retries=3, backoff_base=0.01, backoff_max=0.05,
+        decrease_cooldown=0.0,
+    )
+    options.update(overrides)
+    return OutboundGovernor(name, **options)
+
+
+def complete(client):
+    return client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+
+
+def test_rate_limited_requests_are_retried_and_shrink_the_limit(stub_server, client):
+    stub_server.script = [(429, 0.0), (429, 0.0)]
+    governor = make_governor("test.retry")
+
+    completion = governor.call(lambda: complete(client))
+
+    assert json.loads(completion.choices[0].message.content) == {"ok": True}
+    assert stub_server.requests == 3
+    assert governor.limit == 2  # halved twice from 4, then one success adds a slot
+    assert metrics.counter("outbound.test.retry.retries") == 2
+    assert metrics.counter("outbound.test.retry.throttled") == 2
+
+
+def test_persistent_throttling_raises_provider_throttled(stub_server, client):
+    stub_server.script = [(429, 0.0)] * 3
+    governor = make_governor("test.throttled", max_retries=2)
+
+    with pytest.raises(ProviderThrottledError) as excinfo:
+        governor.call(lambda: complete(client))
+
+    assert isinstance(excinfo.value.__cause__, RateLimitError)
+    assert excinfo.value.retry_after >= 1
+    assert stub_server.requests == 3
+
+
+def test_slow_primary_is_hedged(stub_server, client):
+    stub_server.script = [(200, 1.0)]
+    governor = make_governor("test.hedge", hedge_enabled=True, hedge_min_delay=0.05)
+
+    started = time.perf_counter()
+    governor.call(lambda: complete(client))
+
+    assert time.perf_counter() - started < 0.8
+    assert stub_server.requests == 2
+    assert metrics.counter("outbound.test.hedge.hedge_wins") == 1
+
+    # The losing request finishes in the background and returns its slot.
+    deadline = time.monotonic() + 5
+    while governor.inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert governor.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_async_calls_retry_and_hedge(stub_server):
+    stub_server.script = [(429, 0.0), (200, 1.0)]
+    governor = make_governor("test.async", hedge_enabled=True, hedge_min_delay=0.05)
+    client = AsyncOpenAI(api_key="test-key", base_url=f"http://127.0.0.1:{stub_server.server_port}/v1", max_retries=0)
+
+    try:
+        started = time.perf_counter()
+        completion = await governor.acall(
+            lambda: client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+        )
+    finally:
+        await client.close()
+
+    assert json.loads(completion.choices[0].message.content) == {"ok": True}
+    assert time.perf_counter() - started < 0.8
+    assert metrics.counter("outbound.test.async.retries") == 1
+    assert metrics.counter("outbound.test.async.hedge_wins") == 1
+
+
+def test_limit_grows_additively_and_shrinks_on_slow_responses():
+    governor = make_governor("test.aimd", initial_limit=2, latency_target=0.05)
+
+    for _ in range(6):  # +1/limit per success: about one slot per window of calls
+        governor.call(lambda: None)
+    assert governor.limit == 4
+
+    governor.call(lambda: time.sleep(0.1))
+    assert governor.limit == 3
+
+
+def test_concurrency_never_exceeds_the_limit():
+    governor = make_governor("test.cap", initial_limit=2, max_limit=2)
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def request():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+
+    threads = [threading.Thread(target=governor.call, args=(request,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == 2
+    assert governor.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_async_waiter_does_not_leak_its_slot():
+    governor = make_governor("test.cancel", initial_limit=1, max_limit=1)
+    await governor.aacquire()
+
+    waiter = asyncio.ensure_future(governor.aacquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    governor.release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+
+    assert governor.inflight == 0
+    assert governor.try_acquire()
@@ -1,15 +1,29 @@
 """Tests for insight generation service."""
 
+import asyncio
+import json
+import threading
+import time
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import uuid4
 
+import httpx
 import pytest
 
+from app.api import insights as insights_api
+from app.core.database import get_db
+from app.core.security import get_current_user
+from app.main import app
 from app.models.entry import Entry
 from app.models.insight import Insight
+from app.models.period_rollup import PeriodRollup
 from app.models.tag import Tag
-from app.services.insights import generate_entry_insight, generate_period_insight
+from app.models.user import User
+from app.services import insights as insights_service
+from app.services.clients import reset_clients
+from app.services.insights import _split_period, generate_entry_insight, generate_period_insight
 
 
 @pytest.fixture
@@ -52,14 +66,18 @@ async def test_generate_entry_insight(mock_client_factory, mock_entry, mock_open
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock()]
     mock_completion.choices[0].message.content = json.dumps(mock_openai_response)
-    mock_client.chat.completions.create.return_value = mock_completion
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_completion)
     mock_client_factory.return_value = mock_client
 
     db_session.add(mock_entry)
     db_session.commit()
 
-    insight = await generate_entry_insight(mock_entry, db_session)
+    insight = await generate_entry_insight(mock_entry)
 
+    prompt = mock_client.chat.completions.create.call_args.kwargs["messages"][-1]["content"]
+    assert mock_entry.transcript in prompt
+    assert "Mood label: anxious" in prompt and "Tags: работа, усталость" in prompt
+    assert '{\n  "summary"' in prompt  # the JSON example keeps single braces
     assert insight.scope == "entry"
     assert insight.source_entry_id == mock_entry.id
     assert insight.user_id == mock_entry.user_id
@@ -101,10 +119,10 @@ async def test_generate_period_insight(mock_client_factory, db_session):
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock()]
     mock_completion.choices[0].message.content = '{"summary": "Period summary", "key_insights": ["insight 1"], "emotional_trend": "mixed", "focus_recommendations": ["rec 1"], "top_tags": [{"tag": "test", "weight": 1.0}], "language": "ru"}'
-    mock_client.chat.completions.create.return_value = mock_completion
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_completion)
     mock_client_factory.return_value = mock_client
 
-    insight = await generate_period_insight(user_id, period_from, period_to, timeframe, db_session)
+    insight = await generate_period_insight(user_id, period_from, period_to, timeframe)
 
     assert insight.scope == "period"
     assert insight.user_id == user_id
@@ -116,8 +134,367 @@ async def test_generate_period_insight(mock_client_factory, db_session):
     assert "emotional_trend" in insight.meta
 
 
+def _rollup_entry(user_id, created_at, transcript="Entry"):
+    return Entry(
+        id=uuid4(),
+        user_id=user_id,
+        transcript=transcript,
+        title="",
+        mood_label="calm",
+        insights=[],
+        word_count=3,
+        created_at=created_at,
+        analysis_status="done",
+    )
+
+
+@patch("app.services.insights._get_openai_client")
+@pytest.mark.asyncio
+async def test_year_insight_is_built_from_cached_rollups(mock_client_factory, db_session):
+    user_id = 1
+    for created_at in (datetime(2024, 1, 10), datetime(2024, 6, 12), datetime(2024, 12, 30)):
+        db_session.add(_rollup_entry(user_id, created_at))
+    db_session.commit()
+
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = json.dumps(
+        {"summary": "Summary", "key_insights": ["insight"], "emotional_trend": "stable", "language": "en"}
+    )
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=completion)
+    mock_client_factory.return_value = mock_client
+    year = (datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59, 59))
+
+    await generate_period_insight(user_id, *year, "year")
+
+    # One week and one month rollup per non-empty month, plus the year itself.
+    assert mock_client.chat.completions.create.await_count == 7
+    units = sorted(row.unit for row in db_session.query(PeriodRollup).all())
+    assert units == ["month"] * 3 + ["week"] * 3
+    year_prompt = mock_client.chat.completions.create.await_args.kwargs["messages"][1]["content"]
+    assert "Summaries by month" in year_prompt
+    assert all(f"[{month}" in year_prompt for month in ("2024-01-01", "2024-06-01", "2024-12-01"))
+
+    await generate_period_insight(user_id, *year, "year")
+    assert mock_client.chat.completions.create.await_count == 8  # every rollup reused
+
+    db_session.add(_rollup_entry(user_id, datetime(2024, 6, 13)))
+    db_session.commit()
+    await generate_period_insight(user_id, *year, "year")
+    assert mock_client.chat.completions.create.await_count == 11  # June week + June month + year
+    june = db_session.query(PeriodRollup).filter_by(unit="month", period_from=datetime(2024, 6, 1)).one()
+    assert june.entry_count == 2 and june.stats["entries"] == 2
+
+
+def test_split_period_clips_weeks_to_the_month():
+    segments = _split_period(datetime(2024, 5, 1), datetime(2024, 5, 31, 23, 59, 59), "week")
+
+    assert [start.day for start, _ in segments] == [1, 6, 13, 20, 27]
+    assert segments[0][1] == datetime(2024, 5, 5, 23, 59, 59, 999999)
+    assert segments[-1][1] == datetime(2024, 5, 31, 23, 59, 59)
+
+
 @pytest.mark.asyncio
 async def test_generate_period_insight_no_entries(db_session):
     with pytest.raises(ValueError, match="No entries found"):
-        await generate_period_insight(999, datetime(2024, 1, 1), datetime(2024, 1, 31), "month", db_session)
+        await generate_period_insight(999, datetime(2024, 1, 1), datetime(2024, 1, 31), "month")
+
+
+
+class _SlowCompletionHandler(BaseHTTPRequestHandler):
+    """Stub of the OpenAI chat completions endpoint that answers after a delay."""
+
+    delay = 0.5
+
+    def do_POST(self):  # noqa: N802
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay)
+        content = json.dumps({"summary": "Stub summary", "bullets": ["b"], "language": "ru"})
+        body = json.dumps(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+@pytest.fixture
+def stub_llm_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(insights_service.settings, "openai_api_key", "test-key")
+    reset_clients()
+    yield server
+    reset_clients()
+    server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_insight_generation_does_not_block_other_requests(stub_llm_server, mock_entry, db_session):
+    db_session.add(mock_entry)
+    db_session.commit()
+    app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_current_user] = lambda: User(id=mock_entry.user_id, email="u@example.com")
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            insight_request = asyncio.create_task(client.get(f"/insights/entry/{mock_entry.id}"))
+            await asyncio.sleep(0.05)
+
+            health_latencies = []
+            for _ in range(5):
+                started = time.perf_counter()
+                response = await client.get("/healthz")
+                health_latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200
+            assert not insight_request.done()
+
+            insight_response = await insight_request
+    finally:
+        app.dependency_overrides.clear()
+
+    assert insight_response.status_code == 200
+    assert insight_response.json()["summary"] == "Stub summary"
+    assert max(health_latencies) < _SlowCompletionHandler.delay / 2
+
+
+@patch("app.services.insights._get_openai_client")
+@pytest.mark.asyncio
+async def test_concurrent_entry_insight_requests_share_one_generation(
+    mock_client_factory, mock_entry, mock_openai_response, db_session
+):
+    async def slow_completion(**kwargs):
+        await asyncio.sleep(0.05)
+        completion = MagicMock()
+        completion.choices = [MagicMock()]
+        completion.choices[0].message.content = json.dumps(mock_openai_response)
+        return completion
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=slow_completion)
+    mock_client_factory.return_value = mock_client
+    db_session.add(mock_entry)
+    db_session.commit()
+
+    first, second = await asyncio.gather(
+        generate_entry_insight(mock_entry),
+        generate_entry_insight(mock_entry),
+    )
+
+    assert mock_client.chat.completions.create.await_count == 1
+    assert first.id == second.id
+    assert db_session.query(Insight).filter_by(source_entry_id=mock_entry.id).count() == 1
+
+
+@patch("app.services.insights._get_openai_client")
+@pytest.mark.asyncio
+async def test_repeated_entry_insight_upserts_single_row(
+    mock_client_factory, mock_entry, mock_openai_response, db_session
+):
+    mock_client = MagicMock()
+    mock_client_factory.return_value = mock_client
+    db_session.add(mock_entry)
+    db_session.commit()
+
+    summaries = []
+    for summary in ("first pass", "second pass"):
+        completion = MagicMock()
+        completion.choices = [MagicMock()]
+        completion.choices[0].message.content = json.dumps({**mock_openai_response, "summary": summary})
+        mock_client.chat.completions.create = AsyncMock(return_value=completion)
+        summaries.append(await generate_entry_insight(mock_entry))
+
+    rows = db_session.query(Insight).filter_by(source_entry_id=mock_entry.id).all()
+    assert len(rows) == 1
+    assert rows[0].summary == "second pass"
+    assert summaries[0].id == summaries[1].id
+
+
+@patch("app.services.insights._get_openai_client")
+@pytest.mark.asyncio
+async def test_entry_insight_survives_a_cancelled_caller_closing_its_session(
+    mock_client_factory, mock_entry, mock_openai_response, db_session, monkeypatch
+):
+    released = asyncio.Event()
+
+    async def slow_completion(**kwargs):
+        await released.wait()
+        completion = MagicMock()
+        completion.choices = [MagicMock()]
+        completion.choices[0].message.content = json.dumps(mock_openai_response)
+        return completion
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=slow_completion)
+    mock_client_factory.return_value = mock_client
+    opened = []
+    open_session = insights_service.SessionLocal
+
+    def session_factory():
+        opened.append(open_session())
+        return opened[-1]
+
+    monkeypatch.setattr(insights_service, "SessionLocal", session_factory)
+    db_session.add(mock_entry)
+    db_session.commit()
+
+    leader = asyncio.create_task(generate_entry_insight(mock_entry))
+    while not mock_client.chat.completions.create.await_count:
+        await asyncio.sleep(0.01)
+    leader.cancel()  # the request went away and its session is closed
+    db_session.close()
+    follower = asyncio.create_task(generate_entry_insight(mock_entry))
+    released.set()
+    insight = await follower
+
+    assert insight.source_entry_id == mock_entry.id
+    assert mock_client.chat.completions.create.await_count == 1
+    assert len(opened) == 1 and db_session not in opened
+    assert db_session.query(Insight).filter_by(source_entry_id=mock_entry.id).count() == 1
+
+
+@patch("app.services.insights._get_openai_client")
+@pytest.mark.asyncio
+async def test_stale_period_insight_is_served_then_refreshed(mock_client_factory, db_session):
+    summaries = iter(["first", "second"])
+
+    async def completion(**kwargs):
+        result = MagicMock()
+        result.choices = [MagicMock()]
+        result.choices[0].message.content = json.dumps({"summary": next(summaries), "key_insights": []})
+        return result
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=completion)
+    mock_client_factory.return_value = mock_client
+    db_session.add(_rollup_entry(1, datetime(2024, 5, 14)))
+    db_session.commit()
+    app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_current_user] = lambda: User(id=1, email="u@example.com")
+    url = "/insights/period?timeframe=week&anchor_date=2024-05-13T00:00:00"
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            generated = (await client.get(url)).json()
+            cached = (await client.get(url)).json()
+
+            db_session.add(_rollup_entry(1, datetime(2024, 5, 15)))
+            db_session.commit()
+            stale = (await client.get(url)).json()
+            await asyncio.gather(*list(insights_service._refreshes))
+            db_session.expire_all()
+            refreshed = (await client.get(url)).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert generated["summary"] == cached["summary"] == "first" and not cached["stale"]
+    assert stale["summary"] == "first" and stale["stale"]
+    assert refreshed["summary"] == "second" and not refreshed["stale"]
+    assert mock_client.chat.completions.create.await_count == 2
+
+
+@patch("app.services.insights._get_openai_client")
+@pytest.mark.asyncio
+async def test_stale_entry_insight_regenerates_inline_without_swr(
+    mock_client_factory, mock_entry, mock_openai_response, db_session, monkeypatch
+):
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = json.dumps(mock_openai_response)
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=completion)
+    mock_client_factory.return_value = mock_client
+    monkeypatch.setattr(insights_api.settings, "insight_stale_while_revalidate", False)
+    mock_entry.analysis_status = "pending"
+    db_session.add(mock_entry)
+    db_session.commit()
+    await generate_entry_insight(mock_entry)
+
+    mock_entry.analysis_status = "done"  # background analysis finished after the insight was drafted
+    db_session.commit()
+    app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_current_user] = lambda: User(id=mock_entry.user_id, email="u@example.com")
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = (await client.get(f"/insights/entry/{mock_entry.id}")).json()
+            second = (await client.get(f"/insights/entry/{mock_entry.id}")).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert not first["stale"] and not second["stale"]
+    assert mock_client.chat.completions.create.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_entry_insight_stream_sends_deltas_then_stored_insight(mock_entry, db_session):
+    db_session.add(mock_entry)
+    db_session.commit()
+    app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_current_user] = lambda: User(id=mock_entry.user_id, email="u@example.com")
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            streamed = await client.get(f"/insights/entry/{mock_entry.id}/stream")
+            cached = await client.get(f"/insights/entry/{mock_entry.id}/stream")
+    finally:
+        app.dependency_overrides.clear()
+
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in streamed.text.strip().split("\n\n")
+    ]
+    deltas = [data["text"] for name, data in events if name == "delta"]
+    assert len(deltas) > 1
+    assert events[-1][0] == "insight"
+    assert json.loads("".join(deltas))["summary"] == events[-1][1]["summary"]
+
+    stored = db_session.query(Insight).filter_by(source_entry_id=mock_entry.id).one()
+    assert str(stored.id) == events[-1][1]["id"]
+    assert cached.text.startswith("event: insight") and cached.text.count("event: ") == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_insight_streams_share_one_generation(mock_entry, mock_openai_response, db_session, monkeypatch):
+    calls = []
+    reply = json.dumps(mock_openai_response, ensure_ascii=False)
+
+    async def slow_stream(system_prompt, prompt, **kwargs):
+        calls.append(prompt)
+        for start in range(0, len(reply), 20):
+            await asyncio.sleep(0.01)
+            yield reply[start : start + 20]
+
+    monkeypatch.setattr(insights_service, "stream_chat_completion", slow_stream)
+    db_session.add(mock_entry)
+    db_session.commit()
+    entry_id, user_id = mock_entry.id, mock_entry.user_id
+    db_session.close()  # the streams must not depend on the request's session
+
+    async def view(delay):
+        await asyncio.sleep(delay)
+        return [event async for event in insights_service.stream_entry_insight(entry_id, user_id)]
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return await generate_entry_insight(mock_entry)
+
+    first, late, plain = await asyncio.gather(view(0), view(0.03), fetch())
 
+    assert len(calls) == 1
+    for events in (first, late):
+        assert "".join(event["text"] for event in events if event["type"] == "delta") == reply
+        assert events[-1]["insight"].id == plain.id
+    assert not insights_service._feeds
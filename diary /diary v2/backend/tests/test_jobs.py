@@ -0,0 +1,272 @@
+"""Tests for the background transcription job queue."""
+
+import asyncio
+import io
+import threading
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import transcribe as transcribe_api
+from app.core.config import get_settings
+from app.core.database import Base, utc_now
+from app.main import app
+from app.models import TranscriptionJob
+from app.services import jobs as jobs_service
+from app.services.jobs import QueueFullError, TranscriptionJobQueue
+from app.services.transcoder import TranscoderBusyError
+from app.services.transcription import TranscriptionResult
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, expire_on_commit=False)
+    finally:
+        Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def make_queue(session_factory, tmp_path):
+    queues = []
+
+    def factory(max_workers=1, max_queue=4):
+        queue = TranscriptionJobQueue(
+            spool_dir=tmp_path / "jobs",
+            max_workers=max_workers,
+            max_queue=max_queue,
+            session_factory=session_factory,
+        )
+        queues.append(queue)
+        return queue
+
+    yield factory
+    for queue in queues:
+        queue.shutdown(wait=True)
+
+
+def test_job_runs_pipeline_and_cleans_up_spool(make_queue, monkeypatch):
+    def fake_transcribe(upload, file_ext):
+        assert upload.read() == b"audio" and file_ext == ".webm"
+        return TranscriptionResult(text="Привет, мир.")
+
+    monkeypatch.setattr(jobs_service, "transcribe_upload", fake_transcribe)
+    queue = make_queue()
+
+    job = queue.enqueue(io.BytesIO(b"audio"), ".webm")
+    finished = asyncio.run(queue.wait(job.id, timeout=5, poll_interval=0.01))
+
+    assert finished.status == "done"
+    assert finished.text == "Привет, мир."
+    assert finished.attempts == 1
+    assert finished.spool_path is None
+    assert not any(queue.spool_dir.iterdir())
+
+
+def test_full_queue_rejects_with_retry_after(make_queue, monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_transcribe(upload, file_ext):
+        started.set()
+        release.wait(5)
+        return TranscriptionResult(text="ok")
+
+    monkeypatch.setattr(jobs_service, "transcribe_upload", blocking_transcribe)
+    queue = make_queue(max_workers=1, max_queue=1)
+
+    queue.enqueue(io.BytesIO(b"a"), ".wav")
+    started.wait(5)
+    queue.enqueue(io.BytesIO(b"b"), ".wav")  # waits behind the running job
+    with pytest.raises(QueueFullError) as exc_info:
+        queue.enqueue(io.BytesIO(b"c"), ".wav")
+    assert exc_info.value.retry_after >= 1
+    assert queue.pool.active == 1 and queue.pool.queued == 1
+    release.set()
+
+
+def test_recover_requeues_interrupted_jobs(make_queue, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_service, "transcribe_upload", lambda upload, ext: TranscriptionResult(text="recovered"))
+    spool = tmp_path / "jobs" / "interrupted.webm"
+    spool.parent.mkdir(parents=True)
+    spool.write_bytes(b"audio")
+
+    with session_factory() as db:
+        interrupted = TranscriptionJob(status="running", file_ext=".webm", spool_path=str(spool), attempts=1)
+        lost = TranscriptionJob(status="queued", file_ext=".webm", spool_path=str(tmp_path / "missing.webm"))
+        db.add_all([interrupted, lost])
+        db.commit()
+
+    queue = make_queue()
+    assert queue.recover() == 1
+
+    finished = asyncio.run(queue.wait(interrupted.id, timeout=5, poll_interval=0.01))
+    assert finished.status == "done" and finished.text == "recovered"
+    assert queue.get(lost.id).status == "failed"
+
+
+def test_job_endpoint_returns_503_when_queue_is_full(monkeypatch):
+    class FullQueue:
+        def enqueue(self, upload, file_ext):
+            raise QueueFullError("transcribe_jobs", retry_after=7)
+
+    monkeypatch.setattr(transcribe_api, "get_job_queue", lambda: FullQueue())
+
+    response = TestClient(app).post("/transcribe/jobs", files={"file": ("note.webm", b"x", "audio/webm")})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_job_is_requeued_while_transcoder_is_busy(make_queue, monkeypatch):
+    calls = []
+
+    def fake_transcribe(upload, file_ext):
+        calls.append(file_ext)
+        if len(calls) == 1:
+            raise TranscoderBusyError(retry_after=0)
+        return TranscriptionResult(text="Готово.")
+
+    monkeypatch.setattr(jobs_service, "transcribe_upload", fake_transcribe)
+    queue = make_queue()
+
+    job = queue.enqueue(io.BytesIO(b"audio"), ".webm")
+    finished = asyncio.run(queue.wait(job.id, timeout=5, poll_interval=0.01))
+
+    assert finished.status == "done"
+    assert finished.attempts == 2
+    assert len(calls) == 2
+
+
+def test_job_fails_after_max_attempts_while_provider_stays_busy(make_queue, monkeypatch):
+    def busy_transcribe(upload, file_ext):
+        raise TranscoderBusyError(retry_after=0)
+
+    monkeypatch.setattr(jobs_service, "transcribe_upload", busy_transcribe)
+    queue = make_queue()
+
+    job = queue.enqueue(io.BytesIO(b"audio"), ".webm")
+    finished = asyncio.run(queue.wait(job.id, timeout=5, poll_interval=0.01))
+
+    assert finished.status == "failed"
+    assert finished.attempts == jobs_service.MAX_ATTEMPTS
+    assert "Gave up" in finished.error and finished.lease_owner is None
+
+
+def test_recover_skips_jobs_leased_by_a_live_worker(make_queue, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_service, "transcribe_upload", lambda upload, ext: TranscriptionResult(text="ok"))
+    spool = tmp_path / "jobs" / "a.webm"
+    spool.parent.mkdir(parents=True)
+    spool.write_bytes(b"audio")
+
+    with session_factory() as db:
+        live = TranscriptionJob(
+            status="running",
+            file_ext=".webm",
+            spool_path=str(spool),
+            attempts=1,
+            lease_owner="other-worker",
+            lease_expires_at=utc_now() + timedelta(minutes=1),
+        )
+        expired = TranscriptionJob(
+            status="running",
+            file_ext=".webm",
+            spool_path=str(spool),
+            attempts=1,
+            lease_owner="dead-worker",
+            lease_expires_at=utc_now() - timedelta(seconds=1),
+        )
+        db.add_all([live, expired])
+        db.commit()
+
+    queue = make_queue()
+    assert queue.recover() == 1
+
+    assert asyncio.run(queue.wait(expired.id, timeout=5, poll_interval=0.01)).status == "done"
+    untouched = queue.get(live.id)
+    assert untouched.status == "running" and untouched.lease_owner == "other-worker"
+
+
+def test_concurrent_recovery_runs_each_job_once(make_queue, session_factory, tmp_path, monkeypatch):
+    runs = []
+
+    def fake_transcribe(upload, file_ext):
+        runs.append(upload.name)
+        return TranscriptionResult(text="ok")
+
+    monkeypatch.setattr(jobs_service, "transcribe_upload", fake_transcribe)
+    spool_dir = tmp_path / "jobs"
+    spool_dir.mkdir()
+    with session_factory() as db:
+        for index in range(4):
+            spool = spool_dir / f"{index}.webm"
+            spool.write_bytes(b"audio")
+            db.add(TranscriptionJob(status="queued", file_ext=".webm", spool_path=str(spool)))
+        db.commit()
+
+    queues = [make_queue(), make_queue()]
+    barrier = threading.Barrier(len(queues))
+    recovered = []
+
+    def recover(queue):
+        barrier.wait()
+        recovered.append(queue.recover())
+
+    threads = [threading.Thread(target=recover, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for queue in queues:
+        queue.pool.shutdown(wait=True)
+
+    assert sum(recovered) == 4
+    assert sorted(runs) == sorted(str(spool_dir / f"{index}.webm") for index in range(4))
+
+
+def test_spooled_upload_is_not_served_as_media(monkeypatch, tmp_path):
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_transcribe(upload, file_ext):
+        started.set()
+        release.wait(5)
+        return TranscriptionResult(text="ok")
+
+    settings = get_settings()
+    monkeypatch.setattr(jobs_service, "transcribe_upload", blocking_transcribe)
+    monkeypatch.setattr(settings, "job_spool_dir", tmp_path / "spool")
+    monkeypatch.setattr(jobs_service, "_queue", None)
+    client = TestClient(app)
+    engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    queue = jobs_service.get_job_queue()
+    queue.session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+    try:
+        response = client.post("/transcribe/jobs", files={"file": ("note.webm", b"private audio", "audio/webm")})
+        job_id = response.json()["id"]
+        assert started.wait(5)
+
+        spooled = queue.spool_dir / f"{job_id}.webm"
+        assert spooled.read_bytes() == b"private audio"
+        assert not spooled.resolve().is_relative_to(settings.media_root.resolve())
+        for path in (f"jobs/{job_id}.webm", f"{job_id}.webm", f"spool/{job_id}.webm"):
+            assert client.get(f"{settings.media_base_url}/{path}").status_code == 404
+    finally:
+        release.set()
+        jobs_service.reset_job_queue()
+        Base.metadata.drop_all(engine)
+
+
+def test_job_queue_refuses_a_spool_dir_under_media_root(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "job_spool_dir", settings.media_root / "jobs")
+    monkeypatch.setattr(jobs_service, "_queue", None)
+
+    with pytest.raises(ValueError, match="outside MEDIA_ROOT"):
+        jobs_service.get_job_queue()
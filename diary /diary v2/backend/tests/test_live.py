@@ -0,0 +1,51 @@
+"""Tests for the live transcription WebSocket."""
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import live as live_service
+
+
+def _pcm(seconds, loud):
+    count = int(seconds * 16000)
+    samples = np.where(np.arange(count) % 40 < 20, 8000, -8000) if loud else np.zeros(count)
+    return samples.astype("<i2").tobytes()
+
+
+def test_stream_pushes_partials_while_recording(monkeypatch):
+    settings = live_service.get_settings()
+    monkeypatch.setattr(settings, "live_segment_min_seconds", 1.0)
+    monkeypatch.setattr(settings, "live_segment_pause_ms", 300)
+
+    audio = _pcm(2, True) + _pcm(0.6, False) + _pcm(1.5, True)
+    chunk = 3200  # 100 ms
+
+    with TestClient(app).websocket_connect("/transcribe/stream") as ws:
+        for offset in range(0, len(audio) - len(_pcm(1.5, True)), chunk):
+            ws.send_bytes(audio[offset : offset + chunk])
+        # The first segment is cut at the pause and transcribed before recording ends
+        first = ws.receive_json()
+        assert first == {"type": "partial", "index": 0, "text": "Это тестовая запись пользователя про работу и усталость"}
+
+        for offset in range(len(audio) - len(_pcm(1.5, True)), len(audio), chunk):
+            ws.send_bytes(audio[offset : offset + chunk])
+        ws.send_text('{"type": "stop"}')
+
+        messages = []
+        while not messages or messages[-1]["type"] != "final":
+            messages.append(ws.receive_json())
+
+    final = messages[-1]
+    assert final["segments"] == 2
+    assert final["text"] == "\n\n".join(["Это тестовая запись пользователя про работу и усталость."] * 2)
+    assert {(m["type"], m["index"]) for m in messages[:-1]} == {("formatted", 0), ("partial", 1), ("formatted", 1)}
+
+
+def test_non_object_text_frames_get_an_error_frame():
+    with TestClient(app).websocket_connect("/transcribe/stream") as ws:
+        for frame in ('"stop"', "1", "[]", "not json"):
+            ws.send_text(frame)
+            assert ws.receive_json() == {"type": "error", "detail": "Unsupported message"}
+        ws.send_text('{"type": "stop"}')
+        assert ws.receive_json()["type"] == "final"
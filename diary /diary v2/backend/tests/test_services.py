@@ -1,9 +1,28 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from dataclasses import replace
 from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
 from uuid import uuid4
 
+from app.core.config import RouteOverride
+from app.core.metrics import metrics
 from app.models.entry import Entry
 from app.models.tag import Tag
 from app.services.llm import analyze_transcript, format_transcript
+from app.services.clients import close_clients, get_async_openai_client, get_openai_client
+from app.services import llm as llm_service
+from app.services import llm_cache
+from app.services import model_router
+from app.services.batching import MicroBatcher
+from app.services.chunking import split_text, text_tail
+from app.services.model_router import ModelRoute, route
+from app.services.providers import OpenAILLMProvider, WhisperSTTProvider, validate_fused_response
 from app.services.tags import aggregate_calendar, aggregate_tag_cloud
 
 
@@ -76,3 +95,376 @@ def test_format_transcript_preserves_mixed_languages():
     
     # Ensure the full content is preserved (no significant truncation)
     assert len(formatted) >= len(mixed_input) * 0.8, "Formatted transcript should preserve most of the original content"
+
+
+def test_whisper_provider_streams_file_handle(tmp_path):
+    audio_path = tmp_path / "note.webm"
+    audio_path.write_bytes(b"webm-bytes")
+    sent = {}
+
+    class FakeTranscriptions:
+        def create(self, model, file, response_format):
+            filename, handle = file
+            sent["filename"] = filename
+            sent["is_stream"] = hasattr(handle, "read") and not isinstance(handle, bytes)
+            sent["body"] = handle.read()
+            return "распознанный текст"
+
+    provider = WhisperSTTProvider(api_key="test", model="whisper-1")
+    provider.client = type("FakeClient", (), {"audio": type("Audio", (), {"transcriptions": FakeTranscriptions()})()})()
+
+    assert provider.transcribe(str(audio_path)) == "распознанный текст"
+    assert sent == {"filename": "note.webm", "is_stream": True, "body": b"webm-bytes"}
+
+
+def test_providers_share_one_pooled_client_per_key():
+    stt = WhisperSTTProvider(api_key="shared-key", model="whisper-1")
+    llm = OpenAILLMProvider(api_key="shared-key", prompt="p", model="gpt-4o-mini")
+
+    assert stt.client is llm.client is get_openai_client("shared-key")
+    assert get_openai_client("other-key") is not stt.client
+
+
+def test_close_clients_releases_pools():
+    sync_client = get_openai_client("closing-key")
+    async_client = get_async_openai_client("closing-key")
+
+    asyncio.run(close_clients())
+
+    assert sync_client.is_closed()
+    assert async_client.is_closed()
+    assert get_openai_client("closing-key") is not sync_client
+
+
+def test_fused_format_and_analyze_uses_one_completion(monkeypatch):
+    payload = {
+        "formatted_text": "Сегодня много работы.",
+        "title": "Рабочий день",
+        "mood_label": "tired",
+        "tags": ["работа"],
+        "insights": ["Ты много работаешь."],
+        "insight": {"summary": "О работе", "bullets": ["Усталость"], "language": "ru"},
+    }
+    completion = MagicMock()
+    completion.choices[0].message.content = json.dumps(payload, ensure_ascii=False)
+    provider = OpenAILLMProvider(api_key="fused-key", prompt="analyze", model="gpt-4o-mini")
+    provider.client = MagicMock()
+    provider.client.chat.completions.create.return_value = completion
+    monkeypatch.setattr(llm_cache.get_settings(), "llm_cache_enabled", False)
+
+    result = provider.format_and_analyze("сегодня много работы", "fused prompt")
+
+    assert result == payload
+    assert provider.client.chat.completions.create.call_count == 1
+
+
+def test_fused_validation_matches_analyze_rules():
+    base = {"formatted_text": "Текст.", "title": "t", "mood_label": "calm", "tags": [], "insights": []}
+    assert validate_fused_response(dict(base)) == base
+
+    with pytest.raises(ValueError, match="missing fields: tags"):
+        validate_fused_response({k: v for k, v in base.items() if k != "tags"})
+    with pytest.raises(ValueError, match="formatted_text"):
+        validate_fused_response({**base, "formatted_text": "  "})
+    with pytest.raises(ValueError, match="'insight' must be an object"):
+        validate_fused_response({**base, "insight": "text"})
+
+
+def _stream_chunk(text):
+    chunk = MagicMock()
+    chunk.choices[0].delta.content = text
+    return chunk
+
+
+def test_stream_format_transcript_forwards_chunks_and_caches(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "stream-key")
+    monkeypatch.setattr(settings, "llm_cache_enabled", True)
+    llm_cache.reset_llm_cache()
+    tag = uuid4()
+    client = MagicMock()
+    client.chat.completions.create.return_value = iter(
+        [_stream_chunk("\n"), _stream_chunk("Сегодня"), _stream_chunk(f" много работы {tag}."), _stream_chunk(None)]
+    )
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: client)
+
+    raw = f"сегодня много работы {tag}"
+    streamed = list(llm_service.stream_format_transcript(raw))
+    repeated = list(llm_service.stream_format_transcript(raw))
+    llm_cache.reset_llm_cache()
+
+    assert streamed == ["Сегодня", f" много работы {tag}."]
+    assert client.chat.completions.create.call_args.kwargs["stream"] is True
+    assert repeated == [f"Сегодня много работы {tag}."]
+    assert client.chat.completions.create.call_count == 1
+
+
+def test_stream_format_transcript_does_not_cache_dropped_content(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "stream-key")
+    monkeypatch.setattr(settings, "llm_cache_enabled", True)
+    llm_cache.reset_llm_cache()
+    client = MagicMock()
+    client.chat.completions.create.side_effect = lambda **kwargs: iter([_stream_chunk("Сегодня…")])
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: client)
+
+    raw = f"сегодня много работы и совсем нет времени на отдых {uuid4()}"
+    first = list(llm_service.stream_format_transcript(raw))
+    second = list(llm_service.stream_format_transcript(raw))
+    llm_cache.reset_llm_cache()
+
+    assert first == second == ["Сегодня…"]
+    assert client.chat.completions.create.call_count == 2  # the truncated reply was not cached
+
+
+def test_micro_batcher_groups_concurrent_calls():
+    batches = []
+
+    def handler(items):
+        batches.append(list(items))
+        return [ValueError("bad item") if item == "bad" else item.upper() for item in items]
+
+    batcher = MicroBatcher("test", handler, max_size=4, window_seconds=0.2)
+    items = ["a", "b", "bad", "c", "d", "e"]
+    results = {}
+
+    def submit(item):
+        try:
+            results[item] = batcher.submit(item)
+        except ValueError as exc:
+            results[item] = exc
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(len(batch) for batch in batches) == [2, 4]
+    assert isinstance(results.pop("bad"), ValueError)
+    assert results == {"a": "A", "b": "B", "c": "C", "d": "D", "e": "E"}
+
+
+def test_batched_formatting_fans_out_and_falls_back_per_item(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "batch-key")
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    monkeypatch.setattr(settings, "llm_batching_enabled", True)
+    monkeypatch.setattr(settings, "llm_batch_window_ms", 200.0)
+    monkeypatch.setattr(llm_service, "_format_batchers", {})
+
+    def create(**kwargs):
+        completion = MagicMock()
+        user_content = kwargs["messages"][1]["content"]
+        if "response_format" in kwargs:
+            items = json.loads(user_content)["items"]
+            # The model answers out of order and drops the last item.
+            reply = [{"id": item["id"], "result": item["text"].capitalize() + "."} for item in items[:-1]]
+            completion.choices[0].message.content = json.dumps({"items": reply[::-1]}, ensure_ascii=False)
+        else:
+            completion.choices[0].message.content = f"Single: {user_content}"
+        return completion
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: client)
+
+    texts = ["первая запись", "вторая запись", "третья запись"]
+    results = {}
+    threads = [
+        threading.Thread(target=lambda text=text: results.update({text: llm_service.format_transcript(text)}))
+        for text in texts
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.chat.completions.create.call_count == 2  # one batch plus one fallback
+    fallbacks = [text for text in texts if results[text] == f"Single: {text}"]
+    assert len(fallbacks) == 1
+    assert all(results[text] == text.capitalize() + "." for text in texts if text not in fallbacks)
+
+
+def test_batched_formatting_runs_on_the_model_items_are_cached_under(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "batch-key")
+    monkeypatch.setattr(settings, "llm_cache_enabled", True)
+    monkeypatch.setattr(settings, "llm_batching_enabled", True)
+    monkeypatch.setattr(settings, "llm_batch_window_ms", 200.0)
+    monkeypatch.setattr(settings, "llm_small_model", "small-model")
+    monkeypatch.setattr(settings, "llm_large_model", "large-model")
+    # Escalate format by length so the combined batch would route to the large model.
+    monkeypatch.setattr(settings, "llm_route_long_input_chars", 60)
+    monkeypatch.setitem(
+        model_router.TASK_POLICIES, "format", replace(model_router.TASK_POLICIES["format"], escalate_long_input=True)
+    )
+    monkeypatch.setattr(llm_service, "_format_batchers", {})
+    llm_cache.reset_llm_cache()
+
+    def create(**kwargs):
+        items = json.loads(kwargs["messages"][1]["content"])["items"]
+        reply = [{"id": item["id"], "result": item["text"].capitalize() + "."} for item in items]
+        completion = MagicMock()
+        completion.choices[0].message.content = json.dumps({"items": reply}, ensure_ascii=False)
+        return completion
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: client)
+
+    texts = [f"запись номер {index} {uuid4().hex[:8]}" for index in range(3)]
+    threads = [threading.Thread(target=llm_service.format_transcript, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    repeated = [llm_service.format_transcript(text) for text in texts]
+    llm_cache.reset_llm_cache()
+
+    assert client.chat.completions.create.call_count == 1
+    assert client.chat.completions.create.call_args.kwargs["model"] == "small-model"
+    assert repeated == [text.capitalize() + "." for text in texts]  # served from the per-item cache keys
+
+
+def test_analyze_many_falls_back_when_batch_reply_does_not_parse(monkeypatch):
+    analysis = {"title": "t", "mood_label": "calm", "tags": ["день"], "insights": ["ok"]}
+    replies = iter(["not json", json.dumps(analysis), json.dumps(analysis)])
+
+    def create(**kwargs):
+        completion = MagicMock()
+        completion.choices[0].message.content = next(replies)
+        return completion
+
+    provider = OpenAILLMProvider(api_key="batch-key", prompt="analyze", model="gpt-4o-mini")
+    provider.client = MagicMock()
+    provider.client.chat.completions.create.side_effect = create
+
+    assert provider.analyze_many(["первая", "вторая"]) == [analysis, analysis]
+    assert provider.client.chat.completions.create.call_count == 3
+
+
+@pytest.fixture
+def routed_models(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_small_model", "small-model")
+    monkeypatch.setattr(settings, "llm_large_model", "large-model")
+    monkeypatch.setattr(settings, "llm_route_long_input_chars", 1000)
+    monkeypatch.setattr(settings, "llm_route_overrides", {})
+    monkeypatch.setattr(model_router, "_latency_downgrades", Counter())
+    metrics.reset()
+    return settings
+
+
+def test_router_picks_model_by_task_and_input_length(routed_models):
+    short_format = route("format", 300)
+    long_format = route("format", 3000)
+    assert short_format.model == long_format.model == "small-model"
+    assert long_format.max_tokens > short_format.max_tokens
+
+    assert route("analyze", 300).model == "small-model"
+    long_analysis = route("analyze", 5000)
+    assert (long_analysis.model, long_analysis.reason) == ("large-model", "long_input")
+    assert route("period_insight", 300).model == "large-model"
+    assert metrics.counter("llm_route.analyze.large-model") == 1
+
+
+def test_router_avoids_slow_large_model_for_interactive_tasks(routed_models):
+    metrics.observe("llm_route.large-model.latency_seconds", 60.0)
+
+    decisions = [route("entry_insight", 5000) for _ in range(model_router.LATENCY_PROBE_EVERY)]
+
+    assert [decision.reason for decision in decisions].count("latency") == model_router.LATENCY_PROBE_EVERY - 1
+    assert decisions[-1].model == "large-model"  # periodic probe keeps the latency window fresh
+    assert route("period_insight", 300).model == "small-model"
+
+
+def test_router_overrides_are_per_task(routed_models):
+    routed_models.llm_route_overrides = {"format": RouteOverride(model="pinned-model", max_tokens=42)}
+
+    assert route("format", 3000) == ModelRoute(task="format", model="pinned-model", max_tokens=42, reason="override")
+    assert route("analyze", 300).model == "small-model"
+
+
+def test_split_text_cuts_between_sentences():
+    text = "Первое предложение. Второе предложение!  Третье?\nЧетвёртое без точки " + "слово " * 20
+
+    chunks = split_text(text, max_chars=40)
+
+    assert chunks[0] == "Первое предложение. Второе предложение!"
+    assert chunks[1].startswith("Третье?\nЧетвёртое без точки")  # chunks keep the original line breaks
+    assert all(len(chunk) <= 40 for chunk in chunks)  # the over-long sentence is cut between words
+    assert " ".join(chunks).split() == text.split()
+    assert text_tail("один два три четыре", 9) == "четыре"
+
+
+def test_long_transcripts_are_formatted_in_parallel_chunks(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "chunk-key")
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    monkeypatch.setattr(settings, "llm_batching_enabled", False)
+    monkeypatch.setattr(settings, "format_chunk_max_chars", 200)
+    monkeypatch.setattr(settings, "format_chunk_overlap_chars", 40)
+    lock, active, peak, requests = threading.Lock(), [0], [0], []
+
+    def create(**kwargs):
+        user_content = kwargs["messages"][1]["content"]
+        with lock:
+            requests.append(user_content)
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        part = user_content.split("<part>\n")[-1].removesuffix("\n</part>")
+        completion = MagicMock()
+        # The chunk holding sentence 5 comes back truncated and must keep its raw text.
+        completion.choices[0].message.content = "обрезано" if "предложение 5 " in part else f"<part>{part.upper()}</part>"
+        return completion
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: client)
+    raw = " ".join(f"это предложение {index} из длинной записи про день." for index in range(12))
+
+    formatted = llm_service.format_transcript(raw)
+
+    chunks = split_text(raw, max_chars=200)
+    assert len(requests) == len(chunks) > 2
+    assert peak[0] > 1
+    assert sum("<context>" in request for request in requests) == len(chunks) - 1
+    expected = [chunk if "предложение 5 " in chunk else chunk.upper() for chunk in chunks]
+    assert formatted == " ".join(expected)
+
+
+def test_chunked_formatting_keeps_paragraph_breaks_and_its_own_cache_key(monkeypatch):
+    settings = llm_service.get_settings()
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "chunk-key")
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    monkeypatch.setattr(settings, "llm_batching_enabled", False)
+    monkeypatch.setattr(settings, "format_chunk_max_chars", 200)
+
+    def create(**kwargs):
+        part = kwargs["messages"][1]["content"].split("<part>\n")[-1].removesuffix("\n</part>")
+        completion = MagicMock()
+        completion.choices[0].message.content = part.upper()
+        return completion
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    monkeypatch.setattr(llm_service, "get_openai_client", lambda api_key: client)
+    paragraph = " ".join(f"предложение {index} про прошедший день." for index in range(6))
+    raw = f"{paragraph}\n\n{paragraph}"
+
+    assert llm_service.format_transcript(raw) == f"{paragraph.upper()}\n\n{paragraph.upper()}"
+
+    single = llm_service._formatting_cache_key(raw, "gpt-4o-mini")
+    chunked = llm_service._formatting_cache_key(raw, "gpt-4o-mini", chunked=True)
+    monkeypatch.setattr(settings, "format_chunk_overlap_chars", 10)
+    assert len({single, chunked, llm_service._formatting_cache_key(raw, "gpt-4o-mini", chunked=True)}) == 3
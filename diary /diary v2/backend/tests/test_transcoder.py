@@ -0,0 +1,77 @@
+"""Tests for ffmpeg admission control."""
+
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.metrics import metrics
+from app.main import app
+from app.services import transcoder as transcoder_service
+from app.services.transcoder import Transcoder, TranscoderBusyError
+
+
+class FakeStream:
+    def __init__(self, started=None, release=None):
+        self.started = started
+        self.release = release
+
+    def run(self, **kwargs):
+        if self.started is not None:
+            self.started.set()
+            self.release.wait(5)
+        return b"pcm", b""
+
+
+@pytest.fixture
+def saturated_transcoder(monkeypatch):
+    """A single-slot transcoder with no wait queue whose slot is held by another request."""
+    transcoder = Transcoder("transcoder", max_concurrency=1, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(transcoder_service, "_transcoder", transcoder)
+    started, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=transcoder.run, args=(FakeStream(started, release),))
+    holder.start()
+    started.wait(5)
+    yield transcoder
+    release.set()
+    holder.join()
+
+
+def test_transcoder_rejects_when_wait_queue_is_full(saturated_transcoder):
+    metrics.reset()
+
+    with pytest.raises(TranscoderBusyError) as excinfo:
+        saturated_transcoder.run(FakeStream())
+
+    assert excinfo.value.retry_after >= 1
+    assert metrics.counter("transcoder.rejected") == 1
+    assert metrics.snapshot()["gauges"]["transcoder.active"] == 1
+
+
+def test_transcoder_queues_until_a_slot_frees():
+    transcoder = Transcoder("transcoder_test", max_concurrency=1, max_queue=1, queue_timeout=5)
+    started, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=transcoder.run, args=(FakeStream(started, release),))
+    holder.start()
+    started.wait(5)
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(transcoder.run(FakeStream())))
+    waiter.start()
+    while transcoder.queued == 0:
+        pass
+    release.set()
+    waiter.join(5)
+    holder.join(5)
+
+    assert results == [(b"pcm", b"")]
+    assert transcoder.queued == 0 and transcoder.active == 0
+
+
+def test_transcribe_returns_503_when_transcoder_is_saturated(saturated_transcoder):
+    client = TestClient(app)
+    # Unique bytes so the transcript cache cannot answer without converting.
+    response = client.post("/transcribe", files={"file": ("note.webm", b"busy-webm-bytes", "audio/webm")})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1